@@ -3,16 +3,18 @@ import os
 import asyncio
 import aiohttp
 import tarfile
-from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from fyers_apiv3 import fyersModel
 from datetime import datetime, timedelta
 import json
-import polars as pl
+from candles import candles_to_frame, ist_datetime
+from candle_store import TarCsvCandleStore
 import time
 from pathlib import Path
-import requests
 import pytz
+from symbol_master import SymbolMasterCache
+from history_client import HistoryClient
+from rate_limiter import RateLimiter
+from chunk_planner import plan_windows, fetch_windows, is_auth_error, AuthenticationError, TokenRefresher
 
 class AsyncHistoricalDataFetcher:
     def __init__(self, max_workers=5):
@@ -23,7 +25,23 @@ class AsyncHistoricalDataFetcher:
         self.access_token = self._load_access_token()
         self.max_workers = max_workers
         self.ist_tz = pytz.timezone('Asia/Kolkata')
+        self.symbol_cache = SymbolMasterCache()
+        self.store = TarCsvCandleStore(Path('historicalDataOptions'))
+        # One keep-alive connection pool and one request budget shared by every symbol and chunk
+        self.rate_limiter = RateLimiter(per_second=10, per_minute=200)
+        self.history_client = HistoryClient(
+            self.client_id,
+            self.access_token,
+            max_connections=max_workers,
+            rate_limiter=self.rate_limiter
+        )
+        # One re-login prompt for all symbols when the token expires mid-run
+        self.token_refresher = TokenRefresher(self._load_access_token, self._set_access_token)
         
+    def _set_access_token(self, access_token):
+        self.access_token = access_token
+        self.history_client.set_token(access_token)
+
     def _load_access_token(self):
         """Load access token from file"""
         try:
@@ -35,42 +53,17 @@ class AsyncHistoricalDataFetcher:
             raise Exception(f"Error reading access token: {str(e)}")
 
     def download_symbol_file(self):
-        """Download the symbol master file"""
-        url = "https://public.fyers.in/sym_details/NSE_FO_sym_master.json"
-        local_file = "NSE_FO_sym_master.json"
-        
+        """Return the symbol master file, downloading it only when it has changed"""
         try:
-            print("Downloading symbol master file...")
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            content = response.text
-            content = content.strip()
-            if content.endswith(','):
-                content = content[:-1]
-            
-            if not content.startswith('{'):
-                content = '{' + content
-            if not content.endswith('}'):
-                content = content + '}'
-            
-            with open(local_file, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            print("Symbol master file downloaded and cleaned successfully")
-            return local_file
-            
+            return self.symbol_cache.path('NSE_FO')
         except Exception as e:
             raise Exception(f"Error downloading symbol file: {str(e)}")
 
     def read_symbol_list(self):
         try:
-            local_file = self.download_symbol_file()
-            with open(local_file, 'r') as f:
-                data = json.load(f)
             option_symbols = [
-                symbol for symbol in data.keys() 
-                if (symbol.endswith('CE') or symbol.endswith('PE')) and symbol.startswith('NSE:')
+                symbol for symbol in self.symbol_cache.symbols('NSE_FO', ('CE', 'PE'))
+                if symbol.startswith('NSE:')
             ]
             option_symbols.sort()
             print(f"Found {len(option_symbols)} option symbols")
@@ -80,15 +73,8 @@ class AsyncHistoricalDataFetcher:
             return option_symbols
         except Exception as e:
             raise Exception(f"Error reading symbol list: {str(e)}")
-    def get_data_chunk(self, symbol, start_date, end_date):
-        """Fetch data for a specific date range with authentication error handling"""
-        fyers = fyersModel.FyersModel(
-            client_id=self.client_id,
-            is_async=False,
-            token=self.access_token,
-            log_path=""
-        )
-        
+    async def get_data_chunk(self, symbol, start_date, end_date):
+        """Fetch data for a specific date range through the shared history client"""
         end_date = end_date - timedelta(minutes=1)
         from_timestamp = int(start_date.timestamp())
         to_timestamp = int(end_date.timestamp())
@@ -103,34 +89,19 @@ class AsyncHistoricalDataFetcher:
         }
         
         try:
-            response = fyers.history(data=data)
+            response = await self.history_client.history(data)
             if isinstance(response, dict):
                 if response.get('s') == 'ok':
                     return response.get('candles', [])
-                elif response.get('code') == -16 or "authenticate" in str(response.get('message', '')).lower():
-                    print("\nAuthentication error detected!")
-                    print("Please login using the token generation script.")
-                    input("After logging in, press Enter to continue...")
-                    
-                    # Reload access token and retry
-                    self.access_token = self._load_access_token()
-                    fyers = fyersModel.FyersModel(
-                        client_id=self.client_id,
-                        is_async=False,
-                        token=self.access_token,
-                        log_path=""
-                    )
-                    response = fyers.history(data=data)
-                    
-                    if isinstance(response, dict) and response.get('s') == 'ok':
-                        return response.get('candles', [])
-                    else:
-                        raise Exception(f"API Error after reauth: {json.dumps(response, indent=2)}")
+                elif is_auth_error(response):
+                    raise AuthenticationError(f"{symbol}: {response.get('message', 'authentication failed')}")
                 else:
                     raise Exception(f"API Error: {json.dumps(response, indent=2)}")
             else:
                 raise Exception(f"Unexpected response format: {response}")
                 
+        except AuthenticationError:
+            raise
         except Exception as e:
             raise Exception(f"Error fetching data chunk: {str(e)}")
     async def process_symbol(self, symbol, years=1):  # Changed default to 1 year for options
@@ -154,97 +125,29 @@ class AsyncHistoricalDataFetcher:
         except Exception as e:
             print(f"Error parsing symbol {symbol}: {str(e)}")
         
-        all_data = []
-        chunk_size = timedelta(days=30)  # Smaller chunk size for options
-        current_start = start_date
-        
-        symbol_dir = Path('historicalDataOptions')
-        symbol_dir.mkdir(exist_ok=True)
-        
-        while current_start < end_date:
-            current_end = min(current_start + chunk_size, end_date)
-            print(f"{symbol}: Fetching data from {current_start} to {current_end}")
-            
-            try:
-                loop = asyncio.get_event_loop()
-                with ThreadPoolExecutor() as pool:
-                    chunk_data = await loop.run_in_executor(
-                        pool, 
-                        self.get_data_chunk, 
-                        symbol, 
-                        current_start, 
-                        current_end
-                    )
-                
-                if chunk_data:
-                    all_data.extend(chunk_data)
-                await asyncio.sleep(1)  # Rate limiting
-                
-            except Exception as e:
-                print(f"{symbol}: Error processing chunk {current_start} to {current_end}: {str(e)}")
-                if "authenticate" in str(e).lower():
-                    continue  # Retry the same chunk after reauth
-                
-            current_start = current_end
+        def to_frame(candles):
+            # Convert timestamp to an IST datetime truncated to the minute, vectorized in Polars
+            return candles_to_frame(candles).with_columns([
+                ist_datetime("timestamp")
+                .dt.truncate("1m")
+                .dt.cast_time_unit("us")
+                .alias("timestamp")  # Keep the original column name
+            ])
         
         try:
-            if all_data:
-                # Create Polars DataFrame with explicit orientation
-                df = pl.DataFrame(
-                    all_data,
-                    schema=[
-                        ("timestamp", pl.Int64),
-                        ("open", pl.Float64),
-                        ("high", pl.Float64),
-                        ("low", pl.Float64),
-                        ("close", pl.Float64),
-                        ("volume", pl.Float64)
-                    ],
-                    orient="row"
+            # Fetch all 30-day windows (smaller chunk size for options) concurrently and stream
+            # each into <symbol>.tar.gz, replacing the previous archive once all have arrived
+            windows = plan_windows(start_date, end_date, timedelta(days=30))
+            async with self.store.writer(symbol, replace=True) as writer:
+                rows = await fetch_windows(
+                    self.get_data_chunk, symbol, windows,
+                    on_chunk=lambda candles: writer.awrite(to_frame(candles)),
+                    refresher=self.token_refresher
                 )
-                
-                # Convert timestamp to datetime with proper timezone handling
-                df = df.with_columns([
-                    pl.col("timestamp")
-                    .map_elements(
-                        lambda x: datetime.fromtimestamp(x)
-                        .astimezone(pytz.timezone('Asia/Kolkata'))
-                        .strftime('%Y-%m-%d %H:%M'),
-                        return_dtype=pl.Utf8
-                    )
-                    .str.strptime(pl.Datetime, '%Y-%m-%d %H:%M')
-                    .alias("timestamp")  # Keep the original column name
-                ])
-
-                # Ensure timezone is set to IST
-                df = df.with_columns([
-                    pl.col("timestamp")
-                    .dt.replace_time_zone("Asia/Kolkata")
-                ])
-
-                # Sort by timestamp
-                df = df.sort("timestamp")
-                
-                # Drop original timestamp column
-                # df = df.drop("timestamp")
-                
-                # Create temporary CSV file
-                temp_csv = f"temp_{symbol.replace(':', '_')}.csv"
-                df.write_csv(temp_csv)
-                
-                # Create tar.gz file
+            
+            if rows:
                 start_str = start_date.strftime('%Y-%m-%d')
                 end_str = end_date.strftime('%Y-%m-%d')
-                # archive_name = f"{symbol.replace(':', '_')}_{start_str}_{end_str}.tar.gz"
-                archive_name = f"{symbol.replace(':', '_')}.tar.gz"
-                
-                # Compress CSV to tar.gz
-                with tarfile.open(symbol_dir / archive_name, 'w:gz') as tar:
-                    tar.add(temp_csv, arcname=f"{symbol.replace(':', '_')}.csv")
-                
-                # Remove temporary CSV file
-                os.remove(temp_csv)
-                
                 print(f"{symbol}: Saved complete {years}-year data from {start_str} to {end_str}")
         
         except Exception as e:
@@ -282,6 +185,11 @@ class AsyncHistoricalDataFetcher:
             
         except Exception as e:
             print(f"Error in main processing: {str(e)}")
+        finally:
+            print(f"History client: {self.history_client.format_stats()}")
+            print(f"Rate limiter: {self.rate_limiter.format_stats()}")
+            await self.history_client.close()
+            self.store.close()
 
 async def main():
     try:
@@ -3,21 +3,23 @@
 import os
 import asyncio
 import aiohttp
-import tarfile
 import configparser
 from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from fyers_apiv3 import fyersModel
 from datetime import datetime, timedelta
 import json
-import polars as pl
+from candles import candles_to_ist_frame
+from candle_store import TarCsvCandleStore, CsvCandleWriter
+from contextlib import nullcontext
 import time
 from pathlib import Path
-import requests
 import pytz
-import shutil
+from symbol_master import SymbolMasterCache
+from history_client import HistoryClient
+from rate_limiter import RateLimiter
+from chunk_planner import plan_windows, fetch_windows, is_auth_error, AuthenticationError, TokenRefresher
 import asyncpg
-import re
+from candle_db import copy_candles, candle_table_name, CandleSchemaCache
 
 class AsyncHistoricalDataFetcher:
     def __init__(self, max_workers=5, compress_data=True, use_database=True):
@@ -28,16 +30,28 @@ class AsyncHistoricalDataFetcher:
         self.access_token = self._load_access_token()
         self.max_workers = max_workers
         self.ist_tz = pytz.timezone('Asia/Kolkata')
+        self.symbol_cache = SymbolMasterCache()
         self.data_dir = Path('csv')
         self.data_dir.mkdir(exist_ok=True)
+        self.store = TarCsvCandleStore(self.data_dir)
         self.log_dir = Path('logs')
         self.log_dir.mkdir(exist_ok=True)
+        # One keep-alive connection pool and one request budget shared by every symbol and chunk
+        self.rate_limiter = RateLimiter(per_second=10, per_minute=200)
+        self.history_client = HistoryClient(
+            self.client_id,
+            self.access_token,
+            max_connections=max_workers,
+            rate_limiter=self.rate_limiter
+        )
+        # One re-login prompt for all symbols when the token expires mid-run
+        self.token_refresher = TokenRefresher(self._load_access_token, self._set_access_token)
         self.compress_data = compress_data
         self.use_database = use_database
         self.db_pool = None
         if self.use_database:
             self.db_config = self._load_db_config()
-        self.symbol_sanitization_cache = {}  # Cache for sanitized symbol names
+        self.schema_cache = CandleSchemaCache()  # Symbol tables known to exist
             
     def _load_db_config(self):
         """Load PostgreSQL configuration from ini file"""
@@ -57,24 +71,8 @@ class AsyncHistoricalDataFetcher:
             self.db_pool = await asyncpg.create_pool(**self.db_config)
 
     def sanitize_table_name(self, symbol):
-        """
-        Sanitize symbol name for use as a PostgreSQL table name.
-        Cache results to avoid repeated processing.
-        """
-        if symbol in self.symbol_sanitization_cache:
-            return self.symbol_sanitization_cache[symbol]
-            
-        # Replace invalid characters and ensure PostgreSQL naming rules
-        sanitized = re.sub(r'[^a-zA-Z0-9]', '_', symbol.upper())
-        # Ensure name starts with letter or underscore
-        if sanitized[0].isdigit():
-            sanitized = 'sym_' + sanitized
-        # Ensure name isn't too long for PostgreSQL
-        if len(sanitized) > 63:
-            sanitized = sanitized[:63]
-        
-        self.symbol_sanitization_cache[symbol] = sanitized
-        return sanitized
+        """Sanitize symbol name for use as a PostgreSQL table name (shared with the live bar writer)"""
+        return candle_table_name(symbol)
 
     async def create_symbol_table(self, symbol):
         """Create a table for the symbol if it doesn't exist"""
@@ -82,24 +80,22 @@ class AsyncHistoricalDataFetcher:
             return
             
         table_name = f"{self.sanitize_table_name(symbol)}"
+        # Tables found at startup or created since need no DDL
+        if table_name in self.schema_cache.tables:
+            return
         async with self.db_pool.acquire() as conn:
-            await conn.execute(f'''
-                CREATE TABLE IF NOT EXISTS "{table_name}" (
-                    id SERIAL PRIMARY KEY,
-                    timestamp TIMESTAMP WITH TIME ZONE,
-                    open DOUBLE PRECISION,
-                    high DOUBLE PRECISION,
-                    low DOUBLE PRECISION,
-                    close DOUBLE PRECISION,
-                    volume DOUBLE PRECISION,
-                    CONSTRAINT "{table_name}_timestamp_unique" UNIQUE (timestamp)
-                )
-            ''')
-            # Create index on timestamp for better query performance
-            await conn.execute(f'''
-                CREATE INDEX IF NOT EXISTS "idx_{table_name}_timestamp" 
-                ON "{table_name}"(timestamp)
-            ''')
+            await self.schema_cache.ensure(conn, [table_name])
+
+    async def prepare_symbol_tables(self, symbols):
+        """Read the existing tables once, drop redundant indexes and create all missing symbol tables"""
+        async with self.db_pool.acquire() as conn:
+            await self.schema_cache.load(conn)
+            dropped = await self.schema_cache.drop_redundant_indexes(conn)
+            if dropped:
+                print(f"Dropped {len(dropped)} redundant timestamp indexes")
+            table_names = {self.sanitize_table_name(symbol) for symbol in symbols}
+            created = await self.schema_cache.ensure(conn, table_names)
+            print(f"Found {len(table_names) - len(created)} existing symbol tables, created {len(created)}")
 
     async def get_last_db_timestamp(self, symbol):
         """Get the last timestamp from database for a symbol"""
@@ -132,27 +128,13 @@ class AsyncHistoricalDataFetcher:
             
         table_name = f"{self.sanitize_table_name(symbol)}"
         async with self.db_pool.acquire() as conn:
-            # Prepare data for insertion
-            values = [
-                (
-                    datetime.fromtimestamp(row[0]).astimezone(self.ist_tz),
-                    row[1], row[2], row[3], row[4], row[5]
-                )
-                for row in data
-            ]
-            
-            # Use efficient bulk insert with properly quoted table name
-            await conn.executemany(f'''
-                INSERT INTO "{table_name}" (timestamp, open, high, low, close, volume)
-                VALUES ($1, $2, $3, $4, $5, $6)
-                ON CONFLICT (timestamp) DO UPDATE
-                SET open = EXCLUDED.open,
-                    high = EXCLUDED.high,
-                    low = EXCLUDED.low,
-                    close = EXCLUDED.close,
-                    volume = EXCLUDED.volume
-            ''', values)
+            # Binary COPY into a staging table, then one INSERT ... SELECT ... ON CONFLICT
+            await copy_candles(conn, table_name, data)
         
+    def _set_access_token(self, access_token):
+        self.access_token = access_token
+        self.history_client.set_token(access_token)
+
     def _load_access_token(self):
         """Load access token from file"""
         try:
@@ -163,109 +145,21 @@ class AsyncHistoricalDataFetcher:
         except Exception as e:
             raise Exception(f"Error reading access token: {str(e)}")
 
-    def _clean_temp_dir(self, temp_dir):
-        """Safely clean up temporary directory"""
-        try:
-            if temp_dir.exists():
-                shutil.rmtree(temp_dir, ignore_errors=True)
-        except Exception as e:
-            print(f"Warning: Could not clean temporary directory: {str(e)}")
-
     def get_last_timestamp(self, symbol):
-        """Get the last timestamp from existing data for a symbol with robust error handling"""
-        temp_dir = Path('temp_extract')
-        archive_path = self.data_dir / f"{symbol.replace(':', '_')}.tar.gz"
-        
-        try:
-            # Clean up any existing temp directory first
-            self._clean_temp_dir(temp_dir)
-            
-            if not archive_path.exists():
-                return None
-
-            # Create a fresh temporary directory
-            temp_dir.mkdir(exist_ok=True)
-            
-            try:
-                # Try to read and validate the archive
-                with tarfile.open(archive_path, 'r:gz') as tar:
-                    csv_name = f"{symbol.replace(':', '_')}.csv"
-                    try:
-                        tar.extract(csv_name, temp_dir, filter='data')
-                    except (tarfile.TarError, OSError) as e:
-                        print(f"Warning: Corrupted archive detected for {symbol}, removing and starting fresh")
-                        archive_path.unlink()  # Remove corrupted file
-                        return None
-                    
-                    try:
-                        # Read the last row of the CSV using Polars
-                        df = pl.read_csv(temp_dir / csv_name)
-                        if len(df) > 0:
-                            last_timestamp = df['timestamp'].max()
-                            return datetime.strptime(str(last_timestamp)[:10], '%Y-%m-%d')
-                    except pl.exceptions.ComputeError as e:
-                        print(f"Warning: Data format error in CSV for {symbol}, removing and starting fresh")
-                        archive_path.unlink()
-                        return None
-                    
-            except tarfile.ReadError as e:
-                print(f"Warning: Invalid tar.gz file for {symbol}, removing and starting fresh")
-                archive_path.unlink()
-                return None
-                
-            return None
-            
-        except Exception as e:
-            print(f"Error reading last timestamp for {symbol}: {str(e)}")
-            # In case of unexpected errors, we'll also remove the potentially corrupted file
-            try:
-                archive_path.unlink()
-            except:
-                pass
-            return None
-            
-        finally:
-            # Always clean up the temporary directory
-            self._clean_temp_dir(temp_dir)
+        """Get the last timestamp from existing archived data for a symbol"""
+        return self.store.last_timestamp(symbol)
 
     def download_symbol_file(self):
-        """Download the symbol master file"""
-        url = "https://public.fyers.in/sym_details/NSE_CM_sym_master.json"
-        local_file = "NSE_CM_sym_master.json"
-        
+        """Return the symbol master file, downloading it only when it has changed"""
         try:
-            print("Downloading symbol master file...")
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            content = response.text
-            content = content.strip()
-            if content.endswith(','):
-                content = content[:-1]
-            
-            if not content.startswith('{'):
-                content = '{' + content
-            if not content.endswith('}'):
-                content = content + '}'
-            
-            with open(local_file, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            print("Symbol master file downloaded and cleaned successfully")
-            return local_file
-            
+            return self.symbol_cache.path('NSE_CM')
         except Exception as e:
             raise Exception(f"Error downloading symbol file: {str(e)}")
 
     def read_symbol_list(self):
-        """Read and parse the local symbol master file"""
+        """Read the equity symbols from the cached symbol master snapshot"""
         try:
-            local_file = self.download_symbol_file()
-            
-            with open(local_file, 'r') as f:
-                data = json.load(f)
-            
-            equity_symbols = [symbol for symbol in data.keys() if symbol.endswith('-EQ')]
+            equity_symbols = self.symbol_cache.symbols('NSE_CM', '-EQ')
             
             print(f"Found {len(equity_symbols)} equity symbols")
             if equity_symbols:
@@ -277,14 +171,7 @@ class AsyncHistoricalDataFetcher:
             raise Exception(f"Error reading symbol list: {str(e)}")
 
     async def get_data_chunk(self, symbol, start_date, end_date):
-        """Fetch data for a specific date range with proper async handling"""
-        fyers = fyersModel.FyersModel(
-            client_id=self.client_id,
-            is_async=True,  # Keep async=True
-            token=self.access_token,
-            log_path=str(self.log_dir)
-        )
-        
+        """Fetch data for a specific date range through the shared history client"""
         end_date = end_date - timedelta(minutes=1)
         from_timestamp = int(start_date.timestamp())
         to_timestamp = int(end_date.timestamp())
@@ -299,41 +186,25 @@ class AsyncHistoricalDataFetcher:
         }
         
         try:
-            # Properly await the async call
-            response = await fyers.history(data=data)
+            response = await self.history_client.history(data)
             if isinstance(response, dict):
                 if response.get('s') == 'ok':
                     return response.get('candles', [])
-                elif response.get('code') == -16 or "authenticate" in str(response.get('message', '')).lower():
-                    print(f"\n{symbol}: Authentication error detected!")
-                    print("Please login using the token generation script.")
-                    input("After logging in, press Enter to continue...")
-                    
-                    self.access_token = self._load_access_token()
-                    fyers = fyersModel.FyersModel(
-                        client_id=self.client_id,
-                        is_async=True,
-                        token=self.access_token,
-                        log_path=str(self.log_dir)
-                    )
-                    response = await fyers.history(data=data)
-                    
-                    if isinstance(response, dict) and response.get('s') == 'ok':
-                        return response.get('candles', [])
-                    else:
-                        raise Exception(f"API Error after reauth: {json.dumps(response, indent=2)}")
+                elif is_auth_error(response):
+                    raise AuthenticationError(f"{symbol}: {response.get('message', 'authentication failed')}")
                 else:
                     raise Exception(f"API Error: {json.dumps(response, indent=2)}")
             else:
                 raise Exception(f"Unexpected response format: {response}")
                 
+        except AuthenticationError:
+            raise
         except Exception as e:
             raise Exception(f"Error fetching data chunk: {str(e)}")
 
     async def process_symbol(self, symbol, years=3):
         """Process a single symbol with async data fetching"""
         print(f"Starting processing for {symbol}")
-        temp_dir = Path('temp_extract')
         
         try:
             if self.use_database:
@@ -354,103 +225,35 @@ class AsyncHistoricalDataFetcher:
                 print(f"{symbol}: No existing data found, fetching {years} years of historical data")
                 start_date = end_date - timedelta(days=years * 365)
             
-            all_data = []
-            chunk_size = timedelta(days=100)
-            current_start = start_date
-            
-            while current_start < end_date:
-                current_end = min(current_start + chunk_size, end_date)
-                print(f"{symbol}: Fetching data from {current_start} to {current_end}")
-                
-                try:
-                    chunk_data = await self.get_data_chunk(symbol, current_start, current_end)
-                    
-                    if chunk_data:
-                        all_data.extend(chunk_data)
-                        if self.use_database:
-                            await self.store_data_in_db(symbol, chunk_data)
-                    await asyncio.sleep(1)  # Rate limiting
-                    
-                except Exception as e:
-                    print(f"{symbol}: Error processing chunk {current_start} to {current_end}: {str(e)}")
-                    if "authenticate" in str(e).lower():
-                        continue
-                    
-                current_start = current_end
-            
-            if all_data and self.compress_data:
-                # Only process CSV/tar.gz if compression is enabled
-                self._clean_temp_dir(temp_dir)
-                temp_dir.mkdir(exist_ok=True)
-                
-                # Create new DataFrame
-                new_df = pl.DataFrame(
-                    all_data,
-                    schema=[
-                        ("timestamp", pl.Int64),
-                        ("open", pl.Float64),
-                        ("high", pl.Float64),
-                        ("low", pl.Float64),
-                        ("close", pl.Float64),
-                        ("volume", pl.Float64)
-                    ],
-                    orient="row"
+            async def fetch_and_store(symbol, chunk_start, chunk_end):
+                chunk_data = await self.get_data_chunk(symbol, chunk_start, chunk_end)
+                if chunk_data and self.use_database:
+                    await self.store_data_in_db(symbol, chunk_data)
+                return chunk_data
+            
+            if self.compress_data:
+                writer = self.store.writer(symbol)
+            elif not self.use_database:
+                # If neither compression nor database is enabled, save as plain CSV
+                writer = CsvCandleWriter(self.data_dir / f"{symbol.replace(':', '_')}.csv")
+            else:
+                writer = None
+            
+            # Fetch all 100-day windows concurrently, writing each to the file sink as it arrives
+            windows = plan_windows(start_date, end_date, timedelta(days=100))
+            async with writer or nullcontext():
+                rows = await fetch_windows(
+                    fetch_and_store, symbol, windows,
+                    on_chunk=(lambda candles: writer.awrite(candles_to_ist_frame(candles))) if writer else None,
+                    refresher=self.token_refresher
                 )
-                
-                # Convert Unix timestamp to datetime string with timezone
-                new_df = new_df.with_columns([
-                    pl.col("timestamp")
-                    .map_elements(
-                        lambda x: datetime.fromtimestamp(x)
-                        .astimezone(pytz.timezone('Asia/Kolkata'))
-                        .strftime('%Y-%m-%dT%H:%M:%S.000000+0530'),
-                        return_dtype=pl.Utf8
-                    )
-                    .alias("timestamp")
-                ])
-
-                # Sort by timestamp
-                new_df = new_df.sort("timestamp")
-                
-                # If we have existing data and compression is enabled, merge it
-                if last_timestamp and self.compress_data:
-                    archive_path = self.data_dir / f"{symbol.replace(':', '_')}.tar.gz"
-                    
-                    if archive_path.exists():
-                        with tarfile.open(archive_path, 'r:gz') as tar:
-                            csv_name = f"{symbol.replace(':', '_')}.csv"
-                            tar.extract(csv_name, temp_dir, filter='data')
-                            
-                            existing_df = pl.read_csv(
-                                temp_dir / csv_name,
-                                try_parse_dates=False
-                            )
-                            
-                            combined_df = pl.concat([existing_df, new_df])
-                            combined_df = combined_df.unique(subset=["timestamp"])
-                            combined_df = combined_df.sort("timestamp")
-                            new_df = combined_df
-                
-                if self.compress_data:
-                    # Only create compressed files if compression is enabled
-                    temp_csv = temp_dir / f"temp_{symbol.replace(':', '_')}.csv"
-                    new_df.write_csv(temp_csv)
-                    
-                    archive_name = f"{symbol.replace(':', '_')}.tar.gz"
-                    with tarfile.open(self.data_dir / archive_name, 'w:gz') as tar:
-                        tar.add(temp_csv, arcname=f"{symbol.replace(':', '_')}.csv")
-                    
-                    print(f"{symbol}: Data successfully {'updated' if last_timestamp else 'saved'} (compressed)")
-                elif not self.use_database:
-                    # If neither compression nor database is enabled, save as plain CSV
-                    csv_name = f"{symbol.replace(':', '_')}.csv"
-                    new_df.write_csv(self.data_dir / csv_name)
-                    print(f"{symbol}: Data successfully {'updated' if last_timestamp else 'saved'} (uncompressed)")
+            
+            if rows and writer is not None:
+                print(f"{symbol}: Data successfully {'updated' if last_timestamp else 'saved'} "
+                      f"({'compressed' if self.compress_data else 'uncompressed'})")
                 
         except Exception as e:
             print(f"{symbol}: Error processing symbol: {str(e)}")
-        finally:
-            self._clean_temp_dir(temp_dir)
         
         return symbol
     
@@ -463,6 +266,9 @@ class AsyncHistoricalDataFetcher:
             symbols = self.read_symbol_list()
             print(f"Processing {len(symbols)} equity symbols")
             
+            if self.use_database:
+                await self.prepare_symbol_tables(symbols)
+            
             # Separate symbols into two groups: those without data and those with data
             symbols_without_data = []
             symbols_with_data = []
@@ -500,6 +306,10 @@ class AsyncHistoricalDataFetcher:
         except Exception as e:
             print(f"Error in main processing: {str(e)}")
         finally:
+            print(f"History client: {self.history_client.format_stats()}")
+            print(f"Rate limiter: {self.rate_limiter.format_stats()}")
+            await self.history_client.close()
+            self.store.close()
             if self.use_database and self.db_pool:
                 await self.db_pool.close()
 
@@ -0,0 +1,215 @@
+import asyncio
+import configparser
+import logging
+import threading
+import time
+from collections import deque
+
+import asyncpg
+
+from candle_db import CandleSchemaCache, candle_table_name, copy_candles
+
+# Bar lengths in seconds
+BAR_RESOLUTIONS = (1, 60, 300)
+
+# Live bars get tables of their own: the history backfill resumes from MAX(timestamp) of the
+# symbol's minute table, so live rows there would hide every gap before capture started
+_TABLE_SUFFIX = {1: '_LIVE_1S', 60: '_LIVE_1M', 300: '_LIVE_5M'}
+
+
+def bar_table_name(symbol, resolution):
+    """Candle table for symbol's bars of resolution seconds"""
+    suffix = _TABLE_SUFFIX.get(resolution, f'_LIVE_{resolution}S')
+    return candle_table_name(symbol)[:63 - len(suffix)] + suffix
+
+
+def candle_db_config(ini_path='api/ini/aws_stocks.ini'):
+    """Connection settings of the candle database, as aws_historical_db reads them"""
+    config = configparser.ConfigParser()
+    config.read(ini_path)
+    return {
+        'host': config.get('postgresql', 'host'),
+        'port': config.getint('postgresql', 'port'),
+        'user': config.get('postgresql', 'user'),
+        'password': config.get('postgresql', 'password'),
+        'database': config.get('postgresql', 'database')
+    }
+
+
+class BarBuilder:
+    """
+    Build OHLCV bars per symbol from live SymbolUpdates.
+
+    update() does a constant amount of work per tick: for each
+    resolution it buckets exch_feed_time, extends the open bar with ltp
+    and adds the growth of vol_traded_today since the symbol's previous
+    tick as volume. A tick in a later bucket closes the open bar; bars of
+    symbols that stop ticking are closed by close_due(). Closed bars are
+    queued in `closed` as (symbol, resolution, [epoch, open, high, low,
+    close, volume]), the row shape history() returns.
+
+    The first bar of each symbol and resolution is dropped, since it
+    started before the first tick was seen and would overwrite a complete
+    bar on upsert. Ticks for a bucket that has already been closed only
+    add their volume to the open bar.
+    """
+
+    def __init__(self, resolutions=BAR_RESOLUTIONS, grace=2.0):
+        self.resolutions = tuple(resolutions)
+        self.grace = grace
+        self.closed = deque()
+        self.emitted = 0
+        self.partial_dropped = 0
+
+        self._bars = {}  # (symbol, resolution) -> [start, open, high, low, close, volume]
+        self._last_start = {}  # (symbol, resolution) -> start of the last closed bar
+        self._volume = {}
+        self._lock = threading.Lock()
+
+    def update(self, message):
+        price = message.get('ltp')
+        timestamp = message.get('exch_feed_time') or message.get('last_traded_time')
+        symbol = message.get('symbol')
+        if price is None or timestamp is None or symbol is None:
+            return
+
+        traded = 0
+        volume = message.get('vol_traded_today')
+        if volume is not None:
+            previous = self._volume.get(symbol)
+            self._volume[symbol] = volume
+            # Volume restarts from zero on a new trading day
+            if previous is not None and volume > previous:
+                traded = volume - previous
+
+        with self._lock:
+            for resolution in self.resolutions:
+                key = (symbol, resolution)
+                start = timestamp - timestamp % resolution
+                bar = self._bars.get(key)
+                if bar is not None and start == bar[0]:
+                    if price > bar[2]:
+                        bar[2] = price
+                    if price < bar[3]:
+                        bar[3] = price
+                    bar[4] = price
+                    bar[5] += traded
+                elif bar is not None and start < bar[0]:
+                    bar[5] += traded
+                elif bar is None and start <= self._last_start.get(key, -1):
+                    continue
+                else:
+                    if bar is not None:
+                        self._close(key, bar)
+                    self._bars[key] = [start, price, price, price, price, traded]
+
+    def close_due(self, now=None):
+        """Close bars whose period ended more than grace seconds before now"""
+        now = time.time() if now is None else now
+        with self._lock:
+            due = [key for key, bar in self._bars.items() if bar[0] + key[1] + self.grace <= now]
+            for key in due:
+                self._close(key, self._bars.pop(key))
+        return len(due)
+
+    def close_all(self, now=None):
+        """
+        Close the bars whose period has ended by now and drop the rest, e.g.
+        at shutdown; returns how many were closed. A bar still open has
+        not seen all its ticks, so it is counted in partial_dropped instead.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            bars, self._bars = self._bars, {}
+            closed = 0
+            for key, bar in bars.items():
+                if bar[0] + key[1] <= now:
+                    self._close(key, bar)
+                    closed += 1
+                else:
+                    self.partial_dropped += 1
+        return closed
+
+    def _close(self, key, bar):
+        first = key not in self._last_start
+        self._last_start[key] = bar[0]
+        if first:
+            self.partial_dropped += 1
+            return
+        self.closed.append((key[0], key[1], bar))
+        self.emitted += 1
+
+
+class BarWriter:
+    """
+    Upsert closed bars into the candle tables every flush_interval seconds.
+
+    Runs its own event loop thread with one asyncpg connection. Each
+    flush closes due bars, creates missing tables through a
+    CandleSchemaCache and loads each table's bars with copy_candles()
+    into the symbol's live tables (see bar_table_name()), apart from the
+    ones the history backfill keeps. close() also writes the bars whose
+    period has ended; bars still open are dropped rather than stored
+    incomplete.
+    """
+
+    def __init__(self, builder, connect_kwargs, flush_interval=1.0, logger=None):
+        self.builder = builder
+        self.connect_kwargs = dict(connect_kwargs)
+        self.flush_interval = flush_interval
+        self.logger = logger or logging.getLogger(__name__)
+        self.schema_cache = CandleSchemaCache()
+        self.written = 0
+        self.errors = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._run()), name='bar-writer', daemon=True)
+        self._thread.start()
+
+    async def _run(self):
+        try:
+            conn = await asyncpg.connect(**self.connect_kwargs)
+        except Exception as e:
+            self.logger.error(f"Bar writer could not connect: {str(e)}")
+            return
+        try:
+            while not self._stopped.is_set():
+                await asyncio.sleep(self.flush_interval)
+                await self._flush(conn)
+            self.builder.close_all()
+            await self._flush(conn)
+        finally:
+            await conn.close()
+
+    async def _flush(self, conn):
+        self.builder.close_due()
+        groups = {}
+        closed = self.builder.closed
+        while closed:
+            symbol, resolution, bar = closed.popleft()
+            groups.setdefault(bar_table_name(symbol, resolution), []).append(bar)
+        if not groups:
+            return
+
+        try:
+            await self.schema_cache.ensure(conn, groups)
+        except Exception as e:
+            self.errors += 1
+            self.logger.error(f"Creating bar tables failed: {str(e)}")
+            return
+        for table_name, bars in groups.items():
+            try:
+                self.written += await copy_candles(conn, table_name, bars)
+            except Exception as e:
+                self.errors += 1
+                self.logger.error(f"Writing {len(bars)} bars to {table_name} failed: {str(e)}")
+
+    def close(self):
+        """Write the bars whose period has ended and stop"""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(self.flush_interval + 10)
+        self.logger.info(f"Bars written: {self.written}, errors: {self.errors}, "
+                          f"partial bars dropped: {self.builder.partial_dropped}")
@@ -0,0 +1,108 @@
+# Compare the old executemany upsert in aws_historical_db.store_data_in_db with the
+# binary COPY + staging table loader against a local Postgres
+#
+#   python benchmarks/bench_candle_copy.py [--dsn postgresql://postgres@localhost/postgres] [--rows 200000]
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime
+
+import asyncpg
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from candle_db import copy_candles
+
+# Same schema create_symbol_table() uses
+TABLE_DDL = '''
+    CREATE TABLE "{table}" (
+        id SERIAL PRIMARY KEY,
+        timestamp TIMESTAMP WITH TIME ZONE,
+        open DOUBLE PRECISION,
+        high DOUBLE PRECISION,
+        low DOUBLE PRECISION,
+        close DOUBLE PRECISION,
+        volume DOUBLE PRECISION,
+        CONSTRAINT "{table}_timestamp_unique" UNIQUE (timestamp)
+    )
+'''
+
+
+async def executemany_path(conn, table_name, data):
+    """Upsert previously used by aws_historical_db.store_data_in_db"""
+    ist_tz = pytz.timezone('Asia/Kolkata')
+    values = [
+        (
+            datetime.fromtimestamp(row[0]).astimezone(ist_tz),
+            row[1], row[2], row[3], row[4], row[5]
+        )
+        for row in data
+    ]
+    await conn.executemany(f'''
+        INSERT INTO "{table_name}" (timestamp, open, high, low, close, volume)
+        VALUES ($1, $2, $3, $4, $5, $6)
+        ON CONFLICT (timestamp) DO UPDATE
+        SET open = EXCLUDED.open,
+            high = EXCLUDED.high,
+            low = EXCLUDED.low,
+            close = EXCLUDED.close,
+            volume = EXCLUDED.volume
+    ''', values)
+
+
+def synthetic_candles(rows):
+    """One-minute candles shaped like the history() response"""
+    start = 1_700_000_000 - rows * 60
+    return [
+        [start + i * 60, 100.0 + i % 50, 101.0 + i % 50, 99.0 + i % 50, 100.5 + i % 50, 1000 + i % 997]
+        for i in range(rows)
+    ]
+
+
+async def timed(func, conn, table_name, batches):
+    start = time.perf_counter()
+    for batch in batches:
+        await func(conn, table_name, batch)
+    return time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dsn', default='postgresql://postgres@localhost/postgres')
+    parser.add_argument('--rows', type=int, default=200_000)
+    # Roughly one 100-day chunk of minute bars
+    parser.add_argument('--batch', type=int, default=37_500)
+    args = parser.parse_args()
+
+    candles = synthetic_candles(args.rows)
+    batches = [candles[i:i + args.batch] for i in range(0, len(candles), args.batch)]
+    conn = await asyncpg.connect(args.dsn)
+    try:
+        print(f"Loading {args.rows} candles in batches of {args.batch}")
+        results = {}
+        for label, func in [("executemany", executemany_path), ("binary COPY", copy_candles)]:
+            table_name = f"BENCH_{label.split()[-1].upper()}"
+            await conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+            await conn.execute(TABLE_DDL.format(table=table_name))
+
+            insert_seconds = await timed(func, conn, table_name, batches)
+            # Second pass hits ON CONFLICT for every row
+            upsert_seconds = await timed(func, conn, table_name, batches)
+            results[label] = await conn.fetch(
+                f'SELECT timestamp, open, high, low, close, volume FROM "{table_name}" ORDER BY timestamp'
+            )
+            print(f"{label:<12} insert {args.rows / insert_seconds:10,.0f} rows/s   "
+                  f"upsert {args.rows / upsert_seconds:10,.0f} rows/s")
+            await conn.execute(f'DROP TABLE "{table_name}"')
+
+        assert results["executemany"] == results["binary COPY"], "Loaders stored different rows"
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
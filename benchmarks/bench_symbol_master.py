@@ -0,0 +1,112 @@
+# Compare json.load against the streaming scanner on a synthetic symbol master
+#
+#   python benchmarks/bench_symbol_master.py [--symbols 100000]
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from symbol_master import iter_symbol_master
+
+SUFFIXES = ('-EQ', '-INDEX', 'FUT', 'CE', 'PE')
+
+
+def write_synthetic_master(path, count):
+    """Write a master file shaped like the Fyers NSE_FO/NSE_CM JSON"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{')
+        for i in range(count):
+            suffix = SUFFIXES[i % len(SUFFIXES)]
+            symbol = f"NSE:SYM{i:06d}{suffix}"
+            entry = {
+                "fyToken": str(101000000000 + i),
+                "isin": f"INE{i:09d}",
+                "symTicker": symbol,
+                "exSymbol": f"SYM{i:06d}",
+                "exSymName": f"Synthetic instrument {i}",
+                "symDetails": f"SYM{i:06d} {suffix.strip('-')}",
+                "exchange": 10,
+                "segment": 11 if suffix in ('FUT', 'CE', 'PE') else 10,
+                "exInstType": i % 20,
+                "minLotSize": 50,
+                "tickSize": 0.05,
+                "strikePrice": float(i % 400) * 50 if suffix in ('CE', 'PE') else -1.0,
+                "optType": suffix if suffix in ('CE', 'PE') else "XX",
+                "expiryDate": "1767225600" if suffix in ('FUT', 'CE', 'PE') else "",
+                "tradeStatus": 1,
+                "currencyCode": "INR",
+                "upperPrice": 0.0,
+                "lowerPrice": 0.0,
+                "faceValue": 1.0,
+                "qtyMultiplier": 1.0,
+                "previousClose": 100.0 + i % 1000,
+                "previousOi": 0.0,
+                "lastUpdate": "2025-01-01",
+                "exToken": i,
+                "underSym": f"SYM{i:06d}",
+                "underFyTok": str(101000000000 + i),
+                "is_mtf_tradable": 0,
+                "mtf_margin": 0.0
+            }
+            if i:
+                f.write(',')
+            f.write(json.dumps(symbol))
+            f.write(':')
+            f.write(json.dumps(entry))
+        f.write('}')
+
+
+def current_path(path, suffixes):
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return [symbol for symbol in data.keys() if symbol.endswith(suffixes)]
+
+
+def streaming_path(path, suffixes):
+    return list(iter_symbol_master(path, suffixes))
+
+
+def measure(label, func, path, suffixes, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(path, suffixes)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(path, suffixes)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{label:<12} best {min(timings) * 1000:8.1f} ms   "
+          f"peak traced memory {peak / 1024 / 1024:8.1f} MiB   "
+          f"{len(result)} symbols")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbols', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'NSE_FO_sym_master.json')
+        write_synthetic_master(path, args.symbols)
+        print(f"Synthetic master: {args.symbols} symbols, {os.path.getsize(path) / 1024 / 1024:.1f} MiB")
+
+        for suffixes in [('-EQ',), ('FUT',), ('CE', 'PE')]:
+            print(f"\nFilter {suffixes}:")
+            expected = measure('json.load', current_path, path, suffixes, args.repeat)
+            streamed = measure('streaming', streaming_path, path, suffixes, args.repeat)
+            assert streamed == expected, "Streaming scanner returned different symbols"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Compare the old map_elements epoch conversion with the vectorized Polars expression
+#
+#   python benchmarks/bench_timestamp_conversion.py [--rows 1000000]
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+import polars as pl
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from candles import ist_datetime, CSV_TIMESTAMP_FORMAT
+
+
+def map_elements_csv(df):
+    """Conversion previously used by historical.py and aws_historical_db.py"""
+    return df.with_columns([
+        pl.col("timestamp")
+        .map_elements(
+            lambda x: datetime.fromtimestamp(x)
+            .astimezone(pytz.timezone('Asia/Kolkata'))
+            .strftime('%Y-%m-%dT%H:%M:%S.000000+0530'),
+            return_dtype=pl.Utf8
+        )
+        .alias("timestamp")
+    ])
+
+
+def vectorized_csv(df):
+    return df.with_columns([
+        ist_datetime("timestamp")
+        .dt.strftime(CSV_TIMESTAMP_FORMAT)
+        .alias("timestamp")
+    ])
+
+
+def map_elements_minute(df):
+    """Conversion previously used by FNO_HISTORICAL_DATA.py"""
+    df = df.with_columns([
+        pl.col("timestamp")
+        .map_elements(
+            lambda x: datetime.fromtimestamp(x)
+            .astimezone(pytz.timezone('Asia/Kolkata'))
+            .strftime('%Y-%m-%d %H:%M'),
+            return_dtype=pl.Utf8
+        )
+        .str.strptime(pl.Datetime, '%Y-%m-%d %H:%M')
+        .alias("timestamp")
+    ])
+    return df.with_columns([
+        pl.col("timestamp")
+        .dt.replace_time_zone("Asia/Kolkata")
+    ])
+
+
+def vectorized_minute(df):
+    return df.with_columns([
+        ist_datetime("timestamp")
+        .dt.truncate("1m")
+        .dt.cast_time_unit("us")
+        .alias("timestamp")
+    ])
+
+
+def timed(func, df):
+    start = time.perf_counter()
+    result = func(df)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    # One-minute bars going back from a fixed point in time
+    start_epoch = 1_700_000_000 - args.rows * 60
+    df = pl.DataFrame({
+        "timestamp": pl.int_range(0, args.rows, eager=True).cast(pl.Int64) * 60 + start_epoch
+    })
+    print(f"Converting {args.rows} epoch timestamps")
+
+    for label, old, new in [
+        ("CSV string (historical.py)", map_elements_csv, vectorized_csv),
+        ("Minute datetime (FNO)", map_elements_minute, vectorized_minute)
+    ]:
+        old_result, old_seconds = timed(old, df)
+        new_result, new_seconds = timed(new, df)
+        assert old_result.equals(new_result), f"{label}: results differ"
+        print(f"{label:<28} map_elements {old_seconds:8.3f} s   "
+              f"vectorized {new_seconds:8.3f} s   speedup {old_seconds / new_seconds:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
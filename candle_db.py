@@ -0,0 +1,158 @@
+import re
+from functools import lru_cache
+
+STAGING_TABLE = "candle_staging"
+
+# Per-symbol candle table. The UNIQUE constraint's index also serves
+# timestamp range queries, so no separate timestamp index is created.
+CANDLE_TABLE_DDL = '''
+    CREATE TABLE IF NOT EXISTS "{table}" (
+        id SERIAL PRIMARY KEY,
+        timestamp TIMESTAMP WITH TIME ZONE,
+        open DOUBLE PRECISION,
+        high DOUBLE PRECISION,
+        low DOUBLE PRECISION,
+        close DOUBLE PRECISION,
+        volume DOUBLE PRECISION,
+        CONSTRAINT "{table}_timestamp_unique" UNIQUE (timestamp)
+    )
+'''
+
+# Non-unique single-column timestamp indexes that duplicate a UNIQUE (timestamp) index on the same table
+_REDUNDANT_INDEX_QUERY = '''
+    SELECT c.relname AS table_name, i.relname AS index_name
+    FROM pg_index x
+    JOIN pg_class c ON c.oid = x.indrelid
+    JOIN pg_class i ON i.oid = x.indexrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum = x.indkey[0]
+    WHERE n.nspname = current_schema()
+      AND NOT x.indisunique
+      AND x.indnatts = 1
+      AND a.attname = 'timestamp'
+      AND EXISTS (
+          SELECT 1 FROM pg_index u
+          WHERE u.indrelid = x.indrelid
+            AND u.indisunique
+            AND u.indnatts = 1
+            AND u.indkey[0] = x.indkey[0]
+      )
+'''
+
+# Candle columns after the timestamp, in history() row order
+PRICE_COLUMNS = ("open", "high", "low", "close", "volume")
+
+
+@lru_cache(maxsize=8192)
+def candle_table_name(symbol):
+    """Per-symbol candle table name: NSE:SBIN-EQ -> NSE_SBIN_EQ, at most 63 characters"""
+    sanitized = re.sub(r'[^a-zA-Z0-9]', '_', symbol.upper())
+    # Ensure name starts with letter or underscore
+    if sanitized[0].isdigit():
+        sanitized = 'sym_' + sanitized
+    return sanitized[:63]
+
+
+async def ensure_staging_table(conn):
+    """
+    Create this connection's staging table if it does not exist yet.
+
+    It is a temporary table, so it is private to the session (concurrent
+    pool connections never see each other's rows) and, like an UNLOGGED
+    table, is not written to the WAL. ON COMMIT DELETE ROWS empties it at
+    the end of every load transaction.
+    """
+    await conn.execute(f'''
+        CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (
+            epoch BIGINT,
+            open DOUBLE PRECISION,
+            high DOUBLE PRECISION,
+            low DOUBLE PRECISION,
+            close DOUBLE PRECISION,
+            volume DOUBLE PRECISION
+        ) ON COMMIT DELETE ROWS
+    ''')
+
+
+async def copy_candles(conn, table_name, candles):
+    """
+    Upsert [epoch, open, high, low, close, volume] rows into table_name.
+
+    The rows go to the staging table unchanged with a binary COPY
+    (copy_records_to_table) and are merged with one INSERT ... SELECT ...
+    ON CONFLICT (timestamp) DO UPDATE, so epochs are converted to
+    timestamptz by to_timestamp() inside Postgres instead of one datetime
+    per row in Python. Duplicate epochs within a batch keep their last
+    row. Returns the number of rows staged.
+    """
+    if not candles:
+        return 0
+
+    await ensure_staging_table(conn)
+    columns = ", ".join(PRICE_COLUMNS)
+    updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in PRICE_COLUMNS)
+    async with conn.transaction():
+        await conn.copy_records_to_table(
+            STAGING_TABLE,
+            records=candles,
+            columns=("epoch",) + PRICE_COLUMNS
+        )
+        await conn.execute(f'''
+            INSERT INTO "{table_name}" (timestamp, {columns})
+            SELECT DISTINCT ON (epoch) to_timestamp(epoch), {columns}
+            FROM {STAGING_TABLE}
+            ORDER BY epoch, ctid DESC
+            ON CONFLICT (timestamp) DO UPDATE
+            SET {updates}
+        ''')
+    return len(candles)
+
+
+class CandleSchemaCache:
+    """
+    Which per-symbol candle tables exist, read once from the catalog.
+
+    load() introspects the current schema; ensure() then issues DDL only
+    for tables not seen yet, sent as multi-statement batches of up to
+    batch_size tables per transaction (one transaction for a typical run;
+    bounded so a first run over thousands of symbols stays within the
+    server's lock table).
+    drop_redundant_indexes() removes the old idx_<table>_timestamp indexes,
+    which duplicated the UNIQUE (timestamp) index and doubled index
+    maintenance on every insert.
+    """
+
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+        self.tables = set()
+        self.loaded = False
+
+    async def load(self, conn):
+        rows = await conn.fetch('''
+            SELECT tablename FROM pg_tables WHERE schemaname = current_schema()
+        ''')
+        self.tables = {row['tablename'] for row in rows}
+        self.loaded = True
+        return self.tables
+
+    async def ensure(self, conn, table_names):
+        """Create the tables in table_names that do not exist yet; returns the names created"""
+        if not self.loaded:
+            await self.load(conn)
+        missing = sorted(set(table_names) - self.tables)
+        for i in range(0, len(missing), self.batch_size):
+            batch = missing[i:i + self.batch_size]
+            async with conn.transaction():
+                await conn.execute(";".join(CANDLE_TABLE_DDL.format(table=table_name) for table_name in batch))
+            self.tables.update(batch)
+        return missing
+
+    async def drop_redundant_indexes(self, conn):
+        """Drop timestamp indexes made redundant by the UNIQUE constraint; returns their names"""
+        rows = await conn.fetch(_REDUNDANT_INDEX_QUERY)
+        index_names = [row['index_name'] for row in rows]
+        if index_names:
+            await conn.execute(
+                "DROP INDEX IF EXISTS " + ", ".join(f'"{index_name}"' for index_name in index_names)
+            )
+        return index_names
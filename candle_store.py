@@ -0,0 +1,564 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import polars as pl
+
+from candles import IST_TIMEZONE, CSV_TIMESTAMP_FORMAT, CSV_TIMESTAMP_PARSE_FORMAT, CANDLE_SCHEMA
+
+IST = ZoneInfo(IST_TIMEZONE)
+
+# Column types of the archived CSVs, with timestamps kept as the stored strings
+CSV_SCHEMA = {"timestamp": pl.String, **{name: dtype for name, dtype in CANDLE_SCHEMA[1:]}}
+
+
+def _as_ist(value):
+    """Treat naive datetimes as IST so they compare with the stored timestamps"""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=IST)
+    return value
+
+
+def _symbol_name(symbol):
+    return symbol.replace(':', '_')
+
+
+def _file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _epoch(value):
+    return int(_as_ist(value).timestamp())
+
+
+class CandleManifest:
+    """
+    Sidecar JSON index of what each symbol's stored data covers.
+
+    Entries record the first/last candle epoch, the row count and a SHA-256
+    of the stored data, so the startup scan is one file read instead of
+    opening every archive. Updates are kept in memory and the file is
+    rewritten at most every flush_interval seconds and on flush(), through
+    a temporary file and os.replace, so readers never see a partial write
+    and a run over many symbols does not rewrite it once per symbol. An
+    entry lost to a crash before the flush only costs a rescan of that
+    symbol's data.
+    """
+
+    def __init__(self, path, flush_interval=30.0):
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._written_at = time.monotonic()
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        except ValueError:
+            print(f"Warning: Unreadable manifest {self.path}, rebuilding it from the stored data")
+            self.entries = {}
+
+    def get(self, symbol):
+        return self.entries.get(symbol)
+
+    def update(self, symbol, **entry):
+        with self._lock:
+            self.entries[symbol] = dict(entry, updated_at=int(datetime.now().timestamp()))
+            self._changed()
+
+    def remove(self, symbol):
+        with self._lock:
+            if self.entries.pop(symbol, None) is not None:
+                self._changed()
+
+    def flush(self):
+        """Write pending changes to disk"""
+        with self._lock:
+            if self._dirty:
+                self._write()
+
+    def _changed(self):
+        self._dirty = True
+        if time.monotonic() - self._written_at >= self.flush_interval:
+            self._write()
+
+    def _write(self):
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+        self._written_at = time.monotonic()
+
+
+def _last_date(entry):
+    """Date (as a naive datetime) of the newest candle recorded in a manifest entry"""
+    last = datetime.fromtimestamp(entry['last'], IST)
+    return datetime(last.year, last.month, last.day)
+
+
+class CsvCandleWriter:
+    """
+    Streams candle batches into one sorted, de-duplicated CSV at path.
+
+    Each write() appends a batch (IST datetime timestamps) to a staging CSV
+    in a private scratch directory next to the target, so memory use is
+    bounded by the batch size however much history is fetched. close()
+    sorts and de-duplicates the staged rows with Polars' streaming engine
+    and renames the result over path; abort() discards them. Use it as a
+    context manager to close on success and abort on error.
+
+    Inside a coroutine, use it with `async with` and awrite(): the file
+    work then runs on worker threads, one batch at a time, so the event
+    loop keeps serving the other fetches.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.scratch_dir = Path(tempfile.mkdtemp(dir=self.path.parent, prefix=f".{self.path.name}."))
+        self.staging_path = self.scratch_dir / 'batches.csv'
+        self.rows = 0
+        self._write_lock = asyncio.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._write_lock:
+            await asyncio.to_thread(self.__exit__, exc_type, exc, tb)
+
+    async def awrite(self, df):
+        """write() on a worker thread, after any batch still being written"""
+        async with self._write_lock:
+            await asyncio.to_thread(self.write, df)
+
+    def write(self, df):
+        """Append a batch of candles with IST datetime timestamps"""
+        if df.is_empty():
+            return
+        df = df.with_columns(pl.col("timestamp").dt.strftime(CSV_TIMESTAMP_FORMAT).alias("timestamp"))
+        with open(self.staging_path, 'ab') as f:
+            df.write_csv(f, include_header=self.rows == 0)
+        self.rows += len(df)
+
+    def _merge(self, sources, target):
+        """Sort and de-duplicate the CSVs in sources (later ones win) into target"""
+        pl.concat([pl.scan_csv(source, schema=CSV_SCHEMA) for source in sources]) \
+            .unique(subset=["timestamp"], keep="last") \
+            .sort("timestamp") \
+            .sink_csv(target)
+
+    def close(self):
+        """Write the merged CSV and return the number of rows written by this writer"""
+        try:
+            if self.rows:
+                merged_path = self.scratch_dir / 'merged.csv'
+                self._merge([self.staging_path], merged_path)
+                os.replace(merged_path, self.path)
+            return self.rows
+        finally:
+            self.abort()
+
+    def abort(self):
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+
+class TarCsvCandleWriter(CsvCandleWriter):
+    """
+    CsvCandleWriter for a TarCsvCandleStore archive.
+
+    On close the staged rows are merged with the existing archive (unless
+    replace is set), streamed into a new archive and recorded in the
+    store's manifest.
+    """
+
+    def __init__(self, store, symbol, replace=False):
+        super().__init__(store._archive_path(symbol))
+        self.store = store
+        self.symbol = symbol
+        self.replace = replace
+
+    def close(self):
+        try:
+            if not self.rows:
+                return 0
+            sources = [self.staging_path]
+            if not self.replace and self.path.exists():
+                existing_path = self.scratch_dir / 'existing.csv'
+                self.store._extract_csv(self.symbol, existing_path)
+                sources.insert(0, existing_path)
+
+            merged_path = self.scratch_dir / 'merged.csv'
+            self._merge(sources, merged_path)
+            self.store._write_archive(self.symbol, merged_path)
+            self.store._record(self.symbol, pl.scan_csv(merged_path, schema=CSV_SCHEMA))
+            return self.rows
+        finally:
+            self.abort()
+
+
+class TarCsvCandleStore:
+    """
+    One <SYMBOL>.tar.gz per symbol holding a single <SYMBOL>.csv.
+
+    This is the original historicalData layout. Appending merges the new
+    candles with the existing CSV, de-duplicates on timestamp and rewrites
+    the whole archive. Batches are staged through a TarCsvCandleWriter in a
+    private scratch directory and the archive is written to a unique
+    temporary file renamed over the old one, so concurrent tasks working on
+    different symbols share no scratch space. Call close() when done so
+    the manifest is written.
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = Path(data_dir)
+        self.data_dir.mkdir(exist_ok=True)
+        self.manifest = CandleManifest(self.data_dir / 'manifest.json')
+
+    def close(self):
+        self.manifest.flush()
+
+    def _archive_path(self, symbol):
+        return self.data_dir / f"{_symbol_name(symbol)}.tar.gz"
+
+    def _read_csv(self, symbol):
+        """Read the symbol's CSV straight out of the archive, without extracting it to disk"""
+        csv_name = f"{_symbol_name(symbol)}.csv"
+        with tarfile.open(self._archive_path(symbol), 'r:gz') as tar:
+            member = tar.extractfile(csv_name)
+            if member is None:
+                raise tarfile.TarError(f"{csv_name} is not a regular file")
+            data = member.read()
+        # Keep timestamps as the stored strings so they merge without reformatting
+        return pl.read_csv(io.BytesIO(data), try_parse_dates=False)
+
+    def _extract_csv(self, symbol, target):
+        """Copy the symbol's CSV out of the archive to target"""
+        csv_name = f"{_symbol_name(symbol)}.csv"
+        with tarfile.open(self._archive_path(symbol), 'r:gz') as tar:
+            member = tar.extractfile(csv_name)
+            if member is None:
+                raise tarfile.TarError(f"{csv_name} is not a regular file")
+            with open(target, 'wb') as f:
+                shutil.copyfileobj(member, f, 1 << 20)
+
+    def _write_archive(self, symbol, csv_path):
+        """Stream csv_path into a temporary archive next to the target and rename it into place"""
+        archive_path = self._archive_path(symbol)
+        # A unique name per write, so concurrent tasks never share scratch files
+        fd, tmp_path = tempfile.mkstemp(dir=self.data_dir, prefix=f".{archive_path.name}.", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with tarfile.open(fileobj=f, mode='w:gz') as tar:
+                    tar.add(csv_path, arcname=f"{_symbol_name(symbol)}.csv")
+            os.replace(tmp_path, archive_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def last_timestamp(self, symbol):
+        """Get the last timestamp for a symbol from the manifest, scanning the archive if it has no entry"""
+        entry = self.manifest.get(symbol)
+        if entry is not None:
+            if self._archive_path(symbol).exists():
+                return _last_date(entry)
+            self.manifest.remove(symbol)
+        return self._scan_last_timestamp(symbol)
+
+    def _record(self, symbol, frame):
+        """Store the manifest entry for an archive holding frame (CSV timestamp strings, DataFrame or LazyFrame)"""
+        bounds = frame.lazy().select(
+            pl.col("timestamp").min().str.to_datetime(CSV_TIMESTAMP_PARSE_FORMAT).dt.epoch("s").alias("first"),
+            pl.col("timestamp").max().str.to_datetime(CSV_TIMESTAMP_PARSE_FORMAT).dt.epoch("s").alias("last"),
+            pl.len().alias("rows")
+        ).collect()
+        self.manifest.update(
+            symbol,
+            first=bounds.item(0, "first"),
+            last=bounds.item(0, "last"),
+            rows=bounds.item(0, "rows"),
+            checksum=_file_checksum(self._archive_path(symbol))
+        )
+
+    def _scan_last_timestamp(self, symbol):
+        """Get the last timestamp from existing data for a symbol with robust error handling"""
+        archive_path = self._archive_path(symbol)
+
+        try:
+            if not archive_path.exists():
+                return None
+
+            try:
+                # Try to read and validate the archive
+                df = self._read_csv(symbol)
+            except (tarfile.TarError, OSError, KeyError) as e:
+                print(f"Warning: Corrupted archive detected for {symbol}, removing and starting fresh")
+                archive_path.unlink()  # Remove corrupted file
+                return None
+            except pl.exceptions.ComputeError as e:
+                print(f"Warning: Data format error in CSV for {symbol}, removing and starting fresh")
+                archive_path.unlink()
+                return None
+
+            if len(df) > 0:
+                # Backfill the manifest so the next startup skips this scan
+                self._record(symbol, df)
+                last_timestamp = df['timestamp'].max()
+                return datetime.strptime(str(last_timestamp)[:10], '%Y-%m-%d')
+            return None
+
+        except Exception as e:
+            print(f"Error reading last timestamp for {symbol}: {str(e)}")
+            # In case of unexpected errors, we'll also remove the potentially corrupted file
+            try:
+                archive_path.unlink()
+            except:
+                pass
+            return None
+
+    def writer(self, symbol, replace=False):
+        """Streaming writer for the symbol's archive; replace discards the existing candles"""
+        return TarCsvCandleWriter(self, symbol, replace)
+
+    def append(self, symbol, df):
+        """Merge candles (IST datetime timestamps) into the symbol's archive"""
+        with self.writer(symbol) as writer:
+            writer.write(df)
+
+    def read(self, symbol, start=None, end=None):
+        """Return the symbol's candles with timestamp in [start, end)"""
+        df = self._read_csv(symbol)
+        df = df.with_columns(
+            pl.col("timestamp").str.to_datetime(CSV_TIMESTAMP_PARSE_FORMAT).dt.convert_time_zone(IST_TIMEZONE)
+        )
+        if start is not None:
+            df = df.filter(pl.col("timestamp") >= _as_ist(start))
+        if end is not None:
+            df = df.filter(pl.col("timestamp") < _as_ist(end))
+        return df
+
+
+class ParquetCandleWriter:
+    """
+    Streaming writer for a ParquetCandleStore symbol.
+
+    Every write() turns its batch into new Parquet files straight away, so
+    memory use is bounded by the batch size; close() updates the manifest
+    once for all of them. Files already written by an aborted writer stay
+    on disk; the next run refetches from the last recorded timestamp and
+    reads de-duplicate the overlap. Like CsvCandleWriter it also works as
+    an async context manager with awrite(), off the event loop.
+    """
+
+    def __init__(self, store, symbol):
+        self.store = store
+        self.symbol = symbol
+        self.symbol_dir = store._symbol_dir(symbol)
+        self.entry = store._entry(symbol) or {'files': {}}
+        self.files = dict(self.entry.get('files', {}))
+        self.first = self.entry.get('first')
+        self.last = self.entry.get('last')
+        self.rows = 0
+        self._write_lock = asyncio.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+    __aenter__ = CsvCandleWriter.__aenter__
+    __aexit__ = CsvCandleWriter.__aexit__
+    awrite = CsvCandleWriter.awrite
+
+    def write(self, df):
+        """Write a batch of candles with IST datetime timestamps as new Parquet files"""
+        if df.is_empty():
+            return
+
+        self.symbol_dir.mkdir(exist_ok=True)
+        df = df.sort("timestamp").with_columns(pl.col("timestamp").dt.convert_time_zone(IST_TIMEZONE))
+
+        for (month,), month_df in df.group_by(pl.col("timestamp").dt.strftime('%Y-%m'), maintain_order=True):
+            epochs = month_df.select(pl.col("timestamp").dt.epoch("s"))
+            first, last = epochs.item(0, 0), epochs.item(-1, 0)
+            path = self.symbol_dir / f"{month}_{first}_{last}.parquet"
+            tmp_path = path.with_suffix('.parquet.tmp')
+            month_df.write_parquet(
+                tmp_path,
+                compression='zstd',
+                statistics=True,
+                row_group_size=self.store.row_group_size
+            )
+            os.replace(tmp_path, path)
+            self.files[path.name] = _file_checksum(path)
+
+        first_epoch = _epoch(df['timestamp'][0])
+        last_epoch = _epoch(df['timestamp'][-1])
+        self.first = first_epoch if self.first is None else min(self.first, first_epoch)
+        self.last = last_epoch if self.last is None else max(self.last, last_epoch)
+        self.rows += len(df)
+
+    def close(self):
+        """Record the written files in the manifest and return the number of rows written"""
+        if self.rows:
+            # Per-file digests let later appends extend the symbol checksum without rereading old files
+            combined = hashlib.sha256(''.join(self.files[name] for name in sorted(self.files)).encode()).hexdigest()
+            # Appends may overlap, so count the rows a read returns rather than the rows written
+            rows = self.store.scan(self.symbol).select(pl.len()).collect().item()
+            self.store.manifest.update(
+                self.symbol,
+                first=self.first,
+                last=self.last,
+                rows=rows,
+                checksum=combined,
+                files=self.files
+            )
+        return self.rows
+
+
+class ParquetCandleStore:
+    """
+    Per-symbol directory of immutable, zstd-compressed Parquet files.
+
+    Every append writes new files (one per calendar month covered by the
+    batch) named <YYYY-MM>_<first epoch>_<last epoch>.parquet, so nothing
+    existing is read or rewritten. Timestamps are stored as typed IST
+    datetimes with row-group statistics, and reads prune files by name and
+    push the time-range predicate down into the Parquet scan.
+
+    Its manifest is kept apart from a TarCsvCandleStore's, so the two
+    backends can share a data directory. Call close() when done so the
+    manifest is written.
+    """
+
+    def __init__(self, data_dir, row_group_size=100_000):
+        self.data_dir = Path(data_dir)
+        self.data_dir.mkdir(exist_ok=True)
+        self.row_group_size = row_group_size
+        self.manifest = CandleManifest(self.data_dir / 'parquet_manifest.json')
+
+    def close(self):
+        self.manifest.flush()
+
+    def _symbol_dir(self, symbol):
+        return self.data_dir / _symbol_name(symbol)
+
+    def _files(self, symbol, start=None, end=None):
+        """Parquet files of a symbol whose [first, last] range overlaps [start, end)"""
+        symbol_dir = self._symbol_dir(symbol)
+        if not symbol_dir.exists():
+            return []
+
+        start_epoch = _as_ist(start).timestamp() if start is not None else None
+        end_epoch = _as_ist(end).timestamp() if end is not None else None
+        files = []
+        for path in sorted(symbol_dir.glob('*.parquet')):
+            _, first, last = path.stem.split('_')
+            if start_epoch is not None and int(last) < start_epoch:
+                continue
+            if end_epoch is not None and int(first) >= end_epoch:
+                continue
+            files.append(path)
+        return files
+
+    def _entry(self, symbol):
+        """The symbol's manifest entry, dropped if any file it records is gone"""
+        entry = self.manifest.get(symbol)
+        if entry is None:
+            return None
+        symbol_dir = self._symbol_dir(symbol)
+        if entry.get('files') and all((symbol_dir / name).exists() for name in entry['files']):
+            return entry
+        self.manifest.remove(symbol)
+        return None
+
+    def last_timestamp(self, symbol):
+        """Date of the newest stored candle, from the manifest or else the file names"""
+        entry = self._entry(symbol)
+        if entry is not None:
+            return _last_date(entry)
+        files = self._files(symbol)
+        if not files:
+            return None
+        last_epoch = max(int(path.stem.split('_')[2]) for path in files)
+        last = datetime.fromtimestamp(last_epoch, IST)
+        return datetime(last.year, last.month, last.day)
+
+    def writer(self, symbol):
+        """Streaming writer that adds Parquet files for the symbol and records them in the manifest on close"""
+        return ParquetCandleWriter(self, symbol)
+
+    def append(self, symbol, df):
+        """Write candles (IST datetime timestamps) as new Parquet files"""
+        with self.writer(symbol) as writer:
+            writer.write(df)
+
+    def scan(self, symbol, start=None, end=None):
+        """Lazily scan the symbol's candles with timestamp in [start, end)"""
+        files = self._files(symbol, start, end)
+        if not files:
+            return None
+        lf = pl.scan_parquet(files)
+        if start is not None:
+            lf = lf.filter(pl.col("timestamp") >= _as_ist(start))
+        if end is not None:
+            lf = lf.filter(pl.col("timestamp") < _as_ist(end))
+        # Appends of overlapping ranges are de-duplicated on timestamp
+        return lf.unique(subset=["timestamp"], keep="last", maintain_order=True).sort("timestamp")
+
+    def read(self, symbol, start=None, end=None):
+        """Return the symbol's candles with timestamp in [start, end)"""
+        lf = self.scan(symbol, start, end)
+        if lf is None:
+            return pl.DataFrame(schema={
+                "timestamp": pl.Datetime("us", IST_TIMEZONE),
+                "open": pl.Float64,
+                "high": pl.Float64,
+                "low": pl.Float64,
+                "close": pl.Float64,
+                "volume": pl.Float64
+            })
+        return lf.collect()
+
+
+CANDLE_STORES = {
+    'tar_csv': TarCsvCandleStore,
+    'parquet': ParquetCandleStore
+}
+
+
+def create_candle_store(storage, data_dir):
+    """Instantiate the candle store backend named by storage"""
+    if storage not in CANDLE_STORES:
+        raise Exception(f"Unknown storage backend '{storage}', expected one of {list(CANDLE_STORES)}")
+    return CANDLE_STORES[storage](data_dir)
@@ -0,0 +1,35 @@
+import polars as pl
+
+IST_TIMEZONE = "Asia/Kolkata"
+
+# Timestamp layout used in the historical CSV archives, and the pattern to parse it back
+CSV_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.000000+0530'
+CSV_TIMESTAMP_PARSE_FORMAT = '%Y-%m-%dT%H:%M:%S%.f%z'
+
+CANDLE_SCHEMA = [
+    ("timestamp", pl.Int64),
+    ("open", pl.Float64),
+    ("high", pl.Float64),
+    ("low", pl.Float64),
+    ("close", pl.Float64),
+    ("volume", pl.Float64)
+]
+
+
+def candles_to_frame(candles):
+    """Build a DataFrame from the [epoch, open, high, low, close, volume] rows returned by history()"""
+    return pl.DataFrame(candles, schema=CANDLE_SCHEMA, orient="row")
+
+
+def ist_datetime(column="timestamp"):
+    """Expression converting epoch seconds to a timezone-aware IST datetime"""
+    return (
+        pl.from_epoch(column, time_unit="s")
+        .dt.replace_time_zone("UTC")
+        .dt.convert_time_zone(IST_TIMEZONE)
+    )
+
+
+def candles_to_ist_frame(candles):
+    """Build a DataFrame from history() rows with timestamps as IST datetimes"""
+    return candles_to_frame(candles).with_columns(ist_datetime("timestamp").alias("timestamp"))
@@ -0,0 +1,109 @@
+import asyncio
+import inspect
+
+# Fyers error code for an expired or invalid access token
+AUTH_ERROR_CODE = -16
+
+
+class AuthenticationError(Exception):
+    """The history API rejected the access token"""
+
+
+def is_auth_error(response):
+    """True when a history response (decoded JSON dict) reports an authentication failure"""
+    if not isinstance(response, dict) or response.get('s') == 'ok':
+        return False
+    return response.get('code') == AUTH_ERROR_CODE or "authenticate" in str(response.get('message', '')).lower()
+
+
+def plan_windows(start_date, end_date, chunk_size):
+    """Split [start_date, end_date) into consecutive (start, end) windows of at most chunk_size"""
+    windows = []
+    current_start = start_date
+    while current_start < end_date:
+        current_end = min(current_start + chunk_size, end_date)
+        windows.append((current_start, current_end))
+        current_start = current_end
+    return windows
+
+
+class TokenRefresher:
+    """
+    Ask for a new login once, however many windows and symbols hit the expired token.
+
+    load_token() reads the new token and apply_token(token) hands it to
+    the client. The prompt waits on a worker thread, so fetches already in
+    flight keep running. A caller passes the generation it saw before its
+    requests failed; if another caller refreshed since, nothing is asked.
+    """
+
+    def __init__(self, load_token, apply_token):
+        self.load_token = load_token
+        self.apply_token = apply_token
+        self.generation = 0
+        self._lock = asyncio.Lock()
+
+    async def refresh(self, seen_generation):
+        async with self._lock:
+            if self.generation != seen_generation:
+                return
+            print("\nAuthentication error detected!")
+            print("Please login using the token generation script.")
+            await asyncio.to_thread(input, "After logging in, press Enter to continue...")
+            self.apply_token(self.load_token())
+            self.generation += 1
+
+
+async def fetch_windows(fetch_chunk, symbol, windows, on_chunk=None, concurrency=4,
+                        refresher=None, max_auth_retries=2):
+    """
+    Fetch a symbol's windows concurrently, streaming each to on_chunk.
+
+    fetch_chunk(symbol, start, end) is awaited once per window and, as soon
+    as it returns, its candles are passed to on_chunk(candles) (awaited if
+    it returns an awaitable, e.g. a writer's awrite()) and dropped,
+    so memory use is bounded by the chunk size rather than the history.
+    Windows complete in any order; the sink is expected to sort and
+    de-duplicate (the candle store writers do). Returns the number of
+    candles fetched.
+
+    At most concurrency windows of the symbol are in flight at once, on top
+    of the global budget of the shared HistoryClient (connection pool and
+    rate limiter). A window that fails is reported and skipped. Windows
+    that raise AuthenticationError are collected instead; once the others
+    have finished the token is refreshed once through refresher and only
+    those windows are fetched again, at most max_auth_retries times.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(start, end):
+        async with semaphore:
+            print(f"{symbol}: Fetching data from {start} to {end}")
+            try:
+                candles = await fetch_chunk(symbol, start, end)
+                if candles and on_chunk is not None:
+                    written = on_chunk(candles)
+                    if inspect.isawaitable(written):
+                        await written
+                return len(candles or ())
+            except AuthenticationError:
+                return None
+            except Exception as e:
+                print(f"{symbol}: Error processing chunk {start} to {end}: {str(e)}")
+                return 0
+
+    total = 0
+    attempt = 0
+    while windows:
+        generation = refresher.generation if refresher else None
+        counts = await asyncio.gather(*(fetch(start, end) for start, end in windows))
+        total += sum(count for count in counts if count is not None)
+        windows = [window for window, count in zip(windows, counts) if count is None]
+        if not windows:
+            break
+        if refresher is None or attempt >= max_auth_retries:
+            print(f"{symbol}: Giving up on {len(windows)} chunks after authentication errors")
+            break
+        attempt += 1
+        await refresher.refresh(generation)
+    return total
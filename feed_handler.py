@@ -0,0 +1,61 @@
+import logging
+
+import index_fut
+import stock_ws
+from subscription_shards import ShardedDataSocket
+from tick_bus import TickBus, DEFAULT_BUS_NAME
+
+
+def main():
+    """
+    Own the websocket connection(s) and publish every tick to the shared memory tick bus.
+
+    Subscribes to the union of what stock_ws.py and index_fut.py need; run those
+    with feed='bus' to consume from here instead of opening their own sockets.
+    """
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    equity_symbols = stock_ws.SymbolManager().read_symbol_list()
+    index_fut_symbols = index_fut.SymbolManager().read_symbol_list()
+    futures_symbols = [sym for sym in index_fut_symbols if sym.endswith('FUT')]
+
+    symbols = list(dict.fromkeys(equity_symbols + index_fut_symbols))
+    depth_symbols = equity_symbols + futures_symbols
+    socket_shards = 1  # Minimum data socket connections; raised to fit the per-connection symbol limit
+    access_token = stock_ws.read_access_token()
+
+    bus = TickBus(symbols, name=DEFAULT_BUS_NAME)
+    print(f"Publishing {len(symbols)} symbols to tick bus '{DEFAULT_BUS_NAME}' ({bus.capacity} slots)")
+
+    subscriptions = {'SymbolUpdate': symbols, 'DepthUpdate': depth_symbols}
+
+    def onmessage(message):
+        """Publish incoming ticks; control messages are not forwarded."""
+        if message.get('type') in ['cn', 'ful'] or not message.get('symbol'):
+            return
+        bus.publish(message)
+
+    def onclose(message):
+        """Handle WebSocket connection close."""
+        print("Connection closed:", message)
+        print(f"Tick bus: published {bus.published}, ignored {bus.ignored}")
+        bus.close()
+
+    # Always sharded: the union is over one connection's symbol limit, and plan_shards()
+    # adds connections until every one fits. Each shard subscribes in paced, retried
+    # batches on every (re)connect, and the merge thread is the bus's only writer.
+    sharded = ShardedDataSocket(
+        access_token,
+        subscriptions,
+        onmessage,
+        shards=socket_shards
+    )
+    print(f"Subscribing over {len(sharded.plan)} connections")
+    sharded.connect()
+    try:
+        sharded.keep_running()
+    except KeyboardInterrupt:
+        sharded.close()
+        onclose("Sharded sockets closed")
+
+if __name__ == "__main__":
+    main()
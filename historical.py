@@ -285,21 +285,22 @@
 import os
 import asyncio
 import aiohttp
-import tarfile
 from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from fyers_apiv3 import fyersModel
 from datetime import datetime, timedelta
 import json
-import polars as pl
+from candles import candles_to_ist_frame
+from candle_store import create_candle_store
 import time
 from pathlib import Path
-import requests
 import pytz
-import shutil
+from symbol_master import SymbolMasterCache
+from history_client import HistoryClient
+from rate_limiter import RateLimiter
+from chunk_planner import plan_windows, fetch_windows, is_auth_error, AuthenticationError, TokenRefresher
 
 class AsyncHistoricalDataFetcher:
-    def __init__(self, max_workers=5):
+    def __init__(self, max_workers=5, storage='tar_csv'):
         load_dotenv()
         self.client_id = os.getenv('APP_ID')
         if not self.client_id:
@@ -307,11 +308,28 @@ class AsyncHistoricalDataFetcher:
         self.access_token = self._load_access_token()
         self.max_workers = max_workers
         self.ist_tz = pytz.timezone('Asia/Kolkata')
+        self.symbol_cache = SymbolMasterCache()
         self.data_dir = Path('historicalData')
         self.data_dir.mkdir(exist_ok=True)
+        # 'tar_csv' (one tar.gz per symbol) or 'parquet' (zstd Parquet files per symbol and month)
+        self.store = create_candle_store(storage, self.data_dir)
         self.log_dir = Path('logs')
         self.log_dir.mkdir(exist_ok=True)
+        # One keep-alive connection pool and one request budget shared by every symbol and chunk
+        self.rate_limiter = RateLimiter(per_second=10, per_minute=200)
+        self.history_client = HistoryClient(
+            self.client_id,
+            self.access_token,
+            max_connections=max_workers,
+            rate_limiter=self.rate_limiter
+        )
+        # One re-login prompt for all symbols when the token expires mid-run
+        self.token_refresher = TokenRefresher(self._load_access_token, self._set_access_token)
         
+    def _set_access_token(self, access_token):
+        self.access_token = access_token
+        self.history_client.set_token(access_token)
+
     def _load_access_token(self):
         """Load access token from file"""
         try:
@@ -322,109 +340,21 @@ class AsyncHistoricalDataFetcher:
         except Exception as e:
             raise Exception(f"Error reading access token: {str(e)}")
 
-    def _clean_temp_dir(self, temp_dir):
-        """Safely clean up temporary directory"""
-        try:
-            if temp_dir.exists():
-                shutil.rmtree(temp_dir, ignore_errors=True)
-        except Exception as e:
-            print(f"Warning: Could not clean temporary directory: {str(e)}")
-
     def get_last_timestamp(self, symbol):
-        """Get the last timestamp from existing data for a symbol with robust error handling"""
-        temp_dir = Path('temp_extract')
-        archive_path = self.data_dir / f"{symbol.replace(':', '_')}.tar.gz"
-        
-        try:
-            # Clean up any existing temp directory first
-            self._clean_temp_dir(temp_dir)
-            
-            if not archive_path.exists():
-                return None
-
-            # Create a fresh temporary directory
-            temp_dir.mkdir(exist_ok=True)
-            
-            try:
-                # Try to read and validate the archive
-                with tarfile.open(archive_path, 'r:gz') as tar:
-                    csv_name = f"{symbol.replace(':', '_')}.csv"
-                    try:
-                        tar.extract(csv_name, temp_dir, filter='data')
-                    except (tarfile.TarError, OSError) as e:
-                        print(f"Warning: Corrupted archive detected for {symbol}, removing and starting fresh")
-                        archive_path.unlink()  # Remove corrupted file
-                        return None
-                    
-                    try:
-                        # Read the last row of the CSV using Polars
-                        df = pl.read_csv(temp_dir / csv_name)
-                        if len(df) > 0:
-                            last_timestamp = df['timestamp'].max()
-                            return datetime.strptime(str(last_timestamp)[:10], '%Y-%m-%d')
-                    except pl.exceptions.ComputeError as e:
-                        print(f"Warning: Data format error in CSV for {symbol}, removing and starting fresh")
-                        archive_path.unlink()
-                        return None
-                    
-            except tarfile.ReadError as e:
-                print(f"Warning: Invalid tar.gz file for {symbol}, removing and starting fresh")
-                archive_path.unlink()
-                return None
-                
-            return None
-            
-        except Exception as e:
-            print(f"Error reading last timestamp for {symbol}: {str(e)}")
-            # In case of unexpected errors, we'll also remove the potentially corrupted file
-            try:
-                archive_path.unlink()
-            except:
-                pass
-            return None
-            
-        finally:
-            # Always clean up the temporary directory
-            self._clean_temp_dir(temp_dir)
+        """Get the last timestamp from existing data for a symbol"""
+        return self.store.last_timestamp(symbol)
 
     def download_symbol_file(self):
-        """Download the symbol master file"""
-        url = "https://public.fyers.in/sym_details/NSE_CM_sym_master.json"
-        local_file = "NSE_CM_sym_master.json"
-        
+        """Return the symbol master file, downloading it only when it has changed"""
         try:
-            print("Downloading symbol master file...")
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            content = response.text
-            content = content.strip()
-            if content.endswith(','):
-                content = content[:-1]
-            
-            if not content.startswith('{'):
-                content = '{' + content
-            if not content.endswith('}'):
-                content = content + '}'
-            
-            with open(local_file, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            print("Symbol master file downloaded and cleaned successfully")
-            return local_file
-            
+            return self.symbol_cache.path('NSE_CM')
         except Exception as e:
             raise Exception(f"Error downloading symbol file: {str(e)}")
 
     def read_symbol_list(self):
-        """Read and parse the local symbol master file"""
+        """Read the equity symbols from the cached symbol master snapshot"""
         try:
-            local_file = self.download_symbol_file()
-            
-            with open(local_file, 'r') as f:
-                data = json.load(f)
-            
-            equity_symbols = [symbol for symbol in data.keys() if symbol.endswith('-EQ')]
+            equity_symbols = self.symbol_cache.symbols('NSE_CM', '-EQ')
             
             print(f"Found {len(equity_symbols)} equity symbols")
             if equity_symbols:
@@ -436,14 +366,7 @@ class AsyncHistoricalDataFetcher:
             raise Exception(f"Error reading symbol list: {str(e)}")
 
     async def get_data_chunk(self, symbol, start_date, end_date):
-        """Fetch data for a specific date range with proper async handling"""
-        fyers = fyersModel.FyersModel(
-            client_id=self.client_id,
-            is_async=True,  # Keep async=True
-            token=self.access_token,
-            log_path=str(self.log_dir)
-        )
-        
+        """Fetch data for a specific date range through the shared history client"""
         end_date = end_date - timedelta(minutes=1)
         from_timestamp = int(start_date.timestamp())
         to_timestamp = int(end_date.timestamp())
@@ -458,41 +381,25 @@ class AsyncHistoricalDataFetcher:
         }
         
         try:
-            # Properly await the async call
-            response = await fyers.history(data=data)
+            response = await self.history_client.history(data)
             if isinstance(response, dict):
                 if response.get('s') == 'ok':
                     return response.get('candles', [])
-                elif response.get('code') == -16 or "authenticate" in str(response.get('message', '')).lower():
-                    print(f"\n{symbol}: Authentication error detected!")
-                    print("Please login using the token generation script.")
-                    input("After logging in, press Enter to continue...")
-                    
-                    self.access_token = self._load_access_token()
-                    fyers = fyersModel.FyersModel(
-                        client_id=self.client_id,
-                        is_async=True,
-                        token=self.access_token,
-                        log_path=str(self.log_dir)
-                    )
-                    response = await fyers.history(data=data)
-                    
-                    if isinstance(response, dict) and response.get('s') == 'ok':
-                        return response.get('candles', [])
-                    else:
-                        raise Exception(f"API Error after reauth: {json.dumps(response, indent=2)}")
+                elif is_auth_error(response):
+                    raise AuthenticationError(f"{symbol}: {response.get('message', 'authentication failed')}")
                 else:
                     raise Exception(f"API Error: {json.dumps(response, indent=2)}")
             else:
                 raise Exception(f"Unexpected response format: {response}")
                 
+        except AuthenticationError:
+            raise
         except Exception as e:
             raise Exception(f"Error fetching data chunk: {str(e)}")
 
     async def process_symbol(self, symbol, years=10):
         """Process a single symbol with async data fetching"""
         print(f"Starting processing for {symbol}")
-        temp_dir = Path('temp_extract')
         
         try:
             last_timestamp = self.get_last_timestamp(symbol)
@@ -508,101 +415,20 @@ class AsyncHistoricalDataFetcher:
                 print(f"{symbol}: No existing data found, fetching {years} years of historical data")
                 start_date = end_date - timedelta(days=years * 365)
             
-            all_data = []
-            chunk_size = timedelta(days=100)
-            current_start = start_date
-            
-            while current_start < end_date:
-                current_end = min(current_start + chunk_size, end_date)
-                print(f"{symbol}: Fetching data from {current_start} to {current_end}")
-                
-                try:
-                    # Directly await the async function
-                    chunk_data = await self.get_data_chunk(symbol, current_start, current_end)
-                    
-                    if chunk_data:
-                        all_data.extend(chunk_data)
-                    await asyncio.sleep(1)  # Rate limiting
-                    
-                except Exception as e:
-                    print(f"{symbol}: Error processing chunk {current_start} to {current_end}: {str(e)}")
-                    if "authenticate" in str(e).lower():
-                        continue  # Retry the same chunk after reauth
-                    
-                current_start = current_end
-            
-            if all_data:
-                # Clean up any existing temp directory
-                self._clean_temp_dir(temp_dir)
-                temp_dir.mkdir(exist_ok=True)
-                
-                # Create new DataFrame
-                new_df = pl.DataFrame(
-                    all_data,
-                    schema=[
-                        ("timestamp", pl.Int64),
-                        ("open", pl.Float64),
-                        ("high", pl.Float64),
-                        ("low", pl.Float64),
-                        ("close", pl.Float64),
-                        ("volume", pl.Float64)
-                    ],
-                    orient="row"
+            # Fetch all 100-day windows concurrently, writing each to the store as it arrives
+            windows = plan_windows(start_date, end_date, timedelta(days=100))
+            async with self.store.writer(symbol) as writer:
+                rows = await fetch_windows(
+                    self.get_data_chunk, symbol, windows,
+                    on_chunk=lambda candles: writer.awrite(candles_to_ist_frame(candles)),
+                    refresher=self.token_refresher
                 )
-                
-                # Convert Unix timestamp to datetime string with timezone
-                new_df = new_df.with_columns([
-                    pl.col("timestamp")
-                    .map_elements(
-                        lambda x: datetime.fromtimestamp(x)
-                        .astimezone(pytz.timezone('Asia/Kolkata'))
-                        .strftime('%Y-%m-%dT%H:%M:%S.000000+0530'),  # Match the existing format
-                        return_dtype=pl.Utf8
-                    )
-                    .alias("timestamp")
-                ])
-
-                # Sort by timestamp
-                new_df = new_df.sort("timestamp")
-                
-                # If we have existing data, merge it with the new data
-                if last_timestamp:
-                    archive_path = self.data_dir / f"{symbol.replace(':', '_')}.tar.gz"
-                    
-                    with tarfile.open(archive_path, 'r:gz') as tar:
-                        csv_name = f"{symbol.replace(':', '_')}.csv"
-                        tar.extract(csv_name, temp_dir, filter='data')
-                        
-                        # Read existing data without parsing dates
-                        existing_df = pl.read_csv(
-                            temp_dir / csv_name,
-                            try_parse_dates=False
-                        )
-                        
-                        # Combine existing and new data
-                        combined_df = pl.concat([existing_df, new_df])
-                        combined_df = combined_df.unique(subset=["timestamp"])
-                        combined_df = combined_df.sort("timestamp")
-                        
-                        # No need to parse and reformat timestamps since they're already in the correct format
-                        new_df = combined_df
-                
-                # Create temporary CSV file
-                temp_csv = temp_dir / f"temp_{symbol.replace(':', '_')}.csv"
-                new_df.write_csv(temp_csv)
-                
-                # Create tar.gz file
-                archive_name = f"{symbol.replace(':', '_')}.tar.gz"
-                
-                with tarfile.open(self.data_dir / archive_name, 'w:gz') as tar:
-                    tar.add(temp_csv, arcname=f"{symbol.replace(':', '_')}.csv")
-                
+            
+            if rows:
                 print(f"{symbol}: Data successfully {'updated' if last_timestamp else 'saved'}")
                 
         except Exception as e:
             print(f"{symbol}: Error processing symbol: {str(e)}")
-        finally:
-            self._clean_temp_dir(temp_dir)
         
         return symbol
 
@@ -648,6 +474,11 @@ class AsyncHistoricalDataFetcher:
             
         except Exception as e:
             print(f"Error in main processing: {str(e)}")
+        finally:
+            print(f"History client: {self.history_client.format_stats()}")
+            print(f"Rate limiter: {self.rate_limiter.format_stats()}")
+            await self.history_client.close()
+            self.store.close()
 
 async def main():
     try:
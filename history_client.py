@@ -0,0 +1,157 @@
+import asyncio
+
+import aiohttp
+
+from rate_limiter import is_rate_limited
+
+# Same endpoint fyersModel.FyersModel.history() calls
+HISTORY_URL = "https://api-t1.fyers.in/data/history"
+
+
+class HistoryClient:
+    """
+    Shared keep-alive client for the Fyers history endpoint.
+
+    fyersModel.FyersModel opens a new aiohttp session (and TLS connection)
+    per instance, and the fetchers built one per chunk. This client owns a
+    single session whose connector keeps up to max_connections sockets
+    alive, so every symbol and chunk reuses the same pool. A TraceConfig
+    counts new versus reused connections; see stats().
+
+    With a rate_limiter (see rate_limiter.RateLimiter) every request first
+    takes a slot from it, and rate-limited responses are reported back to it
+    and retried up to max_retries times after its backoff.
+
+    The session is created on first use so it binds to the running event
+    loop; call close() (or use it as an async context manager) when done.
+    """
+
+    def __init__(self, client_id, access_token, max_connections=5, timeout=60,
+                 rate_limiter=None, max_retries=5):
+        self.client_id = client_id
+        self.access_token = access_token
+        self.max_connections = max_connections
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session = None
+        self._stats = {
+            'requests': 0,
+            'errors': 0,
+            'rate_limited': 0,
+            'connections_created': 0,
+            'connections_reused': 0
+        }
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def set_token(self, access_token):
+        """Use a new access token for subsequent requests, e.g. after re-login"""
+        self.access_token = access_token
+
+    def _trace_config(self):
+        trace = aiohttp.TraceConfig()
+
+        async def on_connection_create_end(session, context, params):
+            self._stats['connections_created'] += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            self._stats['connections_reused'] += 1
+
+        async def on_request_end(session, context, params):
+            self._stats['requests'] += 1
+
+        async def on_request_exception(session, context, params):
+            self._stats['errors'] += 1
+
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_request_end.append(on_request_end)
+        trace.on_request_exception.append(on_request_exception)
+        return trace
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections,
+                keepalive_timeout=60,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                trace_configs=[self._trace_config()]
+            )
+        return self._session
+
+    async def history(self, data):
+        """
+        GET /data/history with the given query parameters.
+
+        Returns the decoded JSON response like FyersModel.history(), including
+        for HTTP error statuses whose body is the usual {'s', 'code',
+        'message'} error; a non-JSON error body is wrapped in that shape.
+        Network errors are raised as aiohttp.ClientError. A response that is
+        still rate limited after max_retries is returned as is.
+        """
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+            result, status, retry_after = await self._get(data)
+
+            if not is_rate_limited(result, status):
+                if self.rate_limiter is not None:
+                    self.rate_limiter.record_success()
+                return result
+
+            self._stats['rate_limited'] += 1
+            if attempt == self.max_retries:
+                break
+            if self.rate_limiter is None:
+                await asyncio.sleep(retry_after if retry_after is not None else 2 ** attempt)
+            else:
+                self.rate_limiter.record_rate_limited(retry_after)
+        return result
+
+    async def _get(self, data):
+        headers = {
+            "Authorization": f"{self.client_id}:{self.access_token}",
+            "Content-Type": "application/json",
+            "version": "3"
+        }
+        async with self._get_session().get(HISTORY_URL, params=data, headers=headers) as response:
+            try:
+                retry_after = float(response.headers['Retry-After'])
+            except (KeyError, ValueError):
+                retry_after = None
+            try:
+                result = await response.json(content_type=None)
+            except ValueError:
+                text = await response.text()
+                result = {'s': 'error', 'code': response.status, 'message': text[:200]}
+            return result, response.status, retry_after
+
+    def stats(self):
+        """Request and connection counters, with the share of requests served on a reused connection"""
+        stats = dict(self._stats)
+        connections = stats['connections_created'] + stats['connections_reused']
+        stats['reuse_ratio'] = stats['connections_reused'] / connections if connections else 0.0
+        return stats
+
+    def format_stats(self):
+        stats = self.stats()
+        return (f"{stats['requests']} requests ({stats['errors']} failed, {stats['rate_limited']} rate limited), "
+                f"{stats['connections_created']} new connections, "
+                f"{stats['connections_reused']} reused ({stats['reuse_ratio']:.1%})")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            # Give the connector a moment to close its transports cleanly
+            await asyncio.sleep(0)
+        self._session = None
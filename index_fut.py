@@ -4,10 +4,20 @@ from psycopg2 import Error
 from fyers_apiv3.FyersWebsocket import data_ws
 from datetime import datetime
 import os
-import json
-import requests
+from symbol_master import SymbolMasterCache
 import logging
 from logging.handlers import RotatingFileHandler
+from tick_pipeline import TickPipeline
+from partitioned_ticks import PartitionedTickStore, PARTITION_KEY_COLUMNS
+from live_ingest import LiveIngestService
+from prepared_inserts import PreparedInsertCache, sanitize_table_name
+from tick_record import TickLayout
+from tick_dedup import DeltaFilter
+from snapshot_store import SnapshotStore
+from tick_bus import TickBusReader
+from bar_builder import BarBuilder, BarWriter, candle_db_config
+from subscription_shards import ShardedDataSocket
+from subscribe_scheduler import SubscriptionScheduler
 
 # Setup logging configuration
 def setup_logging():
@@ -42,74 +52,49 @@ class SymbolManager:
     def __init__(self):
         self.symbol_dir = "api/symbol"
         os.makedirs(self.symbol_dir, exist_ok=True)
+        self.cache = SymbolMasterCache(self.symbol_dir)
         
     def download_symbol_files(self):
-        """Download both index and futures symbol master files"""
-        files_to_download = {
-            'index': {
-                'url': "https://public.fyers.in/sym_details/NSE_CM_sym_master.json",
-                'path': os.path.join(self.symbol_dir, "NSE_CM_sym_master.json")
-            },
-            'futures': {
-                'url': "https://public.fyers.in/sym_details/NSE_FO_sym_master.json",
-                'path': os.path.join(self.symbol_dir, "NSE_FO_sym_master.json")
-            }
+        """Return both index and futures symbol master files, downloading only when changed"""
+        segments = {
+            'index': 'NSE_CM',
+            'futures': 'NSE_FO'
         }
         
         downloaded_files = {}
         
-        for market_type, file_info in files_to_download.items():
+        for market_type, segment in segments.items():
             try:
-                print(f"Downloading {market_type} symbol master file...")
-                response = requests.get(file_info['url'])
-                response.raise_for_status()
-                
-                content = response.text
-                content = content.strip()
-                if content.endswith(','):
-                    content = content[:-1]
-                
-                if not content.startswith('{'):
-                    content = '{' + content
-                if not content.endswith('}'):
-                    content = content + '}'
-                
-                with open(file_info['path'], 'w', encoding='utf-8') as f:
-                    f.write(content)
-                
-                print(f"{market_type.capitalize()} symbol master file downloaded and cleaned successfully")
-                downloaded_files[market_type] = file_info['path']
-                
+                downloaded_files[market_type] = self.cache.path(segment)
             except Exception as e:
                 print(f"Error downloading {market_type} symbol file: {str(e)}")
                 
         return downloaded_files
 
     def read_symbol_list(self):
-        """Read and parse both local symbol master files"""
+        """Read index and futures symbols from the cached symbol master snapshots"""
         try:
-            downloaded_files = self.download_symbol_files()
             all_symbols = []
             
             # Read index symbols
-            if 'index' in downloaded_files:
-                with open(downloaded_files['index'], 'r') as f:
-                    index_data = json.load(f)
-                index_symbols = [symbol for symbol in index_data.keys() if symbol.endswith('-INDEX')]
+            try:
+                index_symbols = self.cache.symbols('NSE_CM', '-INDEX')
                 all_symbols.extend(index_symbols)
                 print(f"Found {len(index_symbols)} index symbols")
                 if index_symbols:
                     print("Sample index symbols:", index_symbols[:5])
+            except Exception as e:
+                print(f"Error downloading index symbol file: {str(e)}")
             
             # Read futures symbols
-            if 'futures' in downloaded_files:
-                with open(downloaded_files['futures'], 'r') as f:
-                    futures_data = json.load(f)
-                futures_symbols = [symbol for symbol in futures_data.keys() if symbol.endswith('FUT')]
+            try:
+                futures_symbols = self.cache.symbols('NSE_FO', 'FUT')
                 all_symbols.extend(futures_symbols)
                 print(f"Found {len(futures_symbols)} futures symbols")
                 if futures_symbols:
                     print("Sample futures symbols:", futures_symbols[:5])
+            except Exception as e:
+                print(f"Error downloading futures symbol file: {str(e)}")
             
             print(f"Total symbols: {len(all_symbols)}")
             return all_symbols
@@ -117,19 +102,76 @@ class SymbolManager:
         except Exception as e:
             raise Exception(f"Error reading symbol list: {str(e)}")
 
+INDEX_COLUMNS = (
+    'ltp', 'prev_close_price', 'ch', 'chp', 'exch_feed_time',
+    'high_price', 'low_price', 'open_price', 'type'
+)
+
+FUT_COLUMNS = (
+    'ltp', 'vol_traded_today', 'last_traded_time', 'exch_feed_time',
+    'bid_size', 'ask_size', 'bid_price', 'ask_price', 'last_traded_qty',
+    'tot_buy_qty', 'tot_sell_qty', 'avg_trade_price', 'low_price',
+    'high_price', 'lower_ckt', 'upper_ckt', 'open_price', 'prev_close_price',
+    'ch', 'chp', 'bid_price1', 'bid_price2', 'bid_price3', 'bid_price4', 'bid_price5',
+    'ask_price1', 'ask_price2', 'ask_price3', 'ask_price4', 'ask_price5',
+    'bid_size1', 'bid_size2', 'bid_size3', 'bid_size4', 'bid_size5',
+    'ask_size1', 'ask_size2', 'ask_size3', 'ask_size4', 'ask_size5',
+    'bid_order1', 'bid_order2', 'bid_order3', 'bid_order4', 'bid_order5',
+    'ask_order1', 'ask_order2', 'ask_order3', 'ask_order4', 'ask_order5',
+    'type'
+)
+
 class DatabaseManager:
-    def __init__(self, ini_path):
+    def __init__(self, ini_path, storage_mode='per_symbol', ingest='psycopg2', dedup=None):
         self.config = self._read_config(ini_path)
         self.connection = None
         self.setup_database()
+        # Latest merged fields per symbol, held as fixed-layout tick records
+        self.index_layout = TickLayout(INDEX_COLUMNS)
+        self.fut_layout = TickLayout(FUT_COLUMNS)
         self.data_cache = {}
+        # 'skip' drops rows that repeat the last persisted one, 'delta' also NULLs unchanged fields
+        self.index_dedup = DeltaFilter(INDEX_COLUMNS, mode=dedup) if dedup else None
+        self.fut_dedup = DeltaFilter(FUT_COLUMNS, mode=dedup) if dedup else None
         self.symbol_logger, self.index_logger, self.fut_logger = setup_logging()
+        # Per-symbol INSERTs are prepared once on the server and then only executed
+        self.index_inserts = PreparedInsertCache(self.connection, INDEX_COLUMNS, prefix='index_insert')
+        self.fut_inserts = PreparedInsertCache(self.connection, FUT_COLUMNS, prefix='fut_insert')
+        # 'per_symbol' keeps one table per symbol, 'partitioned' writes every
+        # symbol into a single day-partitioned ticks table
+        self.partitioned_store = None
+        if storage_mode == 'partitioned':
+            self.partitioned_store = PartitionedTickStore(self.connection)
+        elif storage_mode != 'per_symbol':
+            raise Exception(f"Unknown storage mode: {storage_mode}")
+        # 'psycopg2' inserts from the tick pipeline workers; 'asyncpg' queues rows on
+        # the LiveIngestService event loop, which writes them through a connection pool
+        self.ingest = ingest
+        self.writer = None
+        if ingest == 'asyncpg':
+            self.writer = LiveIngestService(
+                self.connect_params(),
+                columns=FUT_COLUMNS,
+                logger=logging.getLogger('live_ingest')
+            )
+        elif ingest != 'psycopg2':
+            raise Exception(f"Unknown ingest mode: {ingest}")
 
     def _read_config(self, ini_path):
         config = configparser.ConfigParser()
         config.read(ini_path)
         return config['postgresql']
 
+    def connect_params(self):
+        """Connection settings from the ini file as keyword arguments for asyncpg"""
+        return {
+            'host': self.config['host'],
+            'port': int(self.config['port']),
+            'user': self.config['user'],
+            'password': self.config['password'],
+            'database': self.config['database']
+        }
+
     def setup_database(self):
         try:
             self.connection = psycopg2.connect(
@@ -162,17 +204,18 @@ class DatabaseManager:
         
         self.connection.autocommit = True
 
-    def create_table(self, symbol):
-        table_name = (
-            symbol
-            .replace(':', '_')
-            .replace('-', '_')
-            .replace('&', '_')
-            .replace(' ', '_')
-        )
+    def create_tables(self, symbols):
+        """Create the storage for all symbols according to the storage mode"""
+        if self.partitioned_store:
+            self.partitioned_store.create_schema()
+            self.partitioned_store.register_symbols(symbols)
+            return
         
-        if not table_name[0].isalpha() and table_name[0] != '_':
-            table_name = 'symbol_' + table_name
+        for symbol in symbols:
+            self.create_table(symbol)
+
+    def create_table(self, symbol):
+        table_name = sanitize_table_name(symbol)
         
         with self.connection.cursor() as cursor:
             if symbol.endswith('-INDEX'):
@@ -237,19 +280,24 @@ class DatabaseManager:
         try:
             self.symbol_logger.info(f"Received data for {symbol}: {data}")
             
-            if symbol not in self.data_cache:
-                self.data_cache[symbol] = {'symbol': symbol}
+            is_index = symbol.endswith('-INDEX')
+            record = self.data_cache.get(symbol)
+            if record is None:
+                layout = self.index_layout if is_index else self.fut_layout
+                record = self.data_cache[symbol] = layout.record(symbol)
             
             # Update cache with new data
-            self.data_cache[symbol].update(data)
+            record.update(data)
             
-            if symbol.endswith('-INDEX'):
+            if is_index:
                 self.index_logger.info(f"Processing INDEX symbol: {symbol}")
-                if self.has_required_fields_index(self.data_cache[symbol]):
+                if self.has_required_fields_index(record):
                     try:
-                        self.insert_index_data(self.data_cache[symbol], symbol)
-                        self.index_logger.info(f"Successfully inserted INDEX data for {symbol}")
-                        self.data_cache[symbol] = {'symbol': symbol}
+                        row = self._dedup_row(self.index_dedup, symbol, record.values)
+                        if row is not None:
+                            self.insert_index_data(row, symbol)
+                            self.index_logger.info(f"Successfully inserted INDEX data for {symbol}")
+                        record.take()
                     except Exception as e:
                         self.index_logger.error(f"Database insertion error for INDEX {symbol}: {str(e)}")
             else:
@@ -257,20 +305,30 @@ class DatabaseManager:
                 
                 # For market data updates
                 if update_type == 'market':
-                    current_data = self.data_cache[symbol]
-                    if self.has_required_fields_fut(current_data):
+                    if self.has_required_fields_fut(record):
                         try:
-                            self.insert_fut_data(current_data, symbol)
-                            self.fut_logger.info(f"Successfully inserted FUT market data for {symbol}")
-                            self.data_cache[symbol] = {'symbol': symbol}
+                            row = self._dedup_row(self.fut_dedup, symbol, record.values)
+                            if row is not None:
+                                self.insert_fut_data(row, symbol)
+                                self.fut_logger.info(f"Successfully inserted FUT market data for {symbol}")
+                            record.take()
                         except Exception as e:
                             self.fut_logger.error(f"Database insertion error for FUT {symbol}: {str(e)}")
                     else:
-                        self.fut_logger.debug(f"Current cache state for {symbol}: {current_data}")
+                        self.fut_logger.debug(f"Current cache state for {symbol}: {record}")
                 
         except Exception as e:
             self.symbol_logger.error(f"Error in update_cache_and_insert: {str(e)}", exc_info=True)
 
+    def _dedup_row(self, dedup, symbol, row):
+        """The row to persist after delta suppression, or None when nothing changed"""
+        if dedup is None:
+            return row
+        row = dedup.filter(symbol, row)
+        if row is None:
+            self.symbol_logger.debug(f"Skipped unchanged tick for {symbol}")
+        return row
+
     def _check_missing_fields_index(self, data):
         """Helper method to check which required fields are missing for INDEX symbols"""
         required_fields = ['ltp', 'prev_close_price', 'ch', 'chp']
@@ -316,102 +374,50 @@ class DatabaseManager:
             
         return False
 
-    def insert_index_data(self, data, symbol):
-        table_name = (
-            symbol
-            .replace(':', '_')
-            .replace('-', '_')
-            .replace('&', '_')
-            .replace(' ', '_')
-        )
+    def insert_index_data(self, row, symbol):
+        """Write one INDEX row (values in INDEX_COLUMNS order) for symbol"""
+        if self.writer:
+            self._queue_row(symbol, row, INDEX_COLUMNS)
+            return
         
-        if not table_name[0].isalpha() and table_name[0] != '_':
-            table_name = 'symbol_' + table_name
-            
-        try:
+        if self.partitioned_store:
             with self.connection.cursor() as cursor:
-                cursor.execute(f"""
-                    INSERT INTO {table_name} (
-                        ltp, prev_close_price, ch, chp, exch_feed_time,
-                        high_price, low_price, open_price, type
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s, %s, %s, %s
-                    )
-                """, (
-                    data.get('ltp'), data.get('prev_close_price'),
-                    data.get('ch'), data.get('chp'),
-                    data.get('exch_feed_time'), data.get('high_price'),
-                    data.get('low_price'), data.get('open_price'),
-                    data.get('type')
-                ))
-                print(f"Successfully inserted data for {symbol}")  # Debug log
+                self.partitioned_store.insert(cursor, symbol, row, INDEX_COLUMNS)
+            return
+        
+        try:
+            self.index_inserts.insert(symbol, row)
+            print(f"Successfully inserted data for {symbol}")  # Debug log
         except Exception as e:
             print(f"Error inserting data for {symbol}: {str(e)}")  # Debug log
 
-    def insert_fut_data(self, data, symbol):
-        table_name = (
-            symbol
-            .replace(':', '_')
-            .replace('-', '_')
-            .replace('&', '_')
-            .replace(' ', '_')
-        )
+    def insert_fut_data(self, row, symbol):
+        """Write one FUT row (values in FUT_COLUMNS order) for symbol"""
+        if self.writer:
+            self._queue_row(symbol, row, FUT_COLUMNS)
+            return
         
-        if not table_name[0].isalpha() and table_name[0] != '_':
-            table_name = 'symbol_' + table_name
+        if self.partitioned_store:
+            with self.connection.cursor() as cursor:
+                self.partitioned_store.insert(cursor, symbol, row, FUT_COLUMNS)
+            return
         
-        with self.connection.cursor() as cursor:
-            cursor.execute(f"""
-                INSERT INTO {table_name} (
-                    ltp, vol_traded_today, last_traded_time, exch_feed_time,
-                    bid_size, ask_size, bid_price, ask_price, last_traded_qty,
-                    tot_buy_qty, tot_sell_qty, avg_trade_price, low_price,
-                    high_price, lower_ckt, upper_ckt, open_price, prev_close_price,
-                    ch, chp, bid_price1, bid_price2, bid_price3, bid_price4, bid_price5,
-                    ask_price1, ask_price2, ask_price3, ask_price4, ask_price5,
-                    bid_size1, bid_size2, bid_size3, bid_size4, bid_size5,
-                    ask_size1, ask_size2, ask_size3, ask_size4, ask_size5,
-                    bid_order1, bid_order2, bid_order3, bid_order4, bid_order5,
-                    ask_order1, ask_order2, ask_order3, ask_order4, ask_order5,
-                    type
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s
-                )
-            """, (
-                data.get('ltp'), data.get('vol_traded_today'),
-                data.get('last_traded_time'), data.get('exch_feed_time'),
-                data.get('bid_size'), data.get('ask_size'),
-                data.get('bid_price'), data.get('ask_price'),
-                data.get('last_traded_qty'), data.get('tot_buy_qty'),
-                data.get('tot_sell_qty'), data.get('avg_trade_price'),
-                data.get('low_price'), data.get('high_price'),
-                data.get('lower_ckt'), data.get('upper_ckt'),
-                data.get('open_price'), data.get('prev_close_price'),
-                data.get('ch'), data.get('chp'),
-                data.get('bid_price1'), data.get('bid_price2'),
-                data.get('bid_price3'), data.get('bid_price4'),
-                data.get('bid_price5'), data.get('ask_price1'),
-                data.get('ask_price2'), data.get('ask_price3'),
-                data.get('ask_price4'), data.get('ask_price5'),
-                data.get('bid_size1'), data.get('bid_size2'),
-                data.get('bid_size3'), data.get('bid_size4'),
-                data.get('bid_size5'), data.get('ask_size1'),
-                data.get('ask_size2'), data.get('ask_size3'),
-                data.get('ask_size4'), data.get('ask_size5'),
-                data.get('bid_order1'), data.get('bid_order2'),
-                data.get('bid_order3'), data.get('bid_order4'),
-                data.get('bid_order5'), data.get('ask_order1'),
-                data.get('ask_order2'), data.get('ask_order3'),
-                data.get('ask_order4'), data.get('ask_order5'),
-                data.get('type')
-            ))
+        self.fut_inserts.insert(symbol, row)
+
+    def _queue_row(self, symbol, row, columns):
+        """Queue a row for the asyncpg ingest service"""
+        if self.partitioned_store:
+            self.writer.add_partitioned(self.partitioned_store, symbol, row, PARTITION_KEY_COLUMNS + columns)
+            return
+        
+        self.writer.add(sanitize_table_name(symbol), row, columns)
 
     def close(self):
+        if self.writer:
+            self.writer.close()
+            logging.info(f"Live ingest metrics: {self.writer.metrics()}")
+        if self.index_dedup:
+            logging.info(f"Dedup stats: INDEX {self.index_dedup.stats}, FUT {self.fut_dedup.stats}")
         if self.connection:
             self.connection.close()
 
@@ -442,7 +448,15 @@ def main():
 
     # Initialize managers
     symbol_manager = SymbolManager()
-    db_manager = DatabaseManager('api/ini/index_fut.ini')
+    db_manager = DatabaseManager(
+        'api/ini/index_fut.ini',
+        storage_mode='per_symbol',  # Set to 'partitioned' for the single day-partitioned ticks table
+        ingest='psycopg2',  # Set to 'asyncpg' to write through the LiveIngestService event loop
+        dedup='skip'  # 'delta' stores only changed fields, None writes every merged tick
+    )
+    feed = 'socket'  # Set to 'bus' to read ticks from a running feed_handler.py
+    socket_shards = 1  # Data socket connections to spread the subscriptions over
+    live_bars = False  # Build 1s/1m/5m bars into the aws_historical_db candle tables (needs api/ini/aws_stocks.ini)
 
     # Get symbols and access token
     symbols = symbol_manager.read_symbol_list()
@@ -452,20 +466,15 @@ def main():
     index_symbols = [sym for sym in symbols if sym.endswith('-INDEX')]
     futures_symbols = [sym for sym in symbols if sym.endswith('FUT')]
 
-    # Create tables for each symbol
-    for symbol in symbols:
-        symbol_with_prefix = f"{symbol}"
-        db_manager.create_table(symbol_with_prefix)
+    # Create tables for each symbol (or the shared partitioned table)
+    db_manager.create_tables(symbols)
 
-    def onmessage(message):
-        """Handle incoming messages from the WebSocket."""
+    def handle_message(message):
+        """Write a queued tick to the database (runs on a pipeline worker or the ingest loop)."""
         try:
             symbol = message.get('symbol')
             msg_type = message.get('type')
             
-            if not symbol or msg_type in ['cn', 'ful', 'sub']:
-                return
-            
             # Convert 'sf' type to 'market' and 'if' type to 'index'
             if msg_type == 'sf':
                 message['type'] = 'market'
@@ -481,25 +490,107 @@ def main():
         except Exception as e:
             logging.error(f"Error in onmessage handler: {str(e)}", exc_info=True)
 
+    # Database writes happen on the pipeline workers or the ingest event loop, never on the socket thread
+    if db_manager.ingest == 'asyncpg':
+        pipeline = None
+        db_manager.writer.start(handle_message)
+        submit = db_manager.writer.submit
+    else:
+        pipeline = TickPipeline(
+            handle_message,
+            maxsize=50000,
+            policy='block',  # 'block', 'drop_oldest' or 'coalesce'
+            workers=1,
+            report_interval=30,
+            logger=logging.getLogger('tick_pipeline')
+        )
+        submit = pipeline.submit
+
+    # Latest quote and depth per symbol for strategy code; give it an shm_name to
+    # let other processes attach with SnapshotStore.attach()
+    snapshots = SnapshotStore(symbols)
+
+    # Closed bars are upserted into the candle tables the history backfill writes
+    bars = None
+    if live_bars:
+        bars = BarBuilder()
+        bar_writer = BarWriter(
+            bars,
+            candle_db_config(),
+            logger=logging.getLogger('bar_writer')
+        )
+        bar_writer.start()
+
+    # DepthUpdate only for futures symbols
+    subscriptions = {'SymbolUpdate': symbols, 'DepthUpdate': futures_symbols}
+    # Subscribes in paced batches on every (re)connect, retrying the batches that fail
+    scheduler = SubscriptionScheduler(
+        lambda batch, data_type: fyers.subscribe(symbols=batch, data_type=data_type),
+        logger=logging.getLogger('subscriptions')
+    )
+
+    def onmessage(message):
+        """Handle incoming messages from the WebSocket."""
+        if message.get('type') in ['sub', 'unsub']:
+            scheduler.on_ack(message)
+            return
+        if not message.get('symbol') or message.get('type') in ['cn', 'ful']:
+            return
+        snapshots.update(message)
+        if bars:
+            bars.update(message)
+        submit(message)
+
     def onopen():
         """Subscribe to data types and symbols upon WebSocket connection."""
-        # Subscribe to SymbolUpdate for all symbols
-        fyers.subscribe(symbols=[f"{sym}" for sym in symbols], data_type="SymbolUpdate")
-        
-        # Subscribe to DepthUpdate only for futures symbols
-        if futures_symbols:
-            fyers.subscribe(symbols=[f"{sym}" for sym in futures_symbols], data_type="DepthUpdate")
-            
+        scheduler.start(subscriptions)
         fyers.keep_running()
 
     def onerror(message):
-        """Handle WebSocket errors."""
+        """Handle WebSocket errors; rejected subscriptions go back to the scheduler."""
+        if scheduler.on_error(message):
+            return
         print("Error:", message)
 
     def onclose(message):
         """Handle WebSocket connection close."""
         print("Connection closed:", message)
+        if pipeline:
+            pipeline.close()
+            logging.info(f"Tick pipeline metrics: {pipeline.metrics()}")
         db_manager.close()
+        snapshots.close()
+        if bars:
+            bar_writer.close()
+
+    if feed == 'bus':
+        # Consume the ticks a running feed_handler.py publishes instead of opening a socket
+        reader = TickBusReader(symbols=symbols)
+        try:
+            for message in reader.messages():
+                onmessage(message)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            reader.close()
+            onclose("Tick bus reader stopped")
+        return
+
+    if socket_shards > 1:
+        # Spread the subscriptions over several connections, merged back into onmessage
+        sharded = ShardedDataSocket(
+            access_token,
+            subscriptions,
+            onmessage,
+            shards=socket_shards
+        )
+        sharded.connect()
+        try:
+            sharded.keep_running()
+        except KeyboardInterrupt:
+            sharded.close()
+            onclose("Sharded sockets closed")
+        return
 
     # Initialize FyersDataSocket
     fyers = data_ws.FyersDataSocket(
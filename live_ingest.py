@@ -0,0 +1,305 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncpg
+
+from tick_writer import TICK_COLUMNS, FlushStats
+
+
+class LiveIngestService:
+    """
+    asyncio-native ingest path for websocket ticks, writing through asyncpg.
+
+    FyersDataSocket calls on_message on its own thread. submit() hands each
+    message to an event loop running in a background thread
+    (call_soon_threadsafe), where handler(message) runs one message at a
+    time, so the per-symbol merge logic needs no locking. The handler queues
+    rows with add(), like a BatchedTickWriter; they are grouped per table
+    and column set, and up to pool_size groups are written concurrently,
+    each on its own pooled connection.
+
+    write_method 'copy' (the default) sends each group with a binary COPY
+    (copy_records_to_table); 'insert' uses executemany of a prepared
+    INSERT, which asyncpg prepares once per connection and pipelines in a
+    single round trip. For the wide tick rows COPY is several times faster.
+
+    Buffered rows are flushed every flush_interval seconds or once max_rows
+    rows are waiting. At most pool_size flushes are written at a time; while
+    they are, rows keep buffering, and once max_buffered_rows are waiting
+    new rows are dropped and counted. Likewise, when more than maxsize
+    messages are queued for the loop, new ones are dropped and counted
+    instead of blocking the socket thread.
+
+    A group whose write fails goes back to the head of its buffer and is
+    retried after retry_backoff seconds, doubling per attempt, like in
+    BatchedTickWriter; after max_retries failed attempts its rows are
+    dropped and counted in the write stats.
+
+    Blocking work the handler needs (psycopg2 DDL, symbol id lookups) goes
+    through call_blocking(), which runs it on a single worker thread so the
+    loop keeps writing.
+    """
+
+    def __init__(self, connect_kwargs, columns=TICK_COLUMNS, pool_size=4, max_rows=5000,
+                 flush_interval=0.5, maxsize=100000, max_buffered_rows=None, write_method='copy',
+                 max_retries=3, retry_backoff=1.0, logger=None):
+        if write_method not in ('copy', 'insert'):
+            raise Exception(f"Unknown write method: {write_method}")
+        self.connect_kwargs = dict(connect_kwargs)
+        self.columns = tuple(columns)
+        self.pool_size = pool_size
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.maxsize = maxsize
+        self.max_buffered_rows = max_buffered_rows or maxsize
+        self.write_method = write_method
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.logger = logger or logging.getLogger(__name__)
+        self.stats = FlushStats()
+
+        self.handler = None
+        self.loop = asyncio.new_event_loop()
+        self.pool = None
+        self._thread = None
+        self._loop_thread_id = None
+        self._ready = threading.Event()
+        self._start_error = None
+        self._timer = None
+        self._inflight = set()
+        self._writes = 0
+        self._statements = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='live-ingest-blocking')
+
+        self._buffer = {}
+        self._buffered_rows = 0
+        self._attempts = {}  # (table_name, columns) -> failed writes in a row
+        self._retry_at = {}  # (table_name, columns) -> monotonic time before which it is not written again
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._counters = {'submitted': 0, 'processed': 0, 'dropped': 0, 'errors': 0, 'dropped_rows': 0}
+        self._last_lag = 0.0
+        self._max_lag = 0.0
+
+    def start(self, handler):
+        """Open the pool on a background event loop and start dispatching messages to handler"""
+        self.handler = handler
+        self._thread = threading.Thread(target=self._run, name='live-ingest', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._start_error is not None:
+            raise Exception(f"Could not start live ingest: {str(self._start_error)}")
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self._loop_thread_id = threading.get_ident()
+        try:
+            self.loop.run_until_complete(self._open())
+        except Exception as e:
+            self._start_error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    async def _open(self):
+        self.pool = await asyncpg.create_pool(min_size=1, max_size=self.pool_size, **self.connect_kwargs)
+        self._timer = self.loop.create_task(self._flush_periodically())
+
+    def submit(self, message):
+        """Queue a websocket message for the handler; safe to call from any thread"""
+        with self._pending_lock:
+            if self._pending >= self.maxsize:
+                self._counters['dropped'] += 1
+                return False
+            self._pending += 1
+            self._counters['submitted'] += 1
+        self.loop.call_soon_threadsafe(self._dispatch, message, time.monotonic())
+        return True
+
+    def _dispatch(self, message, submitted_at):
+        with self._pending_lock:
+            self._pending -= 1
+        lag = time.monotonic() - submitted_at
+        self._last_lag = lag
+        self._max_lag = max(self._max_lag, lag)
+        try:
+            self.handler(message)
+            self._counters['processed'] += 1
+        except Exception as e:
+            self._counters['errors'] += 1
+            self.logger.error(f"Error handling message: {str(e)}")
+
+    def add(self, table_name, row, columns=None):
+        """Queue one row for table_name; columns defaults to the service's column set"""
+        if threading.get_ident() != self._loop_thread_id:
+            self.loop.call_soon_threadsafe(self.add, table_name, row, columns)
+            return
+        if self._buffered_rows >= self.max_buffered_rows:
+            self._counters['dropped_rows'] += 1
+            return
+        key = (table_name, tuple(columns) if columns is not None else self.columns)
+        self._buffer.setdefault(key, []).append(row)
+        self._buffered_rows += 1
+        if self._buffered_rows >= self.max_rows:
+            self._flush()
+
+    def add_partitioned(self, store, symbol, row, columns=None):
+        """Queue a row for a PartitionedTickStore, prefixed with its (symbol_id, trading_day) key"""
+        key = store.cached_row_key(symbol)
+        if key is not None:
+            self.add(store.table, key + tuple(row), columns)
+            return
+        # A new symbol or trading day needs DDL on the store's psycopg2 connection
+        row = tuple(row)
+        self.call_blocking(store.row_key, symbol, then=lambda key: self.add(store.table, key + row, columns))
+
+    def call_blocking(self, func, *args, then=None):
+        """Run func(*args) on the worker thread; then(result) runs back on the loop"""
+        future = self.loop.run_in_executor(self._executor, func, *args)
+
+        def done(future):
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self._counters['errors'] += 1
+                self.logger.error(f"Blocking call {getattr(func, '__name__', func)} failed: {str(future.exception())}")
+            elif then is not None:
+                then(future.result())
+
+        future.add_done_callback(done)
+        self._inflight.add(future)
+        future.add_done_callback(self._inflight.discard)
+        return future
+
+    def _insert_sql(self, table_name, columns):
+        key = (table_name, columns)
+        sql = self._statements.get(key)
+        if sql is None:
+            placeholders = ', '.join(f'${i}' for i in range(1, len(columns) + 1))
+            sql = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+            self._statements[key] = sql
+        return sql
+
+    def _flush(self):
+        """Hand the buffered rows to a write task if fewer than pool_size are running (runs on the loop)"""
+        if not self._buffered_rows or self._writes >= self.pool_size:
+            return
+        now = time.monotonic()
+        batch = {key: rows for key, rows in self._buffer.items() if self._retry_at.get(key, 0) <= now}
+        if not batch:
+            return
+        for key in batch:
+            del self._buffer[key]
+        rows = sum(len(group_rows) for group_rows in batch.values())
+        self._buffered_rows -= rows
+        self._writes += 1
+        task = self.loop.create_task(self._write_batch(batch, rows))
+        self._inflight.add(task)
+        task.add_done_callback(self._write_done)
+
+    def _write_done(self, task):
+        self._inflight.discard(task)
+        self._writes -= 1
+        # Rows that piled up while every write slot was taken
+        if self._buffered_rows >= self.max_rows:
+            self._flush()
+
+    async def _write_batch(self, batch, rows):
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(self._write_group(table_name, columns, group_rows)
+              for (table_name, columns), group_rows in batch.items()),
+            return_exceptions=True
+        )
+
+        written = 0
+        for (key, group_rows), result in zip(batch.items(), results):
+            if isinstance(result, BaseException):
+                self.stats.errors += 1
+                self._requeue(key, group_rows, result)
+            else:
+                self._attempts.pop(key, None)
+                self._retry_at.pop(key, None)
+                written += len(group_rows)
+
+        self.stats.record(written, time.perf_counter() - start)
+        self.logger.info(
+            f"Flushed {written}/{rows} rows to {len(batch)} tables in "
+            f"{self.stats.last_seconds * 1000:.1f} ms"
+        )
+
+    def _requeue(self, key, rows, error):
+        """Put a failed group's rows back ahead of newer ones, or drop them once out of retries"""
+        table_name = key[0]
+        attempts = self._attempts.get(key, 0) + 1
+        if attempts > self.max_retries:
+            self._attempts.pop(key, None)
+            self._retry_at.pop(key, None)
+            self.stats.dropped_rows += len(rows)
+            self.logger.error(f"Dropping {len(rows)} rows for {table_name} after {attempts} failed writes: "
+                              f"{str(error)}")
+            return
+        self._attempts[key] = attempts
+        self._retry_at[key] = time.monotonic() + self.retry_backoff * 2 ** (attempts - 1)
+        self._buffer[key] = rows + self._buffer.get(key, [])
+        self._buffered_rows += len(rows)
+        self.stats.retried_rows += len(rows)
+        self.logger.warning(f"Writing {len(rows)} rows to {table_name} failed, retrying "
+                            f"({attempts}/{self.max_retries}): {str(error)}")
+
+    async def _write_group(self, table_name, columns, rows):
+        async with self.pool.acquire() as conn:
+            if self.write_method == 'copy':
+                # Table names are unquoted in the DDL, so Postgres stores them lower case
+                await conn.copy_records_to_table(table_name.lower(), records=rows, columns=columns)
+            else:
+                await conn.executemany(self._insert_sql(table_name, columns), rows)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self._flush()
+
+    async def _shutdown(self):
+        # Messages submitted before close() were scheduled ahead of this coroutine and have been handled
+        if self._timer is not None:
+            self._timer.cancel()
+        while True:
+            # No more waiting out backoffs: failed groups are retried right away until written or dropped
+            self._retry_at.clear()
+            self._flush()
+            if not self._inflight:
+                break
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        self._executor.shutdown()
+        if self.pool is not None:
+            await self.pool.close()
+
+    def close(self, timeout=10):
+        """Handle queued messages, write everything buffered and stop the loop"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+        try:
+            future.result(timeout)
+        except Exception as e:
+            self.logger.error(f"Live ingest did not shut down cleanly: {str(e)}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+
+    def metrics(self):
+        metrics = dict(self._counters)
+        metrics.update({
+            'queue_depth': self._pending,
+            'buffered_rows': self._buffered_rows,
+            'inflight_writes': self._writes,
+            'last_lag_ms': round(self._last_lag * 1000, 3),
+            'max_lag_ms': round(self._max_lag * 1000, 3),
+            'writes': self.stats.as_dict()
+        })
+        return metrics
@@ -0,0 +1,154 @@
+from datetime import date, timedelta
+
+from tick_writer import TICK_COLUMNS
+
+PARTITION_KEY_COLUMNS = ('symbol_id', 'trading_day')
+PARTITIONED_TICK_COLUMNS = PARTITION_KEY_COLUMNS + TICK_COLUMNS
+
+
+def symbol_segment(symbol):
+    """Classify a symbol into the segment stored in the symbol dimension table"""
+    if symbol.endswith('-EQ'):
+        return 'EQ'
+    if symbol.endswith('-INDEX'):
+        return 'INDEX'
+    if symbol.endswith('FUT'):
+        return 'FUT'
+    if symbol.endswith('CE') or symbol.endswith('PE'):
+        return 'OPT'
+    return 'OTHER'
+
+
+class PartitionedTickStore:
+    """
+    Single tick table for all symbols, range-partitioned by trading day.
+
+    Instead of one table per symbol, every tick goes into `ticks` keyed by a
+    small integer symbol_id that references the `symbols` dimension table.
+    Startup DDL is a handful of statements regardless of the number of
+    symbols, and each day's partition can be dropped or detached as a unit.
+    """
+
+    def __init__(self, connection, table='ticks', symbol_table='symbols', days_ahead=1):
+        self.connection = connection
+        self.table = table
+        self.symbol_table = symbol_table
+        self.days_ahead = days_ahead
+        self.symbol_ids = {}
+        self._partitions = set()
+
+    def create_schema(self):
+        """Create the dimension table, the partitioned tick table and its index"""
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.symbol_table} (
+                    symbol_id SERIAL PRIMARY KEY,
+                    symbol TEXT NOT NULL UNIQUE,
+                    segment VARCHAR(10)
+                )
+            """)
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    symbol_id INTEGER NOT NULL,
+                    trading_day DATE NOT NULL,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+                    -- Market data fields
+                    ltp FLOAT,
+                    vol_traded_today BIGINT,
+                    last_traded_time BIGINT,
+                    exch_feed_time BIGINT,
+                    bid_size INTEGER,
+                    ask_size INTEGER,
+                    bid_price FLOAT,
+                    ask_price FLOAT,
+                    last_traded_qty INTEGER,
+                    tot_buy_qty BIGINT,
+                    tot_sell_qty BIGINT,
+                    avg_trade_price FLOAT,
+                    low_price FLOAT,
+                    high_price FLOAT,
+                    lower_ckt FLOAT,
+                    upper_ckt FLOAT,
+                    open_price FLOAT,
+                    prev_close_price FLOAT,
+                    ch FLOAT,
+                    chp FLOAT,
+
+                    -- Depth fields
+                    bid_price1 FLOAT, bid_price2 FLOAT, bid_price3 FLOAT, bid_price4 FLOAT, bid_price5 FLOAT,
+                    ask_price1 FLOAT, ask_price2 FLOAT, ask_price3 FLOAT, ask_price4 FLOAT, ask_price5 FLOAT,
+                    bid_size1 INTEGER, bid_size2 INTEGER, bid_size3 INTEGER, bid_size4 INTEGER, bid_size5 INTEGER,
+                    ask_size1 INTEGER, ask_size2 INTEGER, ask_size3 INTEGER, ask_size4 INTEGER, ask_size5 INTEGER,
+                    bid_order1 INTEGER, bid_order2 INTEGER, bid_order3 INTEGER, bid_order4 INTEGER, bid_order5 INTEGER,
+                    ask_order1 INTEGER, ask_order2 INTEGER, ask_order3 INTEGER, ask_order4 INTEGER, ask_order5 INTEGER,
+
+                    type VARCHAR(10)
+                ) PARTITION BY RANGE (trading_day)
+            """)
+            cursor.execute(f"""
+                CREATE INDEX IF NOT EXISTS {self.table}_symbol_feed_time_idx
+                ON {self.table} (symbol_id, exch_feed_time)
+            """)
+
+        today = date.today()
+        for offset in range(self.days_ahead + 1):
+            self.ensure_partition(today + timedelta(days=offset))
+
+    def ensure_partition(self, day):
+        """Create the partition holding ticks for the given trading day"""
+        if day in self._partitions:
+            return
+        partition = f"{self.table}_{day.strftime('%Y%m%d')}"
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {partition}
+                PARTITION OF {self.table}
+                FOR VALUES FROM (%s) TO (%s)
+            """, (day, day + timedelta(days=1)))
+        self._partitions.add(day)
+
+    def register_symbols(self, symbols):
+        """Insert any new symbols into the dimension table and load all symbol ids"""
+        symbols = list(symbols)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {self.symbol_table} (symbol, segment)
+                SELECT * FROM unnest(%s::text[], %s::varchar[])
+                ON CONFLICT (symbol) DO NOTHING
+            """, (symbols, [symbol_segment(symbol) for symbol in symbols]))
+            cursor.execute(
+                f"SELECT symbol, symbol_id FROM {self.symbol_table} WHERE symbol = ANY(%s)",
+                (symbols,)
+            )
+            self.symbol_ids.update(cursor.fetchall())
+        return self.symbol_ids
+
+    def row_key(self, symbol):
+        """Return the (symbol_id, trading_day) prefix for a new tick row"""
+        symbol_id = self.symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.register_symbols([symbol])[symbol]
+        trading_day = date.today()
+        if trading_day not in self._partitions:
+            # Day rollover: also create the following days, ahead of their first tick
+            for offset in range(self.days_ahead + 1):
+                self.ensure_partition(trading_day + timedelta(days=offset))
+        return symbol_id, trading_day
+
+    def cached_row_key(self, symbol):
+        """row_key() without touching the database; None if it would need to"""
+        symbol_id = self.symbol_ids.get(symbol)
+        trading_day = date.today()
+        if symbol_id is None or trading_day not in self._partitions:
+            return None
+        return symbol_id, trading_day
+
+    def insert(self, cursor, symbol, row, columns):
+        """Insert a single tick; row holds the values of columns in order"""
+        values = self.row_key(symbol) + tuple(row)
+        cursor.execute(
+            f"INSERT INTO {self.table} ({', '.join(PARTITION_KEY_COLUMNS + tuple(columns))}) "
+            f"VALUES ({', '.join(['%s'] * len(values))})",
+            values
+        )
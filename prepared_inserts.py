@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+
+@lru_cache(maxsize=8192)
+def sanitize_table_name(symbol):
+    """Per-symbol table name: special characters become underscores and it starts with a letter or underscore"""
+    table_name = (
+        symbol
+        .replace(':', '_')
+        .replace('-', '_')
+        .replace('&', '_')
+        .replace(' ', '_')
+    )
+    if not table_name[0].isalpha() and table_name[0] != '_':
+        table_name = 'symbol_' + table_name
+    return table_name
+
+
+class PreparedInsertCache:
+    """
+    Server-side prepared INSERT statements for the per-symbol tick tables.
+
+    The first insert for a symbol sends PREPARE for its table once; later
+    ticks only send EXECUTE with the bound values, so the server skips
+    parsing and planning the wide INSERT and the client skips rebuilding
+    its text. Parameter types are inferred from the target columns.
+
+    Prepared statements belong to the connection's session, so a cache is
+    tied to one connection. At most maxsize statements are kept; the least
+    recently used symbol's statement is DEALLOCATEd to make room.
+    """
+
+    def __init__(self, connection, columns, maxsize=2048, prefix='tick_insert'):
+        self.connection = connection
+        self.columns = tuple(columns)
+        self.maxsize = maxsize
+        self.prefix = prefix
+        self.prepared = 0
+        self.evicted = 0
+
+        self._statements = OrderedDict()  # symbol -> (statement name, EXECUTE sql)
+        self._counter = 0
+        self._lock = threading.Lock()
+        self._execute_args = ', '.join(['%s'] * len(self.columns))
+
+    def insert(self, symbol, row):
+        """Insert one row for symbol; row holds the values of self.columns in order"""
+        with self.connection.cursor() as cursor:
+            cursor.execute(self._statement(cursor, symbol), row)
+
+    def _statement(self, cursor, symbol):
+        with self._lock:
+            entry = self._statements.get(symbol)
+            if entry is not None:
+                self._statements.move_to_end(symbol)
+                return entry[1]
+
+            self._counter += 1
+            name = f"{self.prefix}_{self._counter}"
+            placeholders = ', '.join(f'${i}' for i in range(1, len(self.columns) + 1))
+            cursor.execute(
+                f"PREPARE {name} AS INSERT INTO {sanitize_table_name(symbol)} "
+                f"({', '.join(self.columns)}) VALUES ({placeholders})"
+            )
+            self.prepared += 1
+
+            sql = f"EXECUTE {name} ({self._execute_args})"
+            self._statements[symbol] = (name, sql)
+            if len(self._statements) > self.maxsize:
+                _, (evicted_name, _) = self._statements.popitem(last=False)
+                cursor.execute(f"DEALLOCATE {evicted_name}")
+                self.evicted += 1
+            return sql
+
+    def stats(self):
+        return {'cached': len(self._statements), 'prepared': self.prepared, 'evicted': self.evicted}
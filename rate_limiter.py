@@ -0,0 +1,112 @@
+import asyncio
+import time
+from collections import deque
+
+# HTTP status / Fyers error codes returned when the request limit is hit
+RATE_LIMIT_CODES = (429, -429)
+
+
+def is_rate_limited(response, status=None):
+    """True when a history response (decoded JSON dict) reports the request limit"""
+    if status == 429:
+        return True
+    if not isinstance(response, dict) or response.get('s') == 'ok':
+        return False
+    if response.get('code') in RATE_LIMIT_CODES:
+        return True
+    message = str(response.get('message', '')).lower()
+    return 'limit' in message and ('request' in message or 'rate' in message)
+
+
+class RateLimiter:
+    """
+    Shared asyncio rate limiter for the history API.
+
+    Requests must fit two windows: a token bucket refilled at the current
+    per-second rate (burst of one second's worth), and a rolling window of
+    at most per_minute requests in any 60 seconds. Every chunk fetch calls
+    acquire() first, so the budget is global rather than per task.
+
+    The per-second rate adapts: a rate-limit response halves it (down to
+    min_rate) and pauses all callers with exponential backoff, and each
+    successful response raises it again by recovery_step until it is back
+    at per_second.
+    """
+
+    def __init__(self, per_second=10, per_minute=200, min_rate=1.0,
+                 recovery_step=0.1, base_backoff=1.0, max_backoff=60.0):
+        self.per_second = per_second
+        self.per_minute = per_minute
+        self.min_rate = min_rate
+        self.recovery_step = recovery_step
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self.rate = float(per_second)
+        self._tokens = float(per_second)
+        self._refilled_at = time.monotonic()
+        self._window = deque()
+        self._paused_until = 0.0
+        self._backoff = base_backoff
+        self._lock = None
+        self._stats = {'acquired': 0, 'waited_seconds': 0.0, 'rate_limited': 0}
+
+    def _refill(self, now):
+        self._tokens = min(self.rate, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _delay(self, now):
+        """Seconds until a request may be sent, 0 if one may be sent now"""
+        delay = max(0.0, self._paused_until - now)
+        while self._window and now - self._window[0] >= 60:
+            self._window.popleft()
+        if len(self._window) >= self.per_minute:
+            delay = max(delay, 60 - (now - self._window[0]))
+        self._refill(now)
+        if self._tokens < 1:
+            delay = max(delay, (1 - self._tokens) / self.rate)
+        return delay
+
+    async def acquire(self):
+        """Wait until both windows allow another request, then take it"""
+        # Created lazily so the lock binds to the running event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            started = time.monotonic()
+            while True:
+                now = time.monotonic()
+                delay = self._delay(now)
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            self._tokens -= 1
+            self._window.append(now)
+            self._stats['acquired'] += 1
+            self._stats['waited_seconds'] += now - started
+
+    def record_success(self):
+        """Recover the per-second rate after a request that was not throttled"""
+        self._backoff = self.base_backoff
+        if self.rate < self.per_second:
+            self.rate = min(self.per_second, self.rate + self.recovery_step)
+
+    def record_rate_limited(self, retry_after=None):
+        """Halve the per-second rate and pause all callers after a rate-limit response"""
+        self._stats['rate_limited'] += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+        self._tokens = min(self._tokens, 0.0)
+        pause = retry_after if retry_after is not None else self._backoff
+        self._paused_until = max(self._paused_until, time.monotonic() + pause)
+        self._backoff = min(self.max_backoff, self._backoff * 2)
+        return pause
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats['rate'] = self.rate
+        return stats
+
+    def format_stats(self):
+        stats = self.stats()
+        return (f"{stats['acquired']} requests, {stats['rate_limited']} rate limited, "
+                f"{stats['waited_seconds']:.1f} s waited, current rate {stats['rate']:.1f}/s")
@@ -0,0 +1,150 @@
+import time
+from array import array
+from multiprocessing import resource_tracker, shared_memory
+
+from tick_writer import TICK_COLUMNS
+
+# Every numeric tick field; the message type string is not kept
+SNAPSHOT_COLUMNS = tuple(column for column in TICK_COLUMNS if column != 'type')
+
+DEPTH_LEVELS = 5
+
+_SEQ_SIZE = 8
+_VALUE_SIZE = 8
+
+
+def attach_shared_memory(name):
+    """
+    Open an existing shared memory block without taking ownership of it.
+
+    Before Python 3.13 every process that opens a block registers it with
+    its own resource tracker, which unlinks the block when that process
+    exits, pulling it from under the creator and other readers.
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
+
+
+class SnapshotStore:
+    """
+    Latest value of every tick field for a fixed set of symbols.
+
+    Values live in one float64 buffer laid out column by column (all
+    symbols' ltp, then all symbols' vol_traded_today, ...), so a field
+    across every symbol is a contiguous slice (column()) and a single
+    field lookup is one index computation. Fields never received read
+    as NaN.
+
+    update() is meant to be called from one thread, the websocket
+    callback. Readers never take a lock: a single field is one aligned
+    8-byte load, and multi-field reads (snapshot(), depth()) use a
+    per-symbol sequence counter (a seqlock). The writer makes it odd
+    while a message is being applied and even again afterwards, and a
+    reader retries if the counter was odd or changed under it.
+
+    With shm_name the buffer is a named multiprocessing.shared_memory
+    block that other processes open with SnapshotStore.attach(shm_name,
+    symbols) and read the same way.
+    """
+
+    def __init__(self, symbols, columns=SNAPSHOT_COLUMNS, shm_name=None, _attach=False):
+        self.symbols = tuple(symbols)
+        self.columns = tuple(columns)
+        self.rows = {symbol: row for row, symbol in enumerate(self.symbols)}
+        # Start of each column in the value buffer; a field's slot is offsets[field] + row
+        count = len(self.symbols)
+        self.offsets = {column: position * count for position, column in enumerate(self.columns)}
+
+        size = count * _SEQ_SIZE + count * len(self.columns) * _VALUE_SIZE
+        self.shm = None
+        if shm_name:
+            if _attach:
+                self.shm = attach_shared_memory(shm_name)
+            else:
+                self.shm = shared_memory.SharedMemory(name=shm_name, create=True, size=size)
+            buffer = self.shm.buf
+        else:
+            buffer = memoryview(bytearray(size))
+        self.owner = not _attach
+
+        self._seq = buffer[:count * _SEQ_SIZE].cast('Q')
+        self._values = buffer[count * _SEQ_SIZE:size].cast('d')
+        if self.owner:
+            self._values[:] = array('d', [float('nan')]) * (count * len(self.columns))
+        self.updates = 0
+        self.ignored = 0
+
+    @classmethod
+    def attach(cls, shm_name, symbols, columns=SNAPSHOT_COLUMNS):
+        """Open a store exported by another process; symbols and columns must match the writer's"""
+        return cls(symbols, columns, shm_name=shm_name, _attach=True)
+
+    def update(self, message):
+        """Apply a websocket message; returns False for symbols outside the store"""
+        row = self.rows.get(message.get('symbol'))
+        if row is None:
+            self.ignored += 1
+            return False
+
+        seq = self._seq
+        values = self._values
+        offsets = self.offsets
+        seq[row] += 1
+        for field, value in message.items():
+            offset = offsets.get(field)
+            if offset is not None and value is not None:
+                values[offset + row] = value
+        seq[row] += 1
+        self.updates += 1
+        return True
+
+    def get(self, symbol, field):
+        """Latest value of one field (NaN if not received yet)"""
+        return self._values[self.offsets[field] + self.rows[symbol]]
+
+    def column(self, field):
+        """Zero-copy view of field for every symbol, in self.symbols order"""
+        start = self.offsets[field]
+        return self._values[start:start + len(self.symbols)]
+
+    def snapshot(self, symbol, fields=None):
+        """Consistent {field: value} for symbol as of its last applied message"""
+        fields = self.columns if fields is None else fields
+        slots = [self.offsets[field] + self.rows[symbol] for field in fields]
+        return dict(zip(fields, self._read(self.rows[symbol], slots)))
+
+    def depth(self, symbol, levels=DEPTH_LEVELS):
+        """Consistent 5-level book: {'bids': [(price, size, orders), ...], 'asks': [...]}"""
+        row = self.rows[symbol]
+        offsets = self.offsets
+        slots = [
+            offsets[f'{side}_{field}{level}'] + row
+            for side in ('bid', 'ask')
+            for level in range(1, levels + 1)
+            for field in ('price', 'size', 'order')
+        ]
+        values = self._read(row, slots)
+        book = [tuple(values[i:i + 3]) for i in range(0, len(values), 3)]
+        return {'bids': book[:levels], 'asks': book[levels:]}
+
+    def _read(self, row, slots):
+        seq = self._seq
+        values = self._values
+        while True:
+            start = seq[row]
+            if not start & 1:
+                result = [values[slot] for slot in slots]
+                if seq[row] == start:
+                    return result
+            # The writer is mid-update; let it run
+            time.sleep(0)
+
+    def close(self):
+        """Release the buffer; the owner of a shared-memory store also unlinks it"""
+        self._seq.release()
+        self._values.release()
+        if self.shm is not None:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
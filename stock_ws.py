@@ -4,52 +4,39 @@ from psycopg2 import Error
 from fyers_apiv3.FyersWebsocket import data_ws
 from datetime import datetime
 import os
-import json
-import requests
+import logging
+from symbol_master import SymbolMasterCache
+from tick_writer import BatchedTickWriter, TICK_COLUMNS
+from tick_record import TickLayout
+from tick_dedup import DeltaFilter
+from snapshot_store import SnapshotStore
+from tick_bus import TickBusReader
+from bar_builder import BarBuilder, BarWriter, candle_db_config
+from subscription_shards import ShardedDataSocket
+from subscribe_scheduler import SubscriptionScheduler, unsubscribe_symbols
+from subscription_tiers import TieringPolicy
+from tick_pipeline import TickPipeline
+from live_ingest import LiveIngestService
+from partitioned_ticks import PartitionedTickStore, PARTITIONED_TICK_COLUMNS
+from prepared_inserts import PreparedInsertCache, sanitize_table_name
 
 class SymbolManager:
     def __init__(self):
         self.symbol_dir = "api/symbol"
         os.makedirs(self.symbol_dir, exist_ok=True)
+        self.cache = SymbolMasterCache(self.symbol_dir)
         
     def download_symbol_file(self):
-        """Download the symbol master file"""
-        url = "https://public.fyers.in/sym_details/NSE_CM_sym_master.json"
-        symbol_path = os.path.join(self.symbol_dir, "NSE_CM_sym_master.json")
-        
+        """Return the symbol master file, downloading it only when it has changed"""
         try:
-            print("Downloading symbol master file...")
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            content = response.text
-            content = content.strip()
-            if content.endswith(','):
-                content = content[:-1]
-            
-            if not content.startswith('{'):
-                content = '{' + content
-            if not content.endswith('}'):
-                content = content + '}'
-            
-            with open(symbol_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            
-            print("Symbol master file downloaded and cleaned successfully")
-            return symbol_path
-            
+            return self.cache.path('NSE_CM')
         except Exception as e:
             raise Exception(f"Error downloading symbol file: {str(e)}")
 
     def read_symbol_list(self):
-        """Read and parse the local symbol master file"""
+        """Read the equity symbols from the cached symbol master snapshot"""
         try:
-            local_file = self.download_symbol_file()
-            
-            with open(local_file, 'r') as f:
-                data = json.load(f)
-            
-            equity_symbols = [symbol for symbol in data.keys() if symbol.endswith('-EQ')]
+            equity_symbols = self.cache.symbols('NSE_CM', '-EQ')
             
             print(f"Found {len(equity_symbols)} equity symbols")
             if equity_symbols:
@@ -61,63 +48,101 @@ class SymbolManager:
             raise Exception(f"Error reading symbol list: {str(e)}")
 
 class DatabaseManager:
-    def __init__(self, ini_path):
+    def __init__(self, ini_path, batch_writes=True, batch_size=5000, flush_interval=1.0,
+                 storage_mode='per_symbol', ingest='psycopg2', dedup=None):
         self.config = self._read_config(ini_path)
         self.connection = None
         self.setup_database()
+        # Latest merged sf/dp fields per symbol, held as fixed-layout tick records
+        self.layout = TickLayout(TICK_COLUMNS)
         self.data_cache = {}
+        # TieringPolicy deciding which symbols are subscribed to depth; None means all of them
+        self.tiers = None
+        # 'skip' drops rows that repeat the last persisted one, 'delta' also NULLs unchanged fields
+        self.dedup = DeltaFilter(TICK_COLUMNS, mode=dedup) if dedup else None
+        # Per-symbol INSERTs are prepared once on the server and then only executed
+        self.inserts = PreparedInsertCache(self.connection, TICK_COLUMNS)
+        # 'per_symbol' keeps one table per symbol, 'partitioned' writes every
+        # symbol into a single day-partitioned ticks table
+        self.storage_mode = storage_mode
+        self.partitioned_store = None
+        if storage_mode == 'partitioned':
+            self.partitioned_store = PartitionedTickStore(self.connection)
+        elif storage_mode != 'per_symbol':
+            raise Exception(f"Unknown storage mode: {storage_mode}")
+        # 'psycopg2' writes from the tick pipeline workers; 'asyncpg' writes through
+        # the LiveIngestService event loop and its connection pool
+        self.ingest = ingest
+        self.writer = None
+        columns = PARTITIONED_TICK_COLUMNS if self.partitioned_store else TICK_COLUMNS
+        if ingest == 'asyncpg':
+            self.writer = LiveIngestService(
+                self.connect_params(),
+                columns=columns,
+                max_rows=batch_size,
+                flush_interval=flush_interval
+            )
+        elif ingest != 'psycopg2':
+            raise Exception(f"Unknown ingest mode: {ingest}")
+        elif batch_writes:
+            # Ticks are buffered and COPY'd in batches on a dedicated connection
+            self.writer = BatchedTickWriter(
+                self._connect(self.config['database']),
+                columns=columns,
+                max_rows=batch_size,
+                flush_interval=flush_interval
+            )
 
     def _read_config(self, ini_path):
         config = configparser.ConfigParser()
         config.read(ini_path)
         return config['postgresql']
 
+    def connect_params(self):
+        """Connection settings from the ini file as keyword arguments for asyncpg"""
+        return {
+            'host': self.config['host'],
+            'port': int(self.config['port']),
+            'user': self.config['user'],
+            'password': self.config['password'],
+            'database': self.config['database']
+        }
+
+    def _connect(self, database):
+        return psycopg2.connect(
+            host=self.config['host'],
+            port=self.config['port'],
+            user=self.config['user'],
+            password=self.config['password'],
+            database=database
+        )
+
     def setup_database(self):
         try:
-            self.connection = psycopg2.connect(
-                host=self.config['host'],
-                port=self.config['port'],
-                user=self.config['user'],
-                password=self.config['password'],
-                database=self.config['database']
-            )
+            self.connection = self._connect(self.config['database'])
         except psycopg2.OperationalError:
-            temp_conn = psycopg2.connect(
-                host=self.config['host'],
-                port=self.config['port'],
-                user=self.config['user'],
-                password=self.config['password'],
-                database='postgres'
-            )
+            temp_conn = self._connect('postgres')
             temp_conn.autocommit = True
             with temp_conn.cursor() as cursor:
                 cursor.execute(f"CREATE DATABASE {self.config['database']}")
             temp_conn.close()
             
-            self.connection = psycopg2.connect(
-                host=self.config['host'],
-                port=self.config['port'],
-                user=self.config['user'],
-                password=self.config['password'],
-                database=self.config['database']
-            )
+            self.connection = self._connect(self.config['database'])
         
         self.connection.autocommit = True
 
-    def create_table(self, symbol):
-        # Sanitize the table name: replace special characters with underscores
-        table_name = (
-            symbol
-            .replace(':', '_')
-            .replace('-', '_')
-            .replace('&', '_')
-            .replace(' ', '_')
-            # Add any other special characters that need to be replaced
-        )
+    def create_tables(self, symbols):
+        """Create the storage for all symbols according to the storage mode"""
+        if self.partitioned_store:
+            self.partitioned_store.create_schema()
+            self.partitioned_store.register_symbols(symbols)
+            return
         
-        # Ensure table name starts with a letter or underscore
-        if not table_name[0].isalpha() and table_name[0] != '_':
-            table_name = 'symbol_' + table_name
+        for symbol in symbols:
+            self.create_table(symbol)
+
+    def create_table(self, symbol):
+        table_name = sanitize_table_name(symbol)
         
         with self.connection.cursor() as cursor:
             cursor.execute(f"""
@@ -160,79 +185,58 @@ class DatabaseManager:
             """)
 
     def update_cache_and_insert(self, data, symbol, update_type):
-        if symbol not in self.data_cache:
-            self.data_cache[symbol] = {'symbol': symbol}
+        record = self.data_cache.get(symbol)
+        if record is None:
+            record = self.data_cache[symbol] = self.layout.record(symbol)
             
-        self.data_cache[symbol].update(data)
+        record.update(data)
         
-        if self.has_required_fields(self.data_cache[symbol]):
-            self.insert_combined_data(self.data_cache[symbol], symbol)
-            self.data_cache[symbol] = {'symbol': symbol}
+        needs_depth = self.tiers is None or self.tiers.is_hot(symbol)
+        if self.has_required_fields(record, needs_depth):
+            row = record.take()
+            if self.dedup:
+                row = self.dedup.filter(symbol, row)
+            if row is not None:
+                self.insert_combined_data(row, symbol)
 
-    def has_required_fields(self, data):
+    def has_required_fields(self, data, needs_depth=True):
+        """Market fields, plus depth fields for symbols subscribed to depth"""
         market_fields = ['ltp', 'vol_traded_today', 'last_traded_time']
         depth_fields = ['bid_price1', 'ask_price1', 'bid_size1']
         
         has_market = any(field in data for field in market_fields)
         has_depth = any(field in data for field in depth_fields)
         
-        return has_market and has_depth
+        return has_market and (has_depth or not needs_depth)
 
-    def insert_combined_data(self, data, symbol):
-        table_name = symbol.replace(':', '_').replace('-', '_')
+    def insert_combined_data(self, row, symbol):
+        """Write one tick row (values in TICK_COLUMNS order) for symbol"""
+        if self.partitioned_store:
+            if isinstance(self.writer, LiveIngestService):
+                self.writer.add_partitioned(self.partitioned_store, symbol, row)
+            elif self.writer:
+                self.writer.add(self.partitioned_store.table, self.partitioned_store.row_key(symbol) + tuple(row))
+            else:
+                with self.connection.cursor() as cursor:
+                    self.partitioned_store.insert(cursor, symbol, row, TICK_COLUMNS)
+            return
         
-        with self.connection.cursor() as cursor:
-            cursor.execute(f"""
-                INSERT INTO {table_name} (
-                    ltp, vol_traded_today, last_traded_time, exch_feed_time,
-                    bid_size, ask_size, bid_price, ask_price, last_traded_qty,
-                    tot_buy_qty, tot_sell_qty, avg_trade_price, low_price,
-                    high_price, lower_ckt, upper_ckt, open_price, prev_close_price,
-                    ch, chp, bid_price1, bid_price2, bid_price3, bid_price4, bid_price5,
-                    ask_price1, ask_price2, ask_price3, ask_price4, ask_price5,
-                    bid_size1, bid_size2, bid_size3, bid_size4, bid_size5,
-                    ask_size1, ask_size2, ask_size3, ask_size4, ask_size5,
-                    bid_order1, bid_order2, bid_order3, bid_order4, bid_order5,
-                    ask_order1, ask_order2, ask_order3, ask_order4, ask_order5,
-                    type
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s
-                )
-            """, (
-                data.get('ltp'), data.get('vol_traded_today'),
-                data.get('last_traded_time'), data.get('exch_feed_time'),
-                data.get('bid_size'), data.get('ask_size'),
-                data.get('bid_price'), data.get('ask_price'),
-                data.get('last_traded_qty'), data.get('tot_buy_qty'),
-                data.get('tot_sell_qty'), data.get('avg_trade_price'),
-                data.get('low_price'), data.get('high_price'),
-                data.get('lower_ckt'), data.get('upper_ckt'),
-                data.get('open_price'), data.get('prev_close_price'),
-                data.get('ch'), data.get('chp'),
-                data.get('bid_price1'), data.get('bid_price2'),
-                data.get('bid_price3'), data.get('bid_price4'),
-                data.get('bid_price5'), data.get('ask_price1'),
-                data.get('ask_price2'), data.get('ask_price3'),
-                data.get('ask_price4'), data.get('ask_price5'),
-                data.get('bid_size1'), data.get('bid_size2'),
-                data.get('bid_size3'), data.get('bid_size4'),
-                data.get('bid_size5'), data.get('ask_size1'),
-                data.get('ask_size2'), data.get('ask_size3'),
-                data.get('ask_size4'), data.get('ask_size5'),
-                data.get('bid_order1'), data.get('bid_order2'),
-                data.get('bid_order3'), data.get('bid_order4'),
-                data.get('bid_order5'), data.get('ask_order1'),
-                data.get('ask_order2'), data.get('ask_order3'),
-                data.get('ask_order4'), data.get('ask_order5'),
-                data.get('type')
-            ))
+        if self.writer:
+            self.writer.add(sanitize_table_name(symbol), row)
+            return
+        
+        self.inserts.insert(symbol, row)
 
     def close(self):
+        if isinstance(self.writer, LiveIngestService):
+            self.writer.close()
+            print("Live ingest metrics:", self.writer.metrics())
+        elif self.writer:
+            self.writer.close()
+            print("Batched writer stats:", self.writer.stats.as_dict())
+            self.writer.connection.close()
+        if self.dedup:
+            print("Dedup stats:", self.dedup.stats)
         if self.connection:
             self.connection.close()
 
@@ -246,6 +250,9 @@ def read_access_token():
         raise Exception(f"Error reading access token: {str(e)}")
 
 def main():
+    # Writer, pipeline and subscription reports go through logging
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
     # Create necessary directories
     os.makedirs("api/token", exist_ok=True)
     os.makedirs("api/ini", exist_ok=True)
@@ -263,47 +270,153 @@ def main():
 
     # Initialize managers
     symbol_manager = SymbolManager()
-    db_manager = DatabaseManager('api/ini/stock.ini')
+    db_manager = DatabaseManager(
+        'api/ini/stock.ini',
+        storage_mode='per_symbol',  # Set to 'partitioned' for the single day-partitioned ticks table
+        ingest='psycopg2',  # Set to 'asyncpg' to write through the LiveIngestService event loop
+        dedup='skip'  # 'delta' stores only changed fields, None writes every merged tick
+    )
+    feed = 'socket'  # Set to 'bus' to read ticks from a running feed_handler.py
+    socket_shards = 1  # Data socket connections to spread the subscriptions over
+    live_bars = False  # Build 1s/1m/5m bars into live tables of the aws_historical_db database (needs api/ini/aws_stocks.ini)
 
     # Get symbols and access token
     symbols = symbol_manager.read_symbol_list()
     access_token = read_access_token()
 
-    # Create tables for each symbol
-    for symbol in symbols:
-        symbol_with_prefix = f"{symbol}"
-        db_manager.create_table(symbol_with_prefix)
+    # Create tables for each symbol (or the shared partitioned table)
+    db_manager.create_tables(symbols)
 
-    def onmessage(message):
-        """Handle incoming messages from the WebSocket."""
+    def handle_message(message):
+        """Write a queued tick to the database (runs on a pipeline worker or the ingest loop)."""
         print("Response:", message)
         
-        if message.get('type') in ['cn', 'ful', 'sub']:
-            return
-            
-        symbol = message.get('symbol')
-        if not symbol:
-            return
-            
+        symbol = message['symbol']
         if message.get('type') == 'sf':
             db_manager.update_cache_and_insert(message, symbol, 'market')
         elif message.get('type') == 'dp':
             db_manager.update_cache_and_insert(message, symbol, 'depth')
 
+    # Database writes happen on the pipeline worker or the ingest event loop, never on the socket thread
+    if db_manager.ingest == 'asyncpg':
+        pipeline = None
+        db_manager.writer.start(handle_message)
+        submit = db_manager.writer.submit
+    else:
+        pipeline = TickPipeline(
+            handle_message,
+            maxsize=50000,
+            policy='block',  # 'block', 'drop_oldest' or 'coalesce'
+            workers=1,
+            report_interval=30
+        )
+        submit = pipeline.submit
+
+    # Latest quote and depth per symbol for strategy code; give it an shm_name to
+    # let other processes attach with SnapshotStore.attach()
+    snapshots = SnapshotStore(symbols)
+
+    # Closed bars are upserted into per-symbol live bar tables, next to the backfilled candle tables
+    bars = None
+    if live_bars:
+        bars = BarBuilder()
+        bar_writer = BarWriter(bars, candle_db_config())
+        bar_writer.start()
+
+    # Subscribes in paced batches on every (re)connect, retrying the batches that fail
+    scheduler = SubscriptionScheduler(
+        lambda batch, data_type: fyers.subscribe(symbols=batch, data_type=data_type),
+        lambda batch, data_type: unsubscribe_symbols(fyers, batch, data_type)
+    )
+
+    def retier(promoted, demoted):
+        """Move depth subscriptions to the symbols that are trading now."""
+        print(f"Depth tier: +{len(promoted)} -{len(demoted)} symbols")
+        scheduler.remove({'DepthUpdate': demoted})
+        scheduler.add({'DepthUpdate': promoted})
+
+    # Depth only for the hot tier (pinned symbols plus the most actively traded, starting
+    # with the first hot_size symbols); the rest get SymbolUpdate. Sharded sockets keep
+    # the tier they started with.
+    tiers = None
+    if feed == 'socket':
+        tiers = TieringPolicy(
+            symbols,
+            hot_size=200,
+            pinned=[],  # Symbols that always get depth, e.g. ['NSE:SBIN-EQ']
+            interval=60 if socket_shards == 1 else float('inf'),
+            on_change=retier
+        )
+        db_manager.tiers = tiers
+
+    def onmessage(message):
+        """Handle incoming messages from the WebSocket."""
+        if message.get('type') in ['sub', 'unsub']:
+            scheduler.on_ack(message)
+            return
+        if message.get('type') in ['cn', 'ful']:
+            return
+            
+        if not message.get('symbol'):
+            return
+            
+        if tiers:
+            tiers.record(message)
+        snapshots.update(message)
+        if bars:
+            bars.update(message)
+        submit(message)
+
     def onopen():
         """Subscribe to data types and symbols upon WebSocket connection."""
-        for data_type in ["SymbolUpdate", "DepthUpdate"]:
-            fyers.subscribe(symbols=[f"{sym}" for sym in symbols], data_type=data_type)
+        scheduler.start(tiers.subscriptions())
         fyers.keep_running()
 
     def onerror(message):
-        """Handle WebSocket errors."""
+        """Handle WebSocket errors; rejected subscriptions go back to the scheduler."""
+        if scheduler.on_error(message):
+            return
         print("Error:", message)
 
     def onclose(message):
         """Handle WebSocket connection close."""
         print("Connection closed:", message)
+        if pipeline:
+            pipeline.close()
+            print("Tick pipeline metrics:", pipeline.metrics())
         db_manager.close()
+        snapshots.close()
+        if bars:
+            bar_writer.close()
+
+    if feed == 'bus':
+        # Consume the ticks a running feed_handler.py publishes instead of opening a socket
+        reader = TickBusReader(symbols=symbols)
+        try:
+            for message in reader.messages():
+                onmessage(message)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            reader.close()
+            onclose("Tick bus reader stopped")
+        return
+
+    if socket_shards > 1:
+        # Spread the subscriptions over several connections, merged back into onmessage
+        sharded = ShardedDataSocket(
+            access_token,
+            tiers.subscriptions(),
+            onmessage,
+            shards=socket_shards
+        )
+        sharded.connect()
+        try:
+            sharded.keep_running()
+        except KeyboardInterrupt:
+            sharded.close()
+            onclose("Sharded sockets closed")
+        return
 
     # Initialize FyersDataSocket
     fyers = data_ws.FyersDataSocket(
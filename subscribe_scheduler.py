@@ -0,0 +1,286 @@
+import logging
+import threading
+import time
+from collections import deque
+
+# Symbols the SDK packs into one subscribe message; each message gets its own ack
+SDK_MESSAGE_SYMBOLS = 1500
+
+# Channel FyersDataSocket.subscribe() and unsubscribe() use unless told otherwise
+SDK_DEFAULT_CHANNEL = 11
+
+
+def unsubscribe_symbols(fyers, symbols, data_type, channel=SDK_DEFAULT_CHANNEL):
+    """
+    Unsubscribe symbols on a FyersDataSocket, whichever subscribe() call added them.
+
+    The SDK skips every symbol token missing from scrips_count[channel],
+    which each subscribe() call resets to the tokens of that call alone.
+    Before unsubscribing, scrips_count is pointed at every token
+    subscribed on the connection (symbol_token), so the symbols are
+    dropped without being subscribed again first.
+    """
+    fyers.scrips_count[channel] = list(fyers.symbol_token)
+    fyers.unsubscribe(symbols=symbols, data_type=data_type, channel=channel)
+
+
+class _Batch:
+    __slots__ = ('data_type', 'symbols', 'unsubscribe', 'attempts', 'sent_at', 'rejected')
+
+    def __init__(self, data_type, symbols, unsubscribe=False):
+        self.data_type = data_type
+        self.symbols = symbols
+        self.unsubscribe = unsubscribe
+        self.attempts = 0
+        self.sent_at = None
+        self.rejected = None
+
+    @property
+    def ack_type(self):
+        return 'unsub' if self.unsubscribe else 'sub'
+
+
+class SubscriptionScheduler:
+    """
+    Subscribe in bounded, paced batches and retry the ones that fail.
+
+    start(subscriptions) is called from onopen, on the first connect and
+    on every reconnect. It splits {data_type: [symbols]} into batches of
+    batch_size and a background thread sends them one at a time, at most
+    one every interval seconds.
+
+    The socket answers each subscribe call with one 'sub' message (and
+    each unsubscribe with one 'unsub' message) that does not name the
+    symbols. To tie every answer to its batch, the next batch is only
+    sent once the previous one was answered or timed out. Errors the SDK
+    reports synchronously from inside subscribe() arrive on the sending
+    thread and are charged to the batch being sent; symbols it reports
+    as invalid are dropped from the batch instead of retried. A batch
+    that is rejected, raises on send or is not answered within
+    ack_timeout seconds is sent again before anything else, up to
+    max_retries times, after which its symbols are reported as failed.
+    An answer arriving after its batch timed out can still be credited
+    to the next batch, so keep ack_timeout well above the round trip.
+    A new start() abandons whatever the previous one had left, since the
+    new connection needs everything again.
+
+    Route 'sub' and 'unsub' messages from on_message to on_ack(), and
+    pass every on_error message through on_error() first.
+
+    add() and remove() change the subscriptions of a live connection
+    through the same paced queue.
+    """
+
+    def __init__(self, subscribe, unsubscribe=None, batch_size=100, interval=0.1,
+                 ack_timeout=5.0, max_retries=3, logger=None):
+        if batch_size > SDK_MESSAGE_SYMBOLS:
+            raise Exception(f"batch_size must be at most {SDK_MESSAGE_SYMBOLS}")
+        self.subscribe = subscribe
+        self.unsubscribe = unsubscribe
+        self.batch_size = batch_size
+        self.interval = interval
+        self.ack_timeout = ack_timeout
+        self.max_retries = max_retries
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._pending = deque()
+        self._awaiting = None  # The batch sent last, until it is answered or times out
+        self._sending = None  # The batch whose subscribe call is running on the scheduler thread
+        self._condition = threading.Condition()
+        self._generation = 0
+        self._started_at = None
+        self._next_send = 0.0
+        self._stopped = False
+        self._thread = None
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self.counters = {'batches': 0, 'sent': 0, 'acked': 0, 'retried': 0, 'unmatched_acks': 0}
+        self.failed = []
+
+    def start(self, subscriptions):
+        """(Re)subscribe everything in subscriptions, dropping any unfinished earlier run"""
+        with self._condition:
+            self._generation += 1
+            self._pending.clear()
+            self._awaiting = None
+            self._reset_counters()
+            self._next_send = 0.0
+            self._enqueue(subscriptions)
+
+    def add(self, subscriptions):
+        """Subscribe more symbols on the current connection"""
+        with self._condition:
+            self._enqueue(subscriptions)
+
+    def remove(self, subscriptions):
+        """Unsubscribe symbols on the current connection, dropping any still waiting to be subscribed"""
+        with self._condition:
+            for batch in self._pending:
+                removed = set(subscriptions.get(batch.data_type, ()))
+                if removed and not batch.unsubscribe:
+                    batch.symbols = [symbol for symbol in batch.symbols if symbol not in removed]
+            self._pending = deque(batch for batch in self._pending if batch.symbols)
+            self._enqueue(subscriptions, unsubscribe=True)
+
+    def _enqueue(self, subscriptions, unsubscribe=False):
+        if not self._pending and self._awaiting is None:
+            self._started_at = time.monotonic()
+        for data_type, symbols in subscriptions.items():
+            for i in range(0, len(symbols), self.batch_size):
+                self._pending.append(_Batch(data_type, list(symbols[i:i + self.batch_size]), unsubscribe))
+                if not unsubscribe:
+                    self.counters['batches'] += 1
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='subscribe-scheduler', daemon=True)
+            self._thread.start()
+        self._condition.notify_all()
+
+    def on_ack(self, message):
+        """Record a 'sub' or 'unsub' answer from the socket against the batch it belongs to"""
+        with self._condition:
+            if self._sending is not None and threading.current_thread() is self._thread:
+                self._on_send_error(self._sending, message)
+                return
+
+            batch = self._awaiting
+            if batch is None:
+                self.counters['unmatched_acks'] += 1
+                return
+            if message.get('type') != batch.ack_type:
+                # Not the kind of answer the awaited batch is waiting for, e.g. a late
+                # answer to a subscribe batch that already timed out
+                return
+            self._awaiting = None
+            if message.get('s') == 'ok':
+                if not batch.unsubscribe:
+                    self.counters['acked'] += 1
+            else:
+                self._retry(batch, message.get('message', message))
+            self._check_done()
+            self._condition.notify_all()
+
+    def on_error(self, message):
+        """
+        Take an on_error message if it answers a subscription; returns False for other errors.
+
+        The SDK reports rejected subscriptions through on_error, either as
+        'sub'/'unsub' messages from the server or, for problems it finds
+        itself, synchronously from inside the subscribe call.
+        """
+        if not isinstance(message, dict):
+            return False
+        with self._condition:
+            sending = self._sending is not None and threading.current_thread() is self._thread
+        if sending or message.get('type') in ('sub', 'unsub'):
+            self.on_ack(message)
+            return True
+        return False
+
+    def _on_send_error(self, batch, message):
+        invalid = message.get('invalid_symbols') if isinstance(message, dict) else None
+        if invalid:
+            # The SDK still subscribes the rest of the batch; retrying cannot fix these
+            invalid = set(invalid)
+            self.failed.extend((batch.data_type, symbol) for symbol in batch.symbols if symbol in invalid)
+            batch.symbols = [symbol for symbol in batch.symbols if symbol not in invalid]
+            self.logger.error(f"Dropping {len(invalid)} invalid {batch.data_type} symbols: {sorted(invalid)}")
+        else:
+            batch.rejected = message.get('message', message) if isinstance(message, dict) else message
+
+    def done(self):
+        with self._condition:
+            return not self._pending and self._awaiting is None
+
+    def close(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                batch = self._next_batch()
+                if self._stopped:
+                    return
+                if batch is None:
+                    continue
+                generation = self._generation
+                self._sending = batch
+
+            error = None
+            try:
+                if batch.unsubscribe:
+                    self.unsubscribe(batch.symbols, batch.data_type)
+                else:
+                    self.subscribe(batch.symbols, batch.data_type)
+            except Exception as e:
+                error = str(e)
+
+            with self._condition:
+                self._sending = None
+                if generation != self._generation or self._awaiting is not batch:
+                    continue
+                error = error or batch.rejected
+                if error is not None or not batch.symbols:
+                    # Nothing will answer a call that failed or had no valid symbols left
+                    self._awaiting = None
+                    if error is not None:
+                        self._retry(batch, error)
+                    self._check_done()
+
+    def _next_batch(self):
+        """Wait (with the condition held) until a batch may be sent and mark it as awaited"""
+        now = time.monotonic()
+        if self._awaiting is not None and now - self._awaiting.sent_at > self.ack_timeout:
+            batch, self._awaiting = self._awaiting, None
+            self._retry(batch, 'no acknowledgement')
+            self._check_done()
+
+        if self._pending and self._awaiting is None and now >= self._next_send:
+            batch = self._pending.popleft()
+            batch.attempts += 1
+            batch.sent_at = now
+            batch.rejected = None
+            self._awaiting = batch
+            if not batch.unsubscribe:
+                self.counters['sent'] += 1
+            self._next_send = now + self.interval
+            return batch
+
+        if self._stopped:
+            return None
+        if self._awaiting is not None:
+            timeout = self.ack_timeout - (now - self._awaiting.sent_at)
+        elif self._pending:
+            timeout = self._next_send - now
+        else:
+            timeout = None
+        self._condition.wait(None if timeout is None else max(timeout, 0))
+        return None
+
+    def _retry(self, batch, reason):
+        if batch.attempts <= self.max_retries:
+            self.counters['retried'] += 1
+            # Ahead of everything else, so a late answer can only be credited to this same batch
+            self._pending.appendleft(batch)
+            self.logger.warning(f"{self._action(batch)} {batch.data_type} batch of {len(batch.symbols)} "
+                                 f"failed ({reason}), retrying")
+        else:
+            if not batch.unsubscribe:
+                self.failed.extend((batch.data_type, symbol) for symbol in batch.symbols)
+            self.logger.error(f"Giving up on {self._action(batch).lower()} {batch.data_type} batch of "
+                               f"{len(batch.symbols)} after {batch.attempts} attempts: {reason}")
+
+    def _action(self, batch):
+        return 'Unsubscribe' if batch.unsubscribe else 'Subscribe'
+
+    def _check_done(self):
+        if not self._pending and self._awaiting is None:
+            self.logger.info(
+                f"Subscribed {self.counters['acked']}/{self.counters['batches']} batches in "
+                f"{time.monotonic() - self._started_at:.1f}s "
+                f"({self.counters['retried']} retries, {len(self.failed)} symbols failed)"
+            )
@@ -0,0 +1,211 @@
+"""
+Spread data socket subscriptions over several connections.
+
+fyers_apiv3's FyersDataSocket is a process-wide singleton: its __new__
+returns the one existing instance, and constructing it again re-runs
+__init__ on that instance. Every shard therefore runs its socket in a
+process of its own.
+"""
+import heapq
+import math
+import multiprocessing
+import queue
+import threading
+
+from fyers_apiv3.FyersWebsocket import data_ws
+
+from subscribe_scheduler import SubscriptionScheduler
+
+# Symbol subscriptions (symbol x data type) one data socket connection accepts
+SYMBOL_LIMIT_PER_CONNECTION = 5000
+
+# Relative message rate of each data type, used to balance shards
+DATA_TYPE_WEIGHTS = {'SymbolUpdate': 1.0, 'DepthUpdate': 2.0}
+
+
+class Shard:
+    """The subscriptions one connection carries and their expected message rate"""
+
+    def __init__(self, index):
+        self.index = index
+        self.subscriptions = {}  # data_type -> [symbols]
+        self.load = 0.0
+        self.count = 0
+
+    def add(self, symbol, data_types, load):
+        for data_type in data_types:
+            self.subscriptions.setdefault(data_type, []).append(symbol)
+        self.load += load
+        self.count += len(data_types)
+
+    def __repr__(self):
+        return f"Shard({self.index}, subscriptions={self.count}, load={self.load:.1f})"
+
+
+def plan_shards(subscriptions, shards=1, rates=None, limit=SYMBOL_LIMIT_PER_CONNECTION):
+    """
+    Split {data_type: [symbols]} across connections, balanced by expected message rate.
+
+    A symbol's load is the sum of its data types' DATA_TYPE_WEIGHTS times
+    rates.get(symbol, 1.0), so observed per-symbol message rates can be
+    fed back in. All data types of a symbol go to the same shard, which
+    keeps each symbol's ticks in order on one connection. Symbols are
+    placed heaviest first on the least-loaded shard with room (greedy
+    longest-processing-time), and the shard count is raised if needed to
+    keep every connection within limit subscriptions.
+    """
+    rates = rates or {}
+    data_types = {}
+    for data_type, symbols in subscriptions.items():
+        for symbol in symbols:
+            data_types.setdefault(symbol, []).append(data_type)
+
+    total = sum(len(types) for types in data_types.values())
+    shards = max(shards, math.ceil(total / limit), 1)
+    plan = [Shard(i) for i in range(shards)]
+
+    weighted = sorted(
+        (
+            (sum(DATA_TYPE_WEIGHTS.get(data_type, 1.0) for data_type in types) * rates.get(symbol, 1.0), symbol)
+            for symbol, types in data_types.items()
+        ),
+        reverse=True
+    )
+    heap = [(0.0, shard.index) for shard in plan]
+    for load, symbol in weighted:
+        types = data_types[symbol]
+        # Shards without room for this symbol leave the heap; open another if none is left
+        while heap and plan[heap[0][1]].count + len(types) > limit:
+            heapq.heappop(heap)
+        if heap:
+            shard = plan[heapq.heappop(heap)[1]]
+        else:
+            shard = Shard(len(plan))
+            plan.append(shard)
+        shard.add(symbol, types, load)
+        heapq.heappush(heap, (shard.load, shard.index))
+    return plan
+
+
+def _run_socket(access_token, shard, on_message, socket_kwargs):
+    """
+    Open one data socket for shard and subscribe it through a SubscriptionScheduler.
+
+    Only one per process: FyersDataSocket always returns the same instance.
+    """
+    scheduler = SubscriptionScheduler(
+        lambda batch, data_type: fyers.subscribe(symbols=batch, data_type=data_type)
+    )
+
+    def onmessage(message):
+        if message.get('type') in ['sub', 'unsub']:
+            scheduler.on_ack(message)
+        else:
+            on_message(message)
+
+    def onopen():
+        scheduler.start(shard.subscriptions)
+        fyers.keep_running()
+
+    def onerror(message):
+        if scheduler.on_error(message):
+            return
+        print(f"Shard {shard.index} error:", message)
+
+    def onclose(message):
+        print(f"Shard {shard.index} connection closed:", message)
+
+    fyers = data_ws.FyersDataSocket(
+        access_token=access_token,
+        on_connect=onopen,
+        on_close=onclose,
+        on_error=onerror,
+        on_message=onmessage,
+        **socket_kwargs
+    )
+    fyers.connect()
+    return fyers
+
+
+def _run_shard_process(access_token, shard, output, socket_kwargs):
+    fyers = _run_socket(access_token, shard, output.put, socket_kwargs)
+    fyers.keep_running()
+
+
+class ShardedDataSocket:
+    """
+    Spread subscriptions over several data socket connections and merge them.
+
+    Each shard from plan_shards() gets its own FyersDataSocket in its own
+    process. FyersDataSocket is a singleton (__new__ hands back the one
+    instance of the process), so several sockets in one process would all
+    be the same connection, re-initialised by every shard. A process per
+    shard also moves the websocket decoding onto another core; messages
+    come back through a multiprocessing queue that one merge thread
+    drains, calling on_message for each message. Consumers therefore see
+    one serialized stream with each symbol's ticks in arrival order,
+    exactly as with a single socket.
+
+    Shard processes are started with the spawn method: by the time
+    connect() runs, the caller has threads and open database connections,
+    which a forked child would inherit in whatever state they were in.
+    A shard process only holds its socket; everything the caller does
+    with the messages, database writes included, stays in the parent.
+    """
+
+    def __init__(self, access_token, subscriptions, on_message, shards=1,
+                 rates=None, limit=SYMBOL_LIMIT_PER_CONNECTION, **socket_kwargs):
+        self.access_token = access_token
+        self.on_message = on_message
+        self.socket_kwargs = dict(
+            {'log_path': "", 'litemode': False, 'write_to_file': False, 'reconnect': True},
+            **socket_kwargs
+        )
+        self.plan = plan_shards(subscriptions, shards, rates, limit)
+        self._context = multiprocessing.get_context('spawn')
+        self.output = self._context.Queue()
+        self.processes = []
+        self._merger = None
+        self._stopped = threading.Event()
+
+    def connect(self):
+        """Open every shard's connection and start merging their messages"""
+        for shard in self.plan:
+            print(f"Connecting {shard}")
+        self._merger = threading.Thread(target=self._merge, name='shard-merge', daemon=True)
+        self._merger.start()
+
+        for shard in self.plan:
+            process = self._context.Process(
+                target=_run_shard_process,
+                args=(self.access_token, shard, self.output, self.socket_kwargs),
+                name=f'data-shard-{shard.index}',
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+
+    def keep_running(self):
+        """Block until close() is called"""
+        while not self._stopped.wait(1):
+            pass
+
+    def _merge(self):
+        while not self._stopped.is_set():
+            try:
+                message = self.output.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.on_message(message)
+            except Exception as e:
+                print(f"Error handling sharded message: {str(e)}")
+
+    def close(self):
+        """Close every connection and stop the merge thread"""
+        for process in self.processes:
+            process.terminate()
+            process.join()
+        self._stopped.set()
+        if self._merger:
+            self._merger.join()
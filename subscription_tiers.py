@@ -0,0 +1,102 @@
+import threading
+import time
+
+
+class TieringPolicy:
+    """
+    Decide which symbols get market depth, from their observed trading.
+
+    The hot tier gets SymbolUpdate and DepthUpdate; everything else only
+    SymbolUpdate, which still carries the quote fields the tick tables
+    need. pinned symbols are always hot. The remaining hot_size - pinned
+    slots go to the most active symbols, measured as the number of
+    SymbolUpdates in which vol_traded_today increased, decayed by half
+    every evaluation interval.
+
+    Until the first evaluation the hot tier is seeded from seed, e.g. the
+    ranking() of a previous session, or else from the order of symbols,
+    so depth is subscribed from the start.
+
+    record() sees every message. Every interval seconds it re-ranks the
+    symbols and calls on_change(promoted, demoted). A hot symbol is only
+    demoted once it drops below rank hot_size * (1 + hysteresis), and a
+    symbol ranked within hot_size is only promoted into a free slot, so
+    symbols near the boundary do not flap between tiers; on equal
+    activity the hot symbol ranks first.
+    """
+
+    def __init__(self, symbols, hot_size=200, pinned=(), interval=60.0, hysteresis=0.25, on_change=None,
+                 seed=None):
+        self.symbols = list(symbols)
+        self.hot_size = hot_size
+        self.pinned = set(pinned)
+        self.interval = interval
+        self.hysteresis = hysteresis
+        self.on_change = on_change
+
+        self.activity = dict.fromkeys(self.symbols, 0.0)
+        self.hot = set(self.pinned)
+        for symbol in (self.symbols if seed is None else seed):
+            if len(self.hot) >= hot_size:
+                break
+            if symbol in self.activity:
+                self.hot.add(symbol)
+        self.promotions = 0
+        self.demotions = 0
+        self._volume = {}
+        self._next_evaluation = time.monotonic() + interval
+        self._lock = threading.Lock()
+
+    def is_hot(self, symbol):
+        return symbol in self.hot
+
+    def ranking(self):
+        """Symbols from most to least active, hot ones first on ties; a seed for the next session"""
+        return sorted(self.symbols, key=lambda symbol: (self.activity[symbol], symbol in self.hot), reverse=True)
+
+    def subscriptions(self):
+        """Current {data_type: [symbols]} for (re)subscribing a connection"""
+        return {
+            'SymbolUpdate': self.symbols,
+            'DepthUpdate': [symbol for symbol in self.symbols if symbol in self.hot]
+        }
+
+    def record(self, message):
+        """Count a trade when a SymbolUpdate's traded volume grew, and re-tier when due"""
+        volume = message.get('vol_traded_today')
+        if volume is not None:
+            symbol = message.get('symbol')
+            previous = self._volume.get(symbol)
+            self._volume[symbol] = volume
+            if previous is not None and volume > previous and symbol in self.activity:
+                self.activity[symbol] += 1
+
+        if time.monotonic() >= self._next_evaluation:
+            self.rebalance()
+
+    def rebalance(self):
+        """Re-rank symbols by activity; returns (promoted, demoted)"""
+        with self._lock:
+            self._next_evaluation = time.monotonic() + self.interval
+            ranked = [symbol for symbol in self.ranking() if symbol not in self.pinned]
+            slots = max(self.hot_size - len(self.pinned), 0)
+            keep = int(slots * (1 + self.hysteresis))
+            wanted = {symbol for symbol in ranked[:slots] if self.activity[symbol] > 0}
+            tolerated = set(ranked[:keep])
+
+            demoted = [symbol for symbol in self.hot - self.pinned if symbol not in tolerated]
+            # The hot tier never grows beyond hot_size; newcomers only take the slots freed above
+            room = self.hot_size - len(self.hot) + len(demoted)
+            promoted = [symbol for symbol in ranked[:slots] if symbol in wanted and symbol not in self.hot]
+            promoted = promoted[:max(room, 0)]
+
+            self.hot.difference_update(demoted)
+            self.hot.update(promoted)
+            self.promotions += len(promoted)
+            self.demotions += len(demoted)
+            for symbol in self.activity:
+                self.activity[symbol] /= 2
+
+        if (promoted or demoted) and self.on_change:
+            self.on_change(promoted, demoted)
+        return promoted, demoted
@@ -0,0 +1,283 @@
+import json
+import os
+import pickle
+import re
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+SYMBOL_MASTER_URLS = {
+    'NSE_CM': "https://public.fyers.in/sym_details/NSE_CM_sym_master.json",
+    'NSE_FO': "https://public.fyers.in/sym_details/NSE_FO_sym_master.json"
+}
+
+# Suffixes the scripts filter on; each gets a pre-built list in the snapshot
+INDEXED_SUFFIXES = ('-EQ', '-INDEX', 'FUT', 'CE', 'PE')
+
+IST = timezone(timedelta(hours=5, minutes=30))
+SNAPSHOT_VERSION = 1
+
+
+_KEY_RE = re.compile(r'\s*"((?:[^"\\]|\\.)*)"\s*:\s*')
+_SEPARATOR_RE = re.compile(r'[\s,]*')
+
+
+def _skip_flat_object(buffer, start):
+    """
+    Return the end of the object starting at buffer[start] without decoding it.
+
+    Only handles objects with no nested objects and no escapes, where the
+    first '}' outside a string closes the object; returns -1 otherwise so
+    the caller can fall back to a full decode. Uses str.find/count, which
+    run at C speed, instead of walking characters in Python.
+    """
+    if not buffer.startswith('{', start):
+        return -1
+    close = buffer.find('}', start)
+    if close == -1:
+        return -1
+    body = buffer[start + 1:close]
+    if '{' in body or '\\' in body or body.count('"') % 2:
+        return -1
+    return close + 1
+
+
+def iter_symbol_master(path, suffixes=None, fields=None, chunk_size=1 << 20):
+    """
+    Stream the top-level entries of a symbol master file without loading it.
+
+    Yields the symbol key for every entry whose key ends with one of
+    suffixes (all entries when suffixes is None). When fields is given,
+    yields (symbol, {field: value}) with only those fields of the entry.
+    The file is read in chunk_size pieces and only one entry is decoded
+    at a time, so memory use does not grow with the size of the master.
+    Missing outer braces and a trailing comma are tolerated.
+    """
+    if isinstance(suffixes, str):
+        suffixes = (suffixes,)
+    suffixes = tuple(suffixes) if suffixes else None
+    decoder = json.JSONDecoder()
+
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(chunk_size)
+        eof = len(buffer) < chunk_size
+        pos = _SEPARATOR_RE.match(buffer).end()
+        if buffer.startswith('{', pos):
+            pos += 1
+
+        while True:
+            pos = _SEPARATOR_RE.match(buffer, pos).end()
+            match = _KEY_RE.match(buffer, pos)
+            if match is not None:
+                raw_key = match.group(1)
+                key = json.loads(f'"{raw_key}"') if '\\' in raw_key else raw_key
+                wanted = suffixes is None or key.endswith(suffixes)
+                end = -1 if wanted and fields is not None else _skip_flat_object(buffer, match.end())
+                if end == -1:
+                    try:
+                        value, end = decoder.raw_decode(buffer, match.end())
+                    except json.JSONDecodeError:
+                        if eof:
+                            raise
+                        match = None
+
+            if match is None:
+                if eof:
+                    rest = buffer[pos:].strip()
+                    if rest and rest != '}':
+                        raise ValueError(f"Unexpected content in symbol master near: {rest[:50]!r}")
+                    return
+                # The next entry is split across chunks; read more and decode it again
+                more = f.read(chunk_size)
+                eof = len(more) < chunk_size
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+
+            if wanted:
+                if fields is None:
+                    yield key
+                else:
+                    yield key, {field: value.get(field) for field in fields}
+            pos = end
+
+
+class SymbolMasterCache:
+    """
+    Local cache of the Fyers symbol master files.
+
+    For every segment the cache keeps the cleaned JSON, a small metadata file
+    with the ETag/Last-Modified of the last download, and a pickled snapshot
+    holding the symbol list plus a pre-built index by suffix.
+
+    Freshness policy: a snapshot checked after today's refresh time (IST) is
+    used without touching the network. Otherwise the file is revalidated
+    with If-None-Match/If-Modified-Since and only re-downloaded and
+    re-indexed when the server reports a change. If revalidation fails the
+    existing snapshot is used.
+    """
+
+    def __init__(self, cache_dir="api/symbol", refresh_hour=8):
+        self.cache_dir = cache_dir
+        self.refresh_hour = refresh_hour
+        self._snapshots = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def json_path(self, segment):
+        return os.path.join(self.cache_dir, f"{segment}_sym_master.json")
+
+    def _meta_path(self, segment):
+        return os.path.join(self.cache_dir, f"{segment}_sym_master.meta.json")
+
+    def _snapshot_path(self, segment):
+        return os.path.join(self.cache_dir, f"{segment}_sym_master.snapshot")
+
+    def path(self, segment):
+        """Return the path of an up-to-date cleaned JSON master for the segment"""
+        self.load(segment)
+        return self.json_path(segment)
+
+    def symbols(self, segment, suffixes):
+        """Return the symbols of a segment ending with any of the given suffixes"""
+        snapshot = self.load(segment)
+        if isinstance(suffixes, str):
+            suffixes = (suffixes,)
+
+        if all(suffix in snapshot['index'] for suffix in suffixes):
+            if len(suffixes) == 1:
+                return list(snapshot['index'][suffixes[0]])
+            # Keep master file order when combining several suffixes
+            wanted = set()
+            for suffix in suffixes:
+                wanted.update(snapshot['index'][suffix])
+            return [symbol for symbol in snapshot['symbols'] if symbol in wanted]
+
+        suffixes = tuple(suffixes)
+        return [symbol for symbol in snapshot['symbols'] if symbol.endswith(suffixes)]
+
+    def load(self, segment):
+        """Return the snapshot for a segment, refreshing it if it is stale"""
+        snapshot = self._snapshots.get(segment)
+        if snapshot is None or not self._is_fresh(snapshot['checked_at']):
+            snapshot = self._refresh(segment)
+            self._snapshots[segment] = snapshot
+        return snapshot
+
+    def _refresh_boundary(self, now):
+        boundary = now.replace(hour=self.refresh_hour, minute=0, second=0, microsecond=0)
+        if now < boundary:
+            boundary -= timedelta(days=1)
+        return boundary
+
+    def _is_fresh(self, checked_at):
+        now = datetime.now(IST)
+        return checked_at >= self._refresh_boundary(now)
+
+    def _read_snapshot(self, segment):
+        try:
+            with open(self._snapshot_path(segment), 'rb') as f:
+                snapshot = pickle.load(f)
+            if snapshot.get('version') != SNAPSHOT_VERSION or not os.path.exists(self.json_path(segment)):
+                return None
+            return snapshot
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+
+    def _write_snapshot(self, segment, snapshot):
+        tmp_path = self._snapshot_path(segment) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._snapshot_path(segment))
+
+    def _read_meta(self, segment):
+        try:
+            with open(self._meta_path(segment), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, segment, meta):
+        tmp_path = self._meta_path(segment) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path(segment))
+
+    def _refresh(self, segment):
+        snapshot = self._read_snapshot(segment)
+        if snapshot is not None and self._is_fresh(snapshot['checked_at']):
+            return snapshot
+
+        meta = self._read_meta(segment) if snapshot is not None else {}
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+        try:
+            print(f"Checking {segment} symbol master file...")
+            response = requests.get(SYMBOL_MASTER_URLS[segment], headers=headers, timeout=30, stream=True)
+            if response.status_code == 304 and snapshot is not None:
+                print(f"{segment} symbol master file not modified, using cached snapshot")
+            else:
+                response.raise_for_status()
+                snapshot = self._store(segment, response)
+                meta = {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified')
+                }
+                print(f"{segment} symbol master file downloaded and cleaned successfully")
+        except Exception as e:
+            if snapshot is None:
+                raise Exception(f"Error downloading {segment} symbol file: {str(e)}")
+            print(f"Warning: could not revalidate {segment} symbol master, using cached snapshot: {str(e)}")
+            return snapshot
+
+        snapshot['checked_at'] = datetime.now(IST)
+        self._write_snapshot(segment, snapshot)
+        self._write_meta(segment, meta)
+        return snapshot
+
+    def _store(self, segment, response):
+        """Stream the response to disk, patch its ends into valid JSON and index it"""
+        tmp_path = self.json_path(segment) + '.tmp'
+        with open(tmp_path, 'w+b') as f:
+            started = False
+            opened = False
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                if not started:
+                    chunk = chunk.lstrip()
+                    if not chunk:
+                        continue
+                    if not chunk.startswith(b'{'):
+                        f.write(b'{')
+                        opened = True
+                    started = True
+                f.write(chunk)
+
+            # The published file may lack the outer braces and end with a
+            # trailing comma; patch the tail in place
+            size = f.seek(0, os.SEEK_END)
+            tail_start = f.seek(max(0, size - 4096))
+            tail = f.read().rstrip()
+            if tail.endswith(b','):
+                tail = tail[:-1]
+            if opened or not tail.endswith(b'}'):
+                tail += b'}'
+            f.seek(tail_start)
+            f.truncate()
+            f.write(tail)
+        os.replace(tmp_path, self.json_path(segment))
+        return self._build_snapshot(iter_symbol_master(self.json_path(segment)))
+
+    def _build_snapshot(self, symbols):
+        symbols = tuple(symbols)
+        return {
+            'version': SNAPSHOT_VERSION,
+            'symbols': symbols,
+            'index': {
+                suffix: tuple(symbol for symbol in symbols if symbol.endswith(suffix))
+                for suffix in INDEXED_SUFFIXES
+            },
+            'checked_at': datetime.now(IST)
+        }
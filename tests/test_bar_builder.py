@@ -0,0 +1,80 @@
+from bar_builder import BarBuilder, bar_table_name
+from candle_db import candle_table_name
+
+
+def tick(builder, time, ltp, volume=None, symbol='NSE:SBIN-EQ'):
+    builder.update({'symbol': symbol, 'ltp': ltp, 'exch_feed_time': time, 'vol_traded_today': volume})
+
+
+def test_bars_are_built_from_ticks():
+    builder = BarBuilder(resolutions=(60,))
+    tick(builder, 30, 100.0, 1000)
+    tick(builder, 60, 101.0, 1010)
+    tick(builder, 70, 103.0, 1025)
+    tick(builder, 80, 99.0, 1030)
+    tick(builder, 110, 100.5, 1040)
+    tick(builder, 125, 102.0, 1050)
+
+    # The bar open when the first tick arrived is incomplete and dropped
+    assert builder.partial_dropped == 1
+    assert list(builder.closed) == [('NSE:SBIN-EQ', 60, [60, 101.0, 103.0, 99.0, 100.5, 40])]
+    assert builder.emitted == 1
+
+
+def test_close_due_waits_for_the_grace_period():
+    builder = BarBuilder(resolutions=(1,), grace=2.0)
+    tick(builder, 10, 100.0)
+    tick(builder, 11, 101.0)
+
+    assert builder.close_due(now=13.5) == 0
+    assert builder.close_due(now=14.0) == 1
+    assert list(builder.closed) == [('NSE:SBIN-EQ', 1, [11, 101.0, 101.0, 101.0, 101.0, 0])]
+
+
+def test_late_ticks_only_add_volume():
+    builder = BarBuilder(resolutions=(60,))
+    tick(builder, 600, 100.0, 100)
+    tick(builder, 660, 100.0, 110)
+    tick(builder, 659, 90.0, 130)
+
+    builder.close_all()
+    assert list(builder.closed) == [('NSE:SBIN-EQ', 60, [660, 100.0, 100.0, 100.0, 100.0, 30])]
+
+    # A closed bucket is not reopened
+    tick(builder, 670, 95.0, 140)
+    assert builder._bars == {}
+
+
+def test_close_all_closes_every_resolution_and_symbol():
+    builder = BarBuilder(resolutions=(1, 60))
+    for symbol in ('A', 'B'):
+        tick(builder, 59, 10.0, symbol=symbol)
+        tick(builder, 61, 11.0, symbol=symbol)
+
+    assert builder.close_all() == 4
+    assert sorted((symbol, resolution) for symbol, resolution, _ in builder.closed) == [
+        ('A', 1), ('A', 60), ('B', 1), ('B', 60)
+    ]
+
+
+def test_close_all_drops_bars_still_open():
+    builder = BarBuilder(resolutions=(60,))
+    tick(builder, 600, 100.0)
+    tick(builder, 660, 101.0)
+    tick(builder, 700, 102.0)
+
+    assert builder.close_all(now=710) == 0
+    assert list(builder.closed) == []
+    assert builder.partial_dropped == 2
+    assert builder._bars == {}
+
+
+def test_live_bars_do_not_share_the_backfill_tables():
+    backfill_table = candle_table_name('NSE:SBIN-EQ')
+    tables = {bar_table_name('NSE:SBIN-EQ', resolution) for resolution in (1, 60, 300, 15)}
+
+    assert backfill_table not in tables
+    assert len(tables) == 4
+    assert bar_table_name('NSE:SBIN-EQ', 60).endswith('_LIVE_1M')
+    assert bar_table_name('NSE:SBIN-EQ', 15).endswith('_LIVE_15S')
+    assert len(bar_table_name('NSE:' + 'X' * 80, 1)) <= 63
@@ -0,0 +1,117 @@
+import asyncio
+import re
+
+from candle_db import STAGING_TABLE, CandleSchemaCache, candle_table_name, copy_candles
+
+
+class FakeTransaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def __aenter__(self):
+        self.conn.log.append('BEGIN')
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.conn.log.append('COMMIT' if exc_type is None else 'ROLLBACK')
+        return False
+
+
+class FakeConnection:
+    """Records what an asyncpg connection is asked to do"""
+
+    def __init__(self, tables=(), redundant_indexes=()):
+        self.tables = list(tables)
+        self.redundant_indexes = list(redundant_indexes)
+        self.log = []
+        self.copies = []
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    async def execute(self, sql):
+        self.log.append(' '.join(sql.split()))
+
+    async def fetch(self, sql):
+        self.log.append('FETCH')
+        if 'pg_tables' in sql:
+            return [{'tablename': table} for table in self.tables]
+        return [{'table_name': table, 'index_name': index} for table, index in self.redundant_indexes]
+
+    async def copy_records_to_table(self, table_name, records, columns):
+        self.log.append('COPY')
+        self.copies.append((table_name, list(records), columns))
+
+
+def test_candle_table_name():
+    assert candle_table_name('NSE:SBIN-EQ') == 'NSE_SBIN_EQ'
+    assert candle_table_name('nse:m&m-eq') == 'NSE_M_M_EQ'
+    assert len(candle_table_name('NSE:' + 'X' * 100)) == 63
+
+
+def test_copy_candles_stages_and_upserts_in_one_transaction():
+    conn = FakeConnection()
+    rows = [[1700019900, 1.0, 2.0, 0.5, 1.5, 100.0], [1700019960, 1.5, 2.5, 1.0, 2.0, 50.0]]
+
+    assert asyncio.run(copy_candles(conn, 'NSE_SBIN_EQ', rows)) == 2
+
+    assert conn.copies == [(STAGING_TABLE, rows, ('epoch', 'open', 'high', 'low', 'close', 'volume'))]
+    assert conn.log[0].startswith(f'CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE}')
+    assert 'ON COMMIT DELETE ROWS' in conn.log[0]
+    assert conn.log[1:3] == ['BEGIN', 'COPY']
+    assert conn.log[-1] == 'COMMIT'
+
+    upsert = conn.log[3]
+    assert upsert.startswith('INSERT INTO "NSE_SBIN_EQ" (timestamp, open, high, low, close, volume)')
+    assert f'SELECT DISTINCT ON (epoch) to_timestamp(epoch), open, high, low, close, volume FROM {STAGING_TABLE}' in upsert
+    assert 'ORDER BY epoch, ctid DESC' in upsert
+    assert upsert.endswith(
+        'ON CONFLICT (timestamp) DO UPDATE SET open = EXCLUDED.open, high = EXCLUDED.high, '
+        'low = EXCLUDED.low, close = EXCLUDED.close, volume = EXCLUDED.volume'
+    )
+
+
+def test_copy_candles_skips_empty_batches():
+    conn = FakeConnection()
+    assert asyncio.run(copy_candles(conn, 'NSE_SBIN_EQ', [])) == 0
+    assert conn.log == []
+
+
+def test_ensure_only_creates_missing_tables():
+    conn = FakeConnection(tables=['NSE_SBIN_EQ'])
+    cache = CandleSchemaCache()
+
+    created = asyncio.run(cache.ensure(conn, ['NSE_TCS_EQ', 'NSE_SBIN_EQ', 'NSE_INFY_EQ']))
+    assert created == ['NSE_INFY_EQ', 'NSE_TCS_EQ']
+    ddl = conn.log[2]
+    assert re.findall(r'CREATE TABLE IF NOT EXISTS "(\w+)"', ddl) == ['NSE_INFY_EQ', 'NSE_TCS_EQ']
+    assert 'CONSTRAINT "NSE_TCS_EQ_timestamp_unique" UNIQUE (timestamp)' in ddl
+
+    # The catalog is read once; known tables issue no DDL at all
+    conn.log.clear()
+    assert asyncio.run(cache.ensure(conn, ['NSE_TCS_EQ', 'NSE_SBIN_EQ'])) == []
+    assert conn.log == []
+
+
+def test_ensure_batches_the_ddl():
+    conn = FakeConnection()
+    cache = CandleSchemaCache(batch_size=2)
+
+    asyncio.run(cache.ensure(conn, [f'T{i}' for i in range(5)]))
+    ddl = [entry for entry in conn.log if entry.startswith('CREATE')]
+    assert [len(re.findall('CREATE TABLE', entry)) for entry in ddl] == [2, 2, 1]
+    assert conn.log.count('BEGIN') == conn.log.count('COMMIT') == 3
+
+
+def test_drop_redundant_indexes():
+    conn = FakeConnection(redundant_indexes=[('NSE_SBIN_EQ', 'idx_NSE_SBIN_EQ_timestamp'),
+                                             ('NSE_TCS_EQ', 'idx_NSE_TCS_EQ_timestamp')])
+    cache = CandleSchemaCache()
+
+    assert asyncio.run(cache.drop_redundant_indexes(conn)) == ['idx_NSE_SBIN_EQ_timestamp', 'idx_NSE_TCS_EQ_timestamp']
+    assert conn.log[-1] == 'DROP INDEX IF EXISTS "idx_NSE_SBIN_EQ_timestamp", "idx_NSE_TCS_EQ_timestamp"'
+
+
+def test_drop_redundant_indexes_leaves_clean_schemas_alone():
+    conn = FakeConnection()
+    assert asyncio.run(CandleSchemaCache().drop_redundant_indexes(conn)) == []
+    assert conn.log == ['FETCH']
@@ -0,0 +1,131 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from candle_store import CandleManifest, ParquetCandleStore, TarCsvCandleStore, create_candle_store
+from candles import candles_to_ist_frame
+
+SYMBOL = 'NSE:SBIN-EQ'
+# 2023-11-15 09:15 IST
+START = 1700019900
+
+
+def candles(first, count, price=100.0):
+    return candles_to_ist_frame([
+        [START + 60 * i, price, price + 1, price - 1, price, 10.0] for i in range(first, first + count)
+    ])
+
+
+@pytest.fixture(params=['tar_csv', 'parquet'])
+def store(request, tmp_path):
+    store = create_candle_store(request.param, tmp_path)
+    yield store
+    store.close()
+
+
+def test_round_trip(store):
+    store.append(SYMBOL, candles(0, 5))
+
+    df = store.read(SYMBOL)
+    assert df.columns == ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+    assert [int(ts.timestamp()) for ts in df['timestamp']] == [START + 60 * i for i in range(5)]
+    assert df['high'].to_list() == [101.0] * 5
+    assert store.last_timestamp(SYMBOL) == datetime(2023, 11, 15)
+
+
+def test_read_range(store):
+    store.append(SYMBOL, candles(0, 10))
+
+    start = datetime(2023, 11, 15, 9, 17)
+    end = datetime(2023, 11, 15, 9, 20)
+    assert len(store.read(SYMBOL, start, end)) == 3
+
+
+def test_overlapping_appends_are_deduplicated(store):
+    store.append(SYMBOL, candles(0, 300))
+    store.append(SYMBOL, candles(200, 300, price=200.0))
+
+    df = store.read(SYMBOL)
+    assert len(df) == 500
+    assert df['timestamp'].is_sorted()
+    # The later append wins on overlapping timestamps
+    assert df['open'][199] == 100.0
+    assert df['open'][200] == 200.0
+    assert store.manifest.get(SYMBOL)['rows'] == 500
+
+
+def test_resume_from_the_manifest_without_reading_the_data(store, monkeypatch):
+    store.append(SYMBOL, candles(0, 5))
+    store.close()
+    reopened = type(store)(store.data_dir)
+
+    def fail(*args):
+        raise AssertionError("the data was read")
+
+    monkeypatch.setattr(reopened, '_read_csv', fail, raising=False)
+    monkeypatch.setattr(reopened, 'scan', fail, raising=False)
+    assert reopened.last_timestamp(SYMBOL) == datetime(2023, 11, 15)
+    assert reopened.last_timestamp('NSE:TCS-EQ') is None
+
+
+def test_backends_do_not_trust_each_others_manifest(tmp_path):
+    tar_store = TarCsvCandleStore(tmp_path)
+    tar_store.append(SYMBOL, candles(0, 5))
+    tar_store.close()
+
+    parquet_store = ParquetCandleStore(tmp_path)
+    assert parquet_store.last_timestamp(SYMBOL) is None
+    assert parquet_store.read(SYMBOL).shape == (0, 6)
+
+
+def test_manifest_entries_for_missing_data_are_dropped(store):
+    store.append(SYMBOL, candles(0, 5))
+    if isinstance(store, TarCsvCandleStore):
+        store._archive_path(SYMBOL).unlink()
+    else:
+        for path in store._symbol_dir(SYMBOL).glob('*.parquet'):
+            path.unlink()
+
+    assert store.last_timestamp(SYMBOL) is None
+    assert store.manifest.get(SYMBOL) is None
+
+
+def test_tar_store_rebuilds_a_missing_manifest_entry(tmp_path):
+    store = TarCsvCandleStore(tmp_path)
+    store.append(SYMBOL, candles(0, 5))
+    store.manifest.remove(SYMBOL)
+
+    assert store.last_timestamp(SYMBOL) == datetime(2023, 11, 15)
+    assert store.manifest.get(SYMBOL)['rows'] == 5
+
+
+def test_manifest_batches_writes_until_flush(tmp_path):
+    path = tmp_path / 'manifest.json'
+    manifest = CandleManifest(path, flush_interval=3600)
+    for i in range(100):
+        manifest.update(f'S{i}', first=0, last=i, rows=1)
+
+    assert not path.exists()
+    manifest.flush()
+    assert len(json.loads(path.read_text())) == 100
+
+    manifest.remove('S0')
+    assert CandleManifest(path).get('S0') is not None
+    manifest.flush()
+    assert CandleManifest(path).get('S0') is None
+
+
+def test_manifest_writes_once_the_interval_has_passed(tmp_path):
+    path = tmp_path / 'manifest.json'
+    manifest = CandleManifest(path, flush_interval=0)
+    manifest.update(SYMBOL, first=0, last=1, rows=1)
+
+    assert CandleManifest(path).get(SYMBOL)['last'] == 1
+
+
+def test_unreadable_manifest_is_rebuilt(tmp_path):
+    path = tmp_path / 'manifest.json'
+    path.write_text('{"NSE:SBIN-EQ": ')
+
+    assert CandleManifest(path).entries == {}
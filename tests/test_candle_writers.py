@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from candle_store import CsvCandleWriter, TarCsvCandleStore, create_candle_store
+from candles import candles_to_ist_frame
+
+SYMBOL = 'NSE:SBIN-EQ'
+# 2023-11-15 09:15 IST
+START = 1700019900
+
+
+def candles(first, count, price=100.0):
+    return candles_to_ist_frame([
+        [START + 60 * i, price, price + 1, price - 1, price, 10.0] for i in range(first, first + count)
+    ])
+
+
+@pytest.fixture(params=['tar_csv', 'parquet'])
+def store(request, tmp_path):
+    store = create_candle_store(request.param, tmp_path)
+    yield store
+    store.close()
+
+
+def test_streaming_writer(store):
+    async def write():
+        async with store.writer(SYMBOL) as writer:
+            await asyncio.gather(writer.awrite(candles(5, 5)), writer.awrite(candles(0, 5)))
+        return writer.rows
+
+    assert asyncio.run(write()) == 10
+    assert len(store.read(SYMBOL)) == 10
+
+
+def test_replace_discards_the_existing_candles(tmp_path):
+    store = TarCsvCandleStore(tmp_path)
+    store.append(SYMBOL, candles(0, 5))
+    with store.writer(SYMBOL, replace=True) as writer:
+        writer.write(candles(100, 2))
+
+    assert len(store.read(SYMBOL)) == 2
+    assert store.manifest.get(SYMBOL)['rows'] == 2
+
+
+def test_aborted_writer_leaves_the_archive_alone(tmp_path):
+    store = TarCsvCandleStore(tmp_path)
+    store.append(SYMBOL, candles(0, 5))
+
+    with pytest.raises(RuntimeError):
+        with store.writer(SYMBOL) as writer:
+            writer.write(candles(5, 5))
+            raise RuntimeError("fetch failed")
+
+    assert len(store.read(SYMBOL)) == 5
+    assert not list(tmp_path.glob('.*'))
+
+
+def test_csv_writer_sorts_and_deduplicates(tmp_path):
+    path = tmp_path / 'NSE_SBIN-EQ.csv'
+    with CsvCandleWriter(path) as writer:
+        writer.write(candles(3, 3))
+        writer.write(candles(0, 4, price=50.0))
+
+    lines = path.read_text().splitlines()
+    assert len(lines) == 7
+    assert lines[1].startswith('2023-11-15T09:15:00')
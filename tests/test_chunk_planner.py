@@ -0,0 +1,104 @@
+import asyncio
+from datetime import date, timedelta
+
+from chunk_planner import AuthenticationError, TokenRefresher, fetch_windows, is_auth_error, plan_windows
+
+
+def test_plan_windows_covers_the_range_without_overlap():
+    windows = plan_windows(date(2024, 1, 1), date(2024, 1, 10), timedelta(days=4))
+    assert windows == [
+        (date(2024, 1, 1), date(2024, 1, 5)),
+        (date(2024, 1, 5), date(2024, 1, 9)),
+        (date(2024, 1, 9), date(2024, 1, 10)),
+    ]
+    assert plan_windows(date(2024, 1, 1), date(2024, 1, 1), timedelta(days=4)) == []
+
+
+def test_is_auth_error():
+    assert is_auth_error({'s': 'error', 'code': -16})
+    assert is_auth_error({'s': 'error', 'message': 'Could not authenticate the user'})
+    assert not is_auth_error({'s': 'ok', 'code': -16})
+    assert not is_auth_error({'s': 'error', 'code': 429})
+    assert not is_auth_error([])
+
+
+def test_fetch_windows_caps_concurrency_and_streams_chunks():
+    inflight = 0
+    peak = 0
+    written = []
+
+    async def fetch_chunk(symbol, start, end):
+        nonlocal inflight, peak
+        inflight += 1
+        peak = max(peak, inflight)
+        await asyncio.sleep(0.01)
+        inflight -= 1
+        return [[start, 1, 1, 1, 1, 1]] * 2
+
+    async def on_chunk(candles):
+        written.extend(candles)
+
+    windows = plan_windows(0, 10, 1)
+    total = asyncio.run(fetch_windows(fetch_chunk, 'NSE:SBIN-EQ', windows, on_chunk, concurrency=3))
+
+    assert total == 20
+    assert len(written) == 20
+    assert peak == 3
+
+
+def test_failed_windows_are_skipped():
+    async def fetch_chunk(symbol, start, end):
+        if start == 1:
+            raise Exception("timeout")
+        return [[start]]
+
+    assert asyncio.run(fetch_windows(fetch_chunk, 'NSE:SBIN-EQ', plan_windows(0, 3, 1))) == 2
+
+
+def test_auth_errors_refresh_the_token_once_and_retry_only_those_windows(monkeypatch):
+    prompts = []
+    monkeypatch.setattr('builtins.input', prompts.append)
+    tokens = []
+    refresher = TokenRefresher(lambda: 'new-token', tokens.append)
+    calls = []
+
+    async def fetch_chunk(symbol, start, end):
+        calls.append((symbol, start))
+        if not tokens and start % 2:
+            raise AuthenticationError("expired")
+        return [[start]]
+
+    async def run():
+        return await asyncio.gather(*(
+            fetch_windows(fetch_chunk, symbol, plan_windows(0, 4, 1), refresher=refresher)
+            for symbol in ('A', 'B')
+        ))
+
+    assert asyncio.run(run()) == [4, 4]
+    assert len(prompts) == 1
+    assert tokens == ['new-token']
+    assert refresher.generation == 1
+    assert sorted(calls[8:]) == [('A', 1), ('A', 3), ('B', 1), ('B', 3)]
+
+
+def test_auth_retries_are_limited(monkeypatch):
+    monkeypatch.setattr('builtins.input', lambda prompt: None)
+    refresher = TokenRefresher(lambda: 'token', lambda token: None)
+    calls = []
+
+    async def fetch_chunk(symbol, start, end):
+        calls.append(start)
+        raise AuthenticationError("expired")
+
+    total = asyncio.run(fetch_windows(fetch_chunk, 'A', [(0, 1)], refresher=refresher, max_auth_retries=2))
+
+    assert total == 0
+    assert len(calls) == 3
+    assert refresher.generation == 2
+
+
+def test_auth_errors_without_a_refresher_give_up():
+    async def fetch_chunk(symbol, start, end):
+        raise AuthenticationError("expired")
+
+    assert asyncio.run(fetch_windows(fetch_chunk, 'A', [(0, 1)])) == 0
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+from datetime import date
+
+from live_ingest import LiveIngestService
+
+
+class FakeIngestService(LiveIngestService):
+    """Writes into a dict instead of a pool, each write taking write_seconds"""
+
+    def __init__(self, write_seconds=0.0, failures=0, **kwargs):
+        super().__init__({}, columns=('ltp',), **kwargs)
+        self.write_seconds = write_seconds
+        self.failures = failures
+        self.written = {}
+        self.writing = 0
+        self.peak_writes = 0
+
+    async def _open(self):
+        self._timer = self.loop.create_task(self._flush_periodically())
+
+    async def _write_group(self, table_name, columns, rows):
+        self.writing += 1
+        self.peak_writes = max(self.peak_writes, self.writing)
+        await asyncio.sleep(self.write_seconds)
+        self.writing -= 1
+        if self.failures:
+            self.failures -= 1
+            raise Exception("connection reset")
+        self.written.setdefault(table_name, []).extend(rows)
+
+
+class FakeStore:
+    table = 'ticks'
+
+    def __init__(self):
+        self.symbol_ids = {'NSE:SBIN-EQ': 1}
+        self.row_key_threads = []
+
+    def cached_row_key(self, symbol):
+        symbol_id = self.symbol_ids.get(symbol)
+        return None if symbol_id is None else (symbol_id, date(2024, 1, 1))
+
+    def row_key(self, symbol):
+        self.row_key_threads.append(threading.current_thread().name)
+        self.symbol_ids.setdefault(symbol, len(self.symbol_ids) + 1)
+        return self.cached_row_key(symbol)
+
+
+def test_rows_are_written_on_close():
+    service = FakeIngestService(flush_interval=60)
+    service.start(lambda message: service.add(message['table'], (message['ltp'],)))
+    for ltp in range(10):
+        service.submit({'table': f'ticks_{ltp % 2}', 'ltp': ltp})
+    service.close()
+
+    assert service.written == {'ticks_0': [(0,), (2,), (4,), (6,), (8,)], 'ticks_1': [(1,), (3,), (5,), (7,), (9,)]}
+    assert service.metrics()['processed'] == 10
+
+
+def test_inflight_writes_are_bounded_by_the_pool_size():
+    service = FakeIngestService(write_seconds=0.02, pool_size=2, max_rows=10, flush_interval=60)
+    service.start(lambda message: service.add('ticks', (message['ltp'],)))
+    for ltp in range(1000):
+        service.submit({'ltp': ltp})
+    service.close()
+
+    assert service.peak_writes == 2
+    assert sorted(service.written['ticks']) == [(ltp,) for ltp in range(1000)]
+    assert service.metrics()['inflight_writes'] == 0
+
+
+def test_rows_beyond_max_buffered_rows_are_dropped():
+    service = FakeIngestService(write_seconds=0.2, pool_size=1, max_rows=10, max_buffered_rows=50,
+                                flush_interval=60)
+    service.start(lambda message: service.add('ticks', (message['ltp'],)))
+    for ltp in range(500):
+        service.submit({'ltp': ltp})
+    service.close()
+
+    dropped = service.metrics()['dropped_rows']
+    assert dropped > 0
+    assert len(service.written['ticks']) + dropped == 500
+
+
+def test_add_partitioned_runs_row_key_off_the_loop_for_new_symbols():
+    store = FakeStore()
+    service = FakeIngestService(flush_interval=60)
+    service.start(lambda message: service.add_partitioned(store, message['symbol'], (message['ltp'],)))
+    service.submit({'symbol': 'NSE:SBIN-EQ', 'ltp': 1.0})
+    service.submit({'symbol': 'NSE:TCS-EQ', 'ltp': 2.0})
+    service.close()
+
+    assert sorted(service.written['ticks']) == [(1, date(2024, 1, 1), 1.0), (2, date(2024, 1, 1), 2.0)]
+    assert len(store.row_key_threads) == 1
+    assert store.row_key_threads[0].startswith('live-ingest-blocking')
+
+
+def test_failed_writes_are_retried_after_a_backoff():
+    service = FakeIngestService(failures=1, flush_interval=0.01, retry_backoff=0.05)
+    service.start(lambda message: service.add('ticks', (message['ltp'],)))
+    service.submit({'ltp': 1})
+    time.sleep(0.02)
+    service.submit({'ltp': 2})
+    time.sleep(0.2)
+
+    # The failed row is written ahead of the one queued while it waited
+    assert service.written == {'ticks': [(1,), (2,)]}
+    service.close()
+    assert service.stats.retried_rows == 1
+    assert service.stats.dropped_rows == 0
+
+
+def test_rows_are_dropped_after_max_retries():
+    service = FakeIngestService(failures=10, flush_interval=60, max_retries=2, retry_backoff=60)
+    service.start(lambda message: service.add('ticks', (message['ltp'],)))
+    service.submit({'ltp': 1})
+    # close() does not wait out the backoff
+    service.close()
+
+    assert service.written == {}
+    assert service.stats.retried_rows == 2
+    assert service.stats.dropped_rows == 1
+    assert service.metrics()['buffered_rows'] == 0
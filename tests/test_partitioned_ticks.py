@@ -0,0 +1,75 @@
+from datetime import date, timedelta
+
+from partitioned_ticks import PartitionedTickStore, symbol_segment
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.connection.statements.append((' '.join(sql.split()), params))
+
+    def fetchall(self):
+        symbols = self.connection.statements[-1][1][0]
+        return [(symbol, self.connection.ids.setdefault(symbol, len(self.connection.ids) + 1)) for symbol in symbols]
+
+
+class FakeConnection:
+    def __init__(self):
+        self.statements = []
+        self.ids = {}
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+def test_symbol_segment():
+    assert symbol_segment('NSE:SBIN-EQ') == 'EQ'
+    assert symbol_segment('NSE:NIFTY50-INDEX') == 'INDEX'
+    assert symbol_segment('NSE:NIFTY24DECFUT') == 'FUT'
+    assert symbol_segment('NSE:NIFTY24DEC24000CE') == 'OPT'
+    assert symbol_segment('NSE:NIFTY24DEC24000PE') == 'OPT'
+    assert symbol_segment('MCX:GOLD') == 'OTHER'
+
+
+def test_create_schema_creates_the_partitions_ahead():
+    connection = FakeConnection()
+    store = PartitionedTickStore(connection, days_ahead=2)
+    store.create_schema()
+
+    today = date.today()
+    partitions = [params for sql, params in connection.statements if 'PARTITION OF' in sql]
+    assert partitions == [(today + timedelta(days=i), today + timedelta(days=i + 1)) for i in range(3)]
+
+
+def test_row_key_registers_new_symbols_once():
+    connection = FakeConnection()
+    store = PartitionedTickStore(connection)
+    store.create_schema()
+    executed = len(connection.statements)
+
+    assert store.cached_row_key('NSE:SBIN-EQ') is None
+    assert store.row_key('NSE:SBIN-EQ') == (1, date.today())
+    assert len(connection.statements) == executed + 2
+
+    assert store.cached_row_key('NSE:SBIN-EQ') == (1, date.today())
+    assert store.row_key('NSE:SBIN-EQ') == (1, date.today())
+    assert len(connection.statements) == executed + 2
+
+
+def test_cached_row_key_needs_todays_partition():
+    connection = FakeConnection()
+    store = PartitionedTickStore(connection)
+    store.register_symbols(['NSE:SBIN-EQ'])
+
+    assert store.cached_row_key('NSE:SBIN-EQ') is None
+    store.row_key('NSE:SBIN-EQ')
+    assert store.cached_row_key('NSE:SBIN-EQ') == (1, date.today())
+    assert date.today() + timedelta(days=1) in store._partitions
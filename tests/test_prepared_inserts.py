@@ -0,0 +1,67 @@
+from prepared_inserts import PreparedInsertCache, sanitize_table_name
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.connection.executed.append((sql, params))
+
+
+class FakeConnection:
+    def __init__(self):
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+def test_sanitize_table_name():
+    assert sanitize_table_name('NSE:SBIN-EQ') == 'NSE_SBIN_EQ'
+    assert sanitize_table_name('NSE:M&M-EQ') == 'NSE_M_M_EQ'
+    assert sanitize_table_name('NSE:NIFTY BANK-INDEX') == 'NSE_NIFTY_BANK_INDEX'
+    assert sanitize_table_name('5PAISA') == 'symbol_5PAISA'
+    assert sanitize_table_name('_X') == '_X'
+
+
+def test_statement_is_prepared_once_per_symbol():
+    connection = FakeConnection()
+    cache = PreparedInsertCache(connection, ('ltp', 'type'))
+
+    cache.insert('NSE:SBIN-EQ', (612.5, 'sf'))
+    cache.insert('NSE:SBIN-EQ', (613.0, 'sf'))
+
+    assert connection.executed == [
+        ("PREPARE tick_insert_1 AS INSERT INTO NSE_SBIN_EQ (ltp, type) VALUES ($1, $2)", None),
+        ("EXECUTE tick_insert_1 (%s, %s)", (612.5, 'sf')),
+        ("EXECUTE tick_insert_1 (%s, %s)", (613.0, 'sf')),
+    ]
+    assert cache.stats() == {'cached': 1, 'prepared': 1, 'evicted': 0}
+
+
+def test_least_recently_used_statement_is_deallocated():
+    connection = FakeConnection()
+    cache = PreparedInsertCache(connection, ('ltp',), maxsize=2)
+
+    cache.insert('A', (1,))
+    cache.insert('B', (2,))
+    cache.insert('A', (3,))
+    cache.insert('C', (4,))
+
+    assert ("DEALLOCATE tick_insert_2", None) in connection.executed
+    assert cache.stats() == {'cached': 2, 'prepared': 3, 'evicted': 1}
+
+    # B is prepared again under a new name; A stayed cached
+    connection.executed.clear()
+    cache.insert('A', (5,))
+    cache.insert('B', (6,))
+    assert connection.executed[0] == ("EXECUTE tick_insert_1 (%s)", (5,))
+    assert connection.executed[1] == ("PREPARE tick_insert_4 AS INSERT INTO B (ltp) VALUES ($1)", None)
+    assert ("DEALLOCATE tick_insert_3", None) in connection.executed
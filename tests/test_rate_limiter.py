@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+from rate_limiter import RateLimiter, is_rate_limited
+
+
+def test_is_rate_limited():
+    assert is_rate_limited({}, status=429)
+    assert is_rate_limited({'s': 'error', 'code': 429})
+    assert is_rate_limited({'s': 'error', 'code': -429})
+    assert is_rate_limited({'s': 'error', 'message': 'Request limit reached'})
+    assert not is_rate_limited({'s': 'ok', 'code': 429})
+    assert not is_rate_limited({'s': 'error', 'code': -16, 'message': 'Could not authenticate'})
+    assert not is_rate_limited(None)
+
+
+def test_rate_limited_halves_the_rate_and_success_recovers_it():
+    limiter = RateLimiter(per_second=8, min_rate=3.0, recovery_step=1.0, base_backoff=1.0, max_backoff=3.0)
+
+    assert limiter.record_rate_limited() == 1.0
+    assert limiter.rate == 4.0
+    assert limiter.record_rate_limited() == 2.0
+    assert limiter.rate == 3.0
+    assert limiter.record_rate_limited() == 3.0
+    assert limiter.record_rate_limited(retry_after=0.5) == 0.5
+
+    for _ in range(10):
+        limiter.record_success()
+    assert limiter.rate == 8
+    assert limiter.stats()['rate_limited'] == 4
+
+
+def test_acquire_paces_to_the_per_second_rate():
+    limiter = RateLimiter(per_second=20, per_minute=1000)
+
+    async def run():
+        started = time.monotonic()
+        await asyncio.gather(*(limiter.acquire() for _ in range(30)))
+        return time.monotonic() - started
+
+    # A burst of one second's worth, then one every 1/20 s
+    elapsed = asyncio.run(run())
+    assert 0.4 < elapsed < 1.0
+    assert limiter.stats()['acquired'] == 30
+
+
+def test_acquire_respects_the_minute_window():
+    limiter = RateLimiter(per_second=100, per_minute=5)
+
+    async def run():
+        for _ in range(5):
+            await limiter.acquire()
+        return limiter._delay(time.monotonic())
+
+    assert asyncio.run(run()) > 59
+
+
+def test_rate_limited_pauses_callers():
+    limiter = RateLimiter(per_second=100, per_minute=1000)
+
+    async def run():
+        limiter.record_rate_limited(retry_after=0.3)
+        started = time.monotonic()
+        await limiter.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) >= 0.29
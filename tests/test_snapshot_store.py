@@ -0,0 +1,72 @@
+import math
+import os
+import threading
+
+from snapshot_store import SnapshotStore
+
+SYMBOLS = ('NSE:SBIN-EQ', 'NSE:TCS-EQ')
+
+
+def test_update_and_get():
+    store = SnapshotStore(SYMBOLS)
+    assert store.update({'symbol': 'NSE:TCS-EQ', 'type': 'sf', 'ltp': 3500.5, 'vol_traded_today': 10})
+    assert not store.update({'symbol': 'NSE:INFY-EQ', 'ltp': 1.0})
+
+    assert store.get('NSE:TCS-EQ', 'ltp') == 3500.5
+    assert math.isnan(store.get('NSE:SBIN-EQ', 'ltp'))
+    assert list(store.column('vol_traded_today'))[1] == 10
+    assert store.snapshot('NSE:TCS-EQ', ['ltp', 'vol_traded_today']) == {'ltp': 3500.5, 'vol_traded_today': 10}
+    assert (store.updates, store.ignored) == (1, 1)
+    store.close()
+
+
+def test_depth():
+    store = SnapshotStore(SYMBOLS)
+    message = {'symbol': 'NSE:SBIN-EQ', 'type': 'dp'}
+    for level in range(1, 6):
+        message.update({
+            f'bid_price{level}': 100 - level, f'bid_size{level}': level, f'bid_order{level}': 1,
+            f'ask_price{level}': 100 + level, f'ask_size{level}': level, f'ask_order{level}': 2,
+        })
+    store.update(message)
+
+    book = store.depth('NSE:SBIN-EQ')
+    assert book['bids'][0] == (99, 1, 1)
+    assert book['asks'][4] == (105, 5, 2)
+    assert len(book['bids']) == len(book['asks']) == 5
+    store.close()
+
+
+def test_readers_never_see_a_torn_update():
+    store = SnapshotStore(SYMBOLS, columns=('ltp', 'bid_price', 'ask_price'))
+    store.update({'symbol': 'NSE:SBIN-EQ', 'ltp': 0, 'bid_price': 0, 'ask_price': 0})
+    stop = threading.Event()
+
+    def write():
+        price = 0
+        while not stop.is_set():
+            price += 1
+            store.update({'symbol': 'NSE:SBIN-EQ', 'ltp': price, 'bid_price': price, 'ask_price': price})
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        for _ in range(20000):
+            values = set(store.snapshot('NSE:SBIN-EQ').values())
+            assert len(values) == 1
+    finally:
+        stop.set()
+        writer.join()
+    store.close()
+
+
+def test_attach_reads_a_shared_store():
+    name = f'test_snapshot_{os.getpid()}'
+    store = SnapshotStore(SYMBOLS, shm_name=name)
+    reader = SnapshotStore.attach(name, SYMBOLS)
+    try:
+        store.update({'symbol': 'NSE:SBIN-EQ', 'ltp': 612.25})
+        assert reader.get('NSE:SBIN-EQ', 'ltp') == 612.25
+    finally:
+        reader.close()
+        store.close()
@@ -0,0 +1,163 @@
+import threading
+import time
+
+import pytest
+
+from subscribe_scheduler import SubscriptionScheduler, unsubscribe_symbols
+
+
+class FakeSocket:
+    """
+    Answers subscribe calls the way the SDK does: invalid symbols through a
+    synchronous on_error from inside the call, the server's answer later
+    from another thread.
+    """
+
+    def __init__(self, invalid=(), reject=0, silent=0, raises=0):
+        self.invalid = set(invalid)
+        self.reject = reject
+        self.silent = silent
+        self.raises = raises
+        self.scheduler = None
+        self.calls = []
+        self.subscribed = set()
+        self.unanswered = 0
+        self.overlapped = False
+
+    def subscribe(self, symbols, data_type):
+        if self.unanswered:
+            self.overlapped = True
+        self.calls.append((data_type, list(symbols)))
+        if self.raises:
+            self.raises -= 1
+            raise Exception("socket closed")
+        invalid = [symbol for symbol in symbols if symbol in self.invalid]
+        if invalid:
+            self.scheduler.on_error({'type': 'sub', 'code': -300, 'invalid_symbols': invalid})
+        if self.silent:
+            self.silent -= 1
+            return
+        if self.reject:
+            self.reject -= 1
+            answer = {'type': 'sub', 's': 'error', 'message': 'subscription failed'}
+            deliver = self.scheduler.on_error
+        else:
+            self.subscribed.update((data_type, symbol) for symbol in symbols if symbol not in self.invalid)
+            answer = {'type': 'sub', 's': 'ok'}
+            deliver = self.scheduler.on_ack
+        self.unanswered += 1
+        threading.Timer(0.01, self._answer, (deliver, answer)).start()
+
+    def _answer(self, deliver, answer):
+        self.unanswered -= 1
+        deliver(answer)
+
+
+def run(socket, subscriptions, **kwargs):
+    kwargs.setdefault('interval', 0)
+    scheduler = SubscriptionScheduler(socket.subscribe, **kwargs)
+    socket.scheduler = scheduler
+    scheduler.start(subscriptions)
+    deadline = time.monotonic() + 5
+    while not scheduler.done() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    scheduler.close()
+    return scheduler
+
+
+SYMBOLS = [f'NSE:S{i}-EQ' for i in range(250)]
+
+
+def test_batches_are_sent_one_at_a_time():
+    socket = FakeSocket()
+    scheduler = run(socket, {'SymbolUpdate': SYMBOLS}, batch_size=100)
+
+    assert [len(symbols) for _, symbols in socket.calls] == [100, 100, 50]
+    assert not socket.overlapped
+    assert socket.subscribed == {('SymbolUpdate', symbol) for symbol in SYMBOLS}
+    assert scheduler.counters['acked'] == 3
+    assert scheduler.failed == []
+
+
+def test_rejected_batch_is_retried_first():
+    socket = FakeSocket(reject=1)
+    scheduler = run(socket, {'SymbolUpdate': SYMBOLS}, batch_size=100)
+
+    assert [symbols[0] for _, symbols in socket.calls] == [SYMBOLS[0], SYMBOLS[0], SYMBOLS[100], SYMBOLS[200]]
+    assert scheduler.counters['retried'] == 1
+    assert scheduler.counters['acked'] == 3
+    assert socket.subscribed == {('SymbolUpdate', symbol) for symbol in SYMBOLS}
+
+
+def test_invalid_symbols_are_dropped_not_retried():
+    socket = FakeSocket(invalid=[SYMBOLS[5], SYMBOLS[150]])
+    scheduler = run(socket, {'SymbolUpdate': SYMBOLS}, batch_size=100)
+
+    assert len(socket.calls) == 3
+    assert scheduler.counters['retried'] == 0
+    assert scheduler.failed == [('SymbolUpdate', SYMBOLS[5]), ('SymbolUpdate', SYMBOLS[150])]
+    assert len(socket.subscribed) == 248
+
+
+def test_send_errors_are_retried():
+    socket = FakeSocket(raises=1)
+    scheduler = run(socket, {'SymbolUpdate': SYMBOLS[:10]})
+
+    assert len(socket.calls) == 2
+    assert scheduler.counters['retried'] == 1
+    assert scheduler.counters['acked'] == 1
+
+
+def test_unanswered_batch_fails_after_max_retries():
+    socket = FakeSocket(silent=10)
+    scheduler = run(socket, {'SymbolUpdate': SYMBOLS[:10]}, ack_timeout=0.05, max_retries=2)
+
+    assert len(socket.calls) == 3
+    assert scheduler.failed == [('SymbolUpdate', symbol) for symbol in SYMBOLS[:10]]
+
+
+def test_unrelated_errors_are_left_to_the_caller():
+    scheduler = SubscriptionScheduler(lambda symbols, data_type: None)
+    assert not scheduler.on_error({'code': -99, 'message': 'connection error'})
+    assert not scheduler.on_error('plain text error')
+    assert scheduler.on_error({'type': 'sub', 's': 'error'})
+    assert scheduler.counters['unmatched_acks'] == 1
+
+
+def test_batch_size_is_capped_by_the_sdk_message_size():
+    with pytest.raises(Exception):
+        SubscriptionScheduler(lambda symbols, data_type: None, batch_size=2000)
+
+
+class FakeSdkSocket:
+    """Keeps scrips_count and symbol_token the way FyersDataSocket does"""
+
+    def __init__(self):
+        self.scrips_count = {}
+        self.symbol_token = {}
+        self.subscribe_calls = 0
+        self.unsubscribed = []
+
+    def subscribe(self, symbols, data_type, channel=11):
+        tokens = {f'dp|{symbol}' if data_type == 'DepthUpdate' else f'sf|{symbol}': symbol for symbol in symbols}
+        self.subscribe_calls += 1
+        self.symbol_token.update(tokens)
+        self.scrips_count[channel] = list(tokens)
+
+    def unsubscribe(self, symbols, data_type, channel=11):
+        prefix = 'dp' if data_type == 'DepthUpdate' else 'sf'
+        tokens = [f'{prefix}|{symbol}' for symbol in symbols]
+        self.unsubscribed.extend(token for token in tokens if token in self.scrips_count[channel])
+
+
+def test_unsubscribe_symbols_reaches_earlier_subscribe_calls():
+    fyers = FakeSdkSocket()
+    fyers.subscribe(['A', 'B'], 'DepthUpdate')
+    fyers.subscribe(['C'], 'DepthUpdate')
+    fyers.subscribe(['A', 'B', 'C'], 'SymbolUpdate')
+
+    unsubscribe_symbols(fyers, ['A', 'C'], 'DepthUpdate')
+
+    assert fyers.unsubscribed == ['dp|A', 'dp|C']
+    # Nothing was subscribed again to get there
+    assert fyers.subscribe_calls == 3
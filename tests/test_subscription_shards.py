@@ -0,0 +1,52 @@
+import pickle
+
+from subscription_shards import ShardedDataSocket, plan_shards
+
+
+def test_symbol_types_stay_together_and_load_balances():
+    symbols = [f'NSE:S{i}-EQ' for i in range(100)]
+    plan = plan_shards({'SymbolUpdate': symbols, 'DepthUpdate': symbols[:20]}, shards=4)
+
+    assert len(plan) == 4
+    placed = {}
+    for shard in plan:
+        for data_type, shard_symbols in shard.subscriptions.items():
+            for symbol in shard_symbols:
+                placed.setdefault(symbol, set()).add(shard.index)
+    assert len(placed) == 100
+    assert all(len(indexes) == 1 for indexes in placed.values())
+    assert sum(shard.count for shard in plan) == 120
+
+    loads = [shard.load for shard in plan]
+    assert max(loads) - min(loads) <= 3.0
+
+
+def test_rates_weight_the_placement():
+    plan = plan_shards({'SymbolUpdate': ['A', 'B', 'C', 'D']}, shards=2, rates={'A': 10.0})
+
+    heavy = next(shard for shard in plan if 'A' in shard.subscriptions['SymbolUpdate'])
+    assert heavy.subscriptions['SymbolUpdate'] == ['A']
+    assert heavy.load == 10.0
+
+
+def test_shard_count_grows_to_respect_the_limit():
+    symbols = [f'S{i}' for i in range(10)]
+    plan = plan_shards({'SymbolUpdate': symbols, 'DepthUpdate': symbols}, shards=1, limit=6)
+
+    assert len(plan) == 4
+    assert all(shard.count <= 6 for shard in plan)
+    assert sum(shard.count for shard in plan) == 20
+
+
+def test_empty_subscriptions():
+    plan = plan_shards({}, shards=2)
+    assert [shard.count for shard in plan] == [0, 0]
+
+
+def test_sharded_socket_spawns_its_processes():
+    sharded = ShardedDataSocket('token', {'SymbolUpdate': ['A', 'B']}, print, shards=2)
+
+    assert sharded._context.get_start_method() == 'spawn'
+    # Everything a spawned shard process receives has to pickle
+    for shard in sharded.plan:
+        pickle.dumps((sharded.access_token, shard, sharded.socket_kwargs))
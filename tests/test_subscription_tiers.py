@@ -0,0 +1,75 @@
+from subscription_tiers import TieringPolicy
+
+SYMBOLS = [f'S{i}' for i in range(10)]
+
+
+def trade(policy, symbol, times):
+    for volume in range(times + 1):
+        policy.record({'symbol': symbol, 'vol_traded_today': volume})
+
+
+def test_hot_tier_is_seeded():
+    assert TieringPolicy(SYMBOLS, hot_size=3, interval=3600).hot == {'S0', 'S1', 'S2'}
+    assert TieringPolicy(SYMBOLS, hot_size=3, pinned=['S9'], interval=3600).hot == {'S9', 'S0', 'S1'}
+
+    policy = TieringPolicy(SYMBOLS, hot_size=3, interval=3600, seed=['S7', 'UNKNOWN', 'S5', 'S6', 'S4'])
+    assert policy.hot == {'S7', 'S5', 'S6'}
+    assert policy.subscriptions()['DepthUpdate'] == ['S5', 'S6', 'S7']
+    assert len(policy.subscriptions()['SymbolUpdate']) == 10
+
+
+def test_only_volume_increases_count_as_activity():
+    policy = TieringPolicy(SYMBOLS, interval=3600)
+    for volume in (10, 10, 12, 11, 15):
+        policy.record({'symbol': 'S1', 'vol_traded_today': volume})
+    policy.record({'symbol': 'S2', 'ltp': 5.0})
+
+    assert policy.activity['S1'] == 2
+    assert policy.activity['S2'] == 0
+
+
+def test_rebalance_promotes_active_symbols_and_reports_changes():
+    changes = []
+    policy = TieringPolicy(SYMBOLS, hot_size=2, interval=3600, hysteresis=0, on_change=lambda *change: changes.append(change))
+    trade(policy, 'S5', 3)
+    trade(policy, 'S6', 2)
+
+    promoted, demoted = policy.rebalance()
+    assert sorted(promoted) == ['S5', 'S6']
+    assert sorted(demoted) == ['S0', 'S1']
+    assert policy.hot == {'S5', 'S6'}
+    assert changes == [(promoted, demoted)]
+    assert policy.activity['S5'] == 1.5
+
+
+def test_hysteresis_keeps_symbols_near_the_boundary():
+    policy = TieringPolicy(SYMBOLS, hot_size=2, interval=3600, hysteresis=0.5, seed=['S0', 'S1'])
+    trade(policy, 'S0', 5)
+    trade(policy, 'S1', 1)
+    trade(policy, 'S2', 2)
+
+    # S2 outranks S1, but S1 is still within rank 3 and holds its slot
+    assert policy.rebalance() == ([], [])
+    assert policy.hot == {'S0', 'S1'}
+
+    # Once S1 falls beyond rank 3 its slot goes to the best ranked newcomer
+    trade(policy, 'S3', 4)
+    assert policy.rebalance() == (['S3'], ['S1'])
+    assert policy.hot == {'S0', 'S3'}
+
+
+def test_ties_go_to_the_hot_symbol():
+    policy = TieringPolicy(['A', 'B'], hot_size=1, interval=3600, hysteresis=0)
+    assert policy.rebalance() == ([], [])
+    assert policy.hot == {'A'}
+    assert policy.ranking() == ['A', 'B']
+
+
+def test_pinned_symbols_are_never_demoted():
+    policy = TieringPolicy(SYMBOLS, hot_size=2, pinned=['S9'], interval=3600, hysteresis=0)
+    trade(policy, 'S3', 4)
+
+    promoted, demoted = policy.rebalance()
+    assert promoted == ['S3']
+    assert demoted == ['S0']
+    assert policy.hot == {'S9', 'S3'}
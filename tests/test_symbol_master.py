@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from symbol_master import iter_symbol_master
+
+MASTER = {
+    'NSE:SBIN-EQ': {'fyToken': '10100000003045', 'exSymName': 'SBIN', 'minLotSize': 1},
+    'NSE:NIFTY50-INDEX': {'fyToken': '101000000026000', 'exSymName': 'NIFTY 50', 'minLotSize': 0},
+    'NSE:NIFTY24DECFUT': {'fyToken': '1011241226', 'symbolDesc': 'NIFTY "DEC" FUT', 'minLotSize': 25},
+    'NSE:TATA\\u00e9-EQ': {'fyToken': '1', 'exSymName': 'TATA {odd}', 'minLotSize': 1},
+    'NSE:NIFTY24DEC24000CE': {'fyToken': '2', 'nested': {'strike': 24000, 'tags': ['a', 'b']}, 'minLotSize': 25},
+}
+
+
+def write_master(tmp_path, text):
+    path = tmp_path / 'NSE_CM_sym_master.json'
+    path.write_text(text, encoding='utf-8')
+    return path
+
+
+def master_text():
+    # Keys written by hand so the escaped key stays escaped in the file
+    return '{' + ', '.join(f'"{key}": {json.dumps(value)}' for key, value in MASTER.items()) + '}'
+
+
+def expected_keys():
+    return [json.loads(f'"{key}"') for key in MASTER]
+
+
+@pytest.mark.parametrize('chunk_size', [7, 8, 13, 31, 64, 100, 257, 4096])
+def test_entries_split_across_chunks(tmp_path, chunk_size):
+    path = write_master(tmp_path, master_text())
+
+    assert list(iter_symbol_master(path, chunk_size=chunk_size)) == expected_keys()
+    assert list(iter_symbol_master(path, fields=('minLotSize',), chunk_size=chunk_size)) == [
+        (key, {'minLotSize': value['minLotSize']}) for key, value in zip(expected_keys(), MASTER.values())
+    ]
+
+
+def test_suffix_filter(tmp_path):
+    path = write_master(tmp_path, master_text())
+
+    assert list(iter_symbol_master(path, '-EQ', chunk_size=16)) == ['NSE:SBIN-EQ', 'NSE:TATAé-EQ']
+    assert list(iter_symbol_master(path, ('CE', 'PE', 'FUT'))) == ['NSE:NIFTY24DECFUT', 'NSE:NIFTY24DEC24000CE']
+    assert list(iter_symbol_master(path, '-INDEX', fields=('exSymName', 'missing'))) == [
+        ('NSE:NIFTY50-INDEX', {'exSymName': 'NIFTY 50', 'missing': None})
+    ]
+
+
+@pytest.mark.parametrize('chunk_size', [9, 50, 1 << 20])
+def test_missing_braces_and_trailing_comma(tmp_path, chunk_size):
+    body = master_text()[1:-1]
+    path = write_master(tmp_path, f'\n  {body},\n')
+
+    assert list(iter_symbol_master(path, chunk_size=chunk_size)) == expected_keys()
+
+
+def test_empty_master(tmp_path):
+    assert list(iter_symbol_master(write_master(tmp_path, '{}'))) == []
+    assert list(iter_symbol_master(write_master(tmp_path, ''))) == []
+
+
+def test_malformed_master_raises(tmp_path):
+    path = write_master(tmp_path, '{"NSE:SBIN-EQ": {"fyToken": "1"}, oops}')
+    with pytest.raises(ValueError):
+        list(iter_symbol_master(path, chunk_size=8))
+
+    path = write_master(tmp_path, '{"NSE:SBIN-EQ": {"fyToken": ')
+    with pytest.raises(ValueError):
+        list(iter_symbol_master(path, chunk_size=8))
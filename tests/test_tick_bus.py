@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from tick_bus import TickBus, TickBusReader
+
+SYMBOLS = ('NSE:SBIN-EQ', 'NSE:TCS-EQ')
+
+
+@pytest.fixture
+def bus():
+    bus = TickBus(SYMBOLS, name=f'test_bus_{os.getpid()}', capacity=8)
+    yield bus
+    bus.close()
+
+
+def test_round_trip(bus):
+    reader = TickBusReader(bus.shm.name)
+    assert bus.publish({'symbol': 'NSE:SBIN-EQ', 'type': 'sf', 'ltp': 612.25, 'vol_traded_today': 1200,
+                        'bid_price': None}) == 0
+    assert bus.publish({'symbol': 'NSE:INFY-EQ', 'ltp': 1.0}) is None
+
+    messages = reader.read()
+    assert messages == [{'symbol': 'NSE:SBIN-EQ', 'type': 'sf', 'ltp': 612.25, 'vol_traded_today': 1200}]
+    assert isinstance(messages[0]['vol_traded_today'], int)
+    assert reader.read() == []
+    assert bus.ignored == 1
+    reader.close()
+
+
+def test_reader_starts_at_the_head_unless_from_start(bus):
+    bus.publish({'symbol': 'NSE:SBIN-EQ', 'ltp': 1.0})
+    live = TickBusReader(bus.shm.name)
+    replay = TickBusReader(bus.shm.name, from_start=True)
+    bus.publish({'symbol': 'NSE:SBIN-EQ', 'ltp': 2.0})
+
+    assert [message['ltp'] for message in live.read()] == [2.0]
+    assert [message['ltp'] for message in replay.read()] == [1.0, 2.0]
+    live.close()
+    replay.close()
+
+
+def test_symbol_filter_and_limit(bus):
+    reader = TickBusReader(bus.shm.name, symbols=['NSE:TCS-EQ'])
+    for ltp in range(4):
+        bus.publish({'symbol': SYMBOLS[ltp % 2], 'ltp': float(ltp)})
+
+    assert [message['ltp'] for message in reader.read(limit=2)] == [1.0]
+    assert [message['ltp'] for message in reader.read()] == [3.0]
+    reader.close()
+
+
+def test_lapped_reader_counts_lost_messages(bus):
+    reader = TickBusReader(bus.shm.name)
+    for ltp in range(20):
+        bus.publish({'symbol': 'NSE:SBIN-EQ', 'ltp': float(ltp)})
+
+    messages = reader.read()
+    assert [message['ltp'] for message in messages] == [float(ltp) for ltp in range(12, 20)]
+    assert reader.lost == 12
+    reader.close()
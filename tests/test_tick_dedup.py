@@ -0,0 +1,42 @@
+import pytest
+
+from tick_dedup import DeltaFilter
+
+COLUMNS = ('ltp', 'bid_price', 'exch_feed_time', 'type')
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(Exception):
+        DeltaFilter(COLUMNS, mode='diff')
+
+
+def test_skip_drops_rows_that_repeat_the_last_one():
+    dedup = DeltaFilter(COLUMNS, mode='skip')
+
+    assert dedup.filter('A', [100.0, 99.5, 1, 'sf']) == [100.0, 99.5, 1, 'sf']
+    # Only the volatile fields or not-received fields differ
+    assert dedup.filter('A', [100.0, None, 2, 'sf']) is None
+    assert dedup.filter('A', [100.5, 99.5, 3, 'sf']) == [100.5, 99.5, 3, 'sf']
+    # Symbols are tracked separately
+    assert dedup.filter('B', [100.5, 99.5, 3, 'sf']) == [100.5, 99.5, 3, 'sf']
+    assert dedup.stats == {'rows': 4, 'written': 3, 'skipped': 1, 'fields_suppressed': 0}
+
+
+def test_delta_keeps_changed_and_volatile_fields():
+    dedup = DeltaFilter(COLUMNS, mode='delta')
+    dedup.filter('A', [100.0, 99.5, 1, 'sf'])
+
+    assert dedup.filter('A', [100.5, 99.5, 2, 'sf']) == [100.5, None, 2, 'sf']
+    assert dedup.filter('A', [100.5, 99.5, 3, 'sf']) is None
+    assert dedup.stats['fields_suppressed'] == 1
+
+
+def test_delta_writes_a_full_keyframe_every_interval():
+    dedup = DeltaFilter(COLUMNS, mode='delta', keyframe_interval=3)
+    dedup.filter('A', [100.0, 99.5, 1, 'sf'])
+
+    assert dedup.filter('A', [101.0, None, 2, 'sf']) == [101.0, None, 2, 'sf']
+    assert dedup.filter('A', [102.0, None, 3, 'sf']) == [102.0, None, 3, 'sf']
+    # The keyframe fills fields missing from this merge with the last persisted values
+    assert dedup.filter('A', [103.0, None, 4, 'sf']) == [103.0, 99.5, 4, 'sf']
+    assert dedup.filter('A', [104.0, None, 5, 'sf']) == [104.0, None, 5, 'sf']
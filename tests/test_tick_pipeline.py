@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from tick_pipeline import TickPipeline, _WorkerQueue
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        TickPipeline(lambda message: None, policy='newest')
+
+
+def test_drop_oldest_keeps_the_newest_messages():
+    queue = _WorkerQueue(2, 'drop_oldest')
+    for ltp in (1, 2, 3):
+        queue.put(('NSE:SBIN-EQ', 'sf'), {'ltp': ltp}, 0.0)
+
+    assert queue.dropped == 1
+    assert [queue.get(0)[0]['ltp'] for _ in range(2)] == [2, 3]
+    assert queue.get(0) is None
+
+
+def test_coalesce_merges_per_symbol_and_keeps_the_first_enqueue_time():
+    queue = _WorkerQueue(2, 'coalesce')
+    queue.put(('A', 'sf'), {'symbol': 'A', 'ltp': 1, 'vol_traded_today': 10}, 1.0)
+    queue.put(('B', 'sf'), {'symbol': 'B', 'ltp': 5}, 2.0)
+    queue.put(('A', 'sf'), {'symbol': 'A', 'ltp': 2}, 3.0)
+
+    assert queue.coalesced == 1
+    assert len(queue) == 2
+    assert queue.get(0) == ({'symbol': 'A', 'ltp': 2, 'vol_traded_today': 10}, 1.0)
+
+    # A third symbol evicts the oldest pending one
+    queue.put(('C', 'sf'), {'symbol': 'C', 'ltp': 7}, 4.0)
+    queue.put(('D', 'sf'), {'symbol': 'D', 'ltp': 8}, 5.0)
+    assert queue.dropped == 1
+    assert [queue.get(0)[0]['symbol'] for _ in range(2)] == ['C', 'D']
+
+
+def test_messages_of_a_symbol_are_handled_in_order():
+    handled = {}
+    lock = threading.Lock()
+
+    def handler(message):
+        with lock:
+            handled.setdefault(message['symbol'], []).append(message['ltp'])
+
+    pipeline = TickPipeline(handler, maxsize=100, workers=4)
+    for ltp in range(200):
+        for symbol in ('A', 'B', 'C'):
+            pipeline.submit({'symbol': symbol, 'type': 'sf', 'ltp': ltp})
+    pipeline.close()
+
+    assert handled == {symbol: list(range(200)) for symbol in ('A', 'B', 'C')}
+    metrics = pipeline.metrics()
+    assert metrics['processed'] == metrics['enqueued'] == 600
+    assert metrics['dropped'] == 0
+
+
+def test_handler_errors_are_counted():
+    def handler(message):
+        raise ValueError("bad row")
+
+    pipeline = TickPipeline(handler)
+    pipeline.submit({'symbol': 'A', 'type': 'sf'})
+    pipeline.close()
+
+    assert pipeline.metrics()['errors'] == 1
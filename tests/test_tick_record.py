@@ -0,0 +1,42 @@
+from tick_record import TickLayout
+
+COLUMNS = ('ltp', 'vol_traded_today', 'bid_price1', 'type')
+
+
+def test_update_maps_fields_to_their_columns():
+    record = TickLayout(COLUMNS).record('NSE:SBIN-EQ')
+    record.update({'symbol': 'NSE:SBIN-EQ', 'type': 'sf', 'ltp': 612.5, 'unknown_field': 1})
+    record.update({'type': 'dp', 'bid_price1': 612.4})
+
+    assert record.values == [612.5, None, 612.4, 'dp']
+    assert record.as_dict() == {'symbol': 'NSE:SBIN-EQ', 'ltp': 612.5, 'bid_price1': 612.4, 'type': 'dp'}
+
+
+def test_none_counts_as_missing():
+    record = TickLayout(COLUMNS).record('NSE:SBIN-EQ')
+    record.update({'ltp': 612.5, 'vol_traded_today': None})
+
+    assert 'ltp' in record
+    assert 'vol_traded_today' not in record
+    assert 'unknown_field' not in record
+    assert record.get('vol_traded_today', 0) == 0
+    assert record.get('unknown_field') is None
+    assert record.get('ltp') == 612.5
+
+    # Like dict.update(), a later None replaces the earlier value
+    record.update({'ltp': None})
+    assert 'ltp' not in record
+
+
+def test_take_hands_over_the_row_and_resets():
+    record = TickLayout(COLUMNS).record('NSE:SBIN-EQ')
+    record.update({'ltp': 612.5, 'type': 'sf'})
+
+    row = record.take()
+    assert row == [612.5, None, None, 'sf']
+    assert record.values == [None] * 4
+    assert record.as_dict() == {'symbol': 'NSE:SBIN-EQ'}
+
+    # The handed-over row is not touched by later updates
+    record.update({'ltp': 613.0})
+    assert row[0] == 612.5
@@ -0,0 +1,146 @@
+import pytest
+
+from tick_writer import BatchedTickWriter, _copy_value
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        connection = self.connection
+        connection.statements.append(sql)
+        if sql == "SAVEPOINT tick_copy":
+            connection.savepoint = len(connection.pending)
+        elif sql == "ROLLBACK TO SAVEPOINT tick_copy":
+            del connection.pending[connection.savepoint:]
+
+    def copy_expert(self, sql, buffer):
+        table_name = sql.split()[1]
+        if table_name in self.connection.broken:
+            raise Exception(f'relation "{table_name}" does not exist\n')
+        self.connection.pending.append((table_name, buffer.read().splitlines()))
+
+
+class FakeConnection:
+    def __init__(self, broken=()):
+        self.autocommit = True
+        self.broken = set(broken)
+        self.statements = []
+        self.pending = []
+        self.savepoint = 0
+        self.committed = {}
+        self.fail_commit = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        if self.fail_commit:
+            raise Exception("connection lost")
+        for table_name, lines in self.pending:
+            self.committed.setdefault(table_name, []).extend(lines)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+
+@pytest.fixture
+def make_writer():
+    writers = []
+
+    def make(connection, **kwargs):
+        kwargs.setdefault('flush_interval', 3600)
+        kwargs.setdefault('max_rows', 1000)
+        writer = BatchedTickWriter(connection, columns=('ltp', 'type'), **kwargs)
+        writers.append(writer)
+        return writer
+
+    yield make
+    for writer in writers:
+        writer._stop_event.set()
+
+
+def test_copy_value_escapes_text_format():
+    assert _copy_value(None) == '\\N'
+    assert _copy_value(1.5) == '1.5'
+    assert _copy_value('a\tb\nc\\d\r') == 'a\\tb\\nc\\\\d\\r'
+
+
+def test_flush_writes_each_table_under_a_savepoint(make_writer):
+    connection = FakeConnection()
+    writer = make_writer(connection)
+    writer.add('ticks_a', (1.0, 'sf'))
+    writer.add('ticks_b', (2.0, None))
+
+    assert writer.flush() == 2
+    assert connection.committed == {'ticks_a': ['1.0\tsf'], 'ticks_b': ['2.0\t\\N']}
+    assert connection.statements.count("SAVEPOINT tick_copy") == 2
+    assert connection.statements.count("RELEASE SAVEPOINT tick_copy") == 2
+    assert connection.autocommit is False
+
+
+def test_failing_table_does_not_drop_the_others(make_writer):
+    connection = FakeConnection(broken={'ticks_bad'})
+    writer = make_writer(connection, retry_backoff=0)
+    writer.add('ticks_good', (1.0, 'sf'))
+    writer.add('ticks_bad', (2.0, 'sf'))
+
+    assert writer.flush() == 1
+    assert connection.committed == {'ticks_good': ['1.0\tsf']}
+    assert writer._buffer == {'ticks_bad': [(2.0, 'sf')]}
+    assert writer.stats.errors == 1
+    assert writer.stats.retried_rows == 1
+
+    # Rows that arrived since go behind the retried ones
+    writer.add('ticks_bad', (3.0, 'sf'))
+    connection.broken.clear()
+    assert writer.flush() == 2
+    assert connection.committed['ticks_bad'] == ['2.0\tsf', '3.0\tsf']
+    assert writer._attempts == {}
+
+
+def test_failed_table_waits_for_its_backoff(make_writer):
+    connection = FakeConnection(broken={'ticks_bad'})
+    writer = make_writer(connection, retry_backoff=3600)
+    writer.add('ticks_bad', (1.0, 'sf'))
+    writer.flush()
+    connection.broken.clear()
+
+    assert writer.flush() == 0
+    assert writer._buffered_rows == 1
+
+    # close() does not wait for the backoff
+    writer.close()
+    assert connection.committed == {'ticks_bad': ['1.0\tsf']}
+
+
+def test_rows_are_dropped_after_max_retries(make_writer):
+    connection = FakeConnection(broken={'ticks_bad'})
+    writer = make_writer(connection, max_retries=2, retry_backoff=0)
+    writer.add('ticks_bad', (1.0, 'sf'))
+    for _ in range(3):
+        writer.flush()
+
+    assert writer._buffered_rows == 0
+    assert writer.stats.retried_rows == 2
+    assert writer.stats.dropped_rows == 1
+
+
+def test_failed_commit_requeues_every_table(make_writer):
+    connection = FakeConnection()
+    connection.fail_commit = True
+    writer = make_writer(connection, retry_backoff=0)
+    writer.add('ticks_a', (1.0, 'sf'))
+    writer.add('ticks_b', (2.0, 'sf'))
+
+    assert writer.flush() == 0
+    assert set(writer._buffer) == {'ticks_a', 'ticks_b'}
+    assert writer._buffered_rows == 2
@@ -0,0 +1,189 @@
+import json
+import struct
+import time
+from multiprocessing import shared_memory
+
+from snapshot_store import SNAPSHOT_COLUMNS, attach_shared_memory
+
+DEFAULT_BUS_NAME = 'fyers_ticks'
+
+# Columns stored as BIGINT/INTEGER in the tick tables; everything travels as float64
+# (exact for these values) and is converted back to int when read
+INT_COLUMNS = frozenset(
+    ['vol_traded_today', 'last_traded_time', 'exch_feed_time', 'bid_size', 'ask_size',
+     'last_traded_qty', 'tot_buy_qty', 'tot_sell_qty']
+    + [f'{side}_{field}{level}' for side in ('bid', 'ask') for field in ('size', 'order') for level in range(1, 6)]
+)
+
+# head (next sequence number), capacity, length of the JSON layout that follows
+_HEADER = struct.Struct('<QQQ')
+_STAMP = struct.Struct('<Q')
+
+
+def _slot_struct(columns):
+    # stamp, symbol index, message type, field presence mask, one float64 per column
+    return struct.Struct('<QI4sQ' + 'd' * len(columns))
+
+
+class TickBus:
+    """
+    Single-writer ring buffer of decoded ticks in shared memory.
+
+    The feed handler process owns the websocket and publish()es every
+    message into a fixed-size slot (symbol index, type, a presence mask
+    and one float64 per column), numbered by a global sequence. Any
+    number of local processes open a TickBusReader on the same name and
+    read from their own position, so consumers share one socket and its
+    subscriptions without re-parsing anything.
+
+    The writer never waits for readers: a reader that falls more than
+    capacity messages behind skips ahead and counts the overwritten
+    messages as lost. Each slot carries a stamp (sequence + 1, zero
+    while being written), which a reader checks before and after copying
+    the slot to detect torn or overwritten reads.
+    """
+
+    def __init__(self, symbols, name=DEFAULT_BUS_NAME, capacity=65536, columns=SNAPSHOT_COLUMNS):
+        self.symbols = tuple(symbols)
+        self.columns = tuple(columns)
+        self.capacity = capacity
+        self.symbol_index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.column_index = {column: i for i, column in enumerate(self.columns)}
+        if len(self.columns) > 64:
+            raise Exception("A tick bus slot can carry at most 64 columns")
+        self.slot = _slot_struct(self.columns)
+
+        layout = json.dumps({'symbols': self.symbols, 'columns': self.columns}).encode()
+        self.data_offset = _align(_HEADER.size + len(layout))
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=True, size=self.data_offset + capacity * self.slot.size
+        )
+        self.shm.buf[_HEADER.size:_HEADER.size + len(layout)] = layout
+        _HEADER.pack_into(self.shm.buf, 0, 0, capacity, len(layout))
+
+        self.head = 0
+        self.published = 0
+        self.ignored = 0
+        self._empty = [0.0] * len(self.columns)
+
+    def publish(self, message):
+        """Append a websocket message; returns its sequence number, or None for unknown symbols"""
+        symbol = self.symbol_index.get(message.get('symbol'))
+        if symbol is None:
+            self.ignored += 1
+            return None
+
+        values = self._empty[:]
+        mask = 0
+        column_index = self.column_index
+        for field, value in message.items():
+            position = column_index.get(field)
+            if position is not None and value is not None:
+                values[position] = value
+                mask |= 1 << position
+
+        seq = self.head
+        buf = self.shm.buf
+        offset = self.data_offset + (seq % self.capacity) * self.slot.size
+        _STAMP.pack_into(buf, offset, 0)
+        self.slot.pack_into(
+            buf, offset, 0, symbol, str(message.get('type') or '').encode()[:4], mask, *values
+        )
+        _STAMP.pack_into(buf, offset, seq + 1)
+        self.head = seq + 1
+        _STAMP.pack_into(buf, 0, self.head)
+        self.published += 1
+        return seq
+
+    def close(self):
+        """Detach and remove the shared memory block"""
+        self.shm.close()
+        self.shm.unlink()
+
+
+class TickBusReader:
+    """
+    Reader side of a TickBus, opened by name from any local process.
+
+    read() returns the messages published since the previous call as
+    dicts shaped like the websocket's (symbol, type and the fields that
+    were present). With symbols, messages for other symbols are skipped
+    before they are decoded. A new reader starts at the live head unless
+    from_start is set.
+    """
+
+    def __init__(self, name=DEFAULT_BUS_NAME, symbols=None, from_start=False):
+        self.shm = attach_shared_memory(name)
+        head, self.capacity, layout_size = _HEADER.unpack_from(self.shm.buf, 0)
+        layout = json.loads(bytes(self.shm.buf[_HEADER.size:_HEADER.size + layout_size]))
+        self.symbols = layout['symbols']
+        self.columns = layout['columns']
+        self.slot = _slot_struct(self.columns)
+        self.data_offset = _align(_HEADER.size + layout_size)
+        self.is_int = [column in INT_COLUMNS for column in self.columns]
+
+        self.wanted = None
+        if symbols is not None:
+            wanted = set(symbols)
+            self.wanted = {i for i, symbol in enumerate(self.symbols) if symbol in wanted}
+
+        self.next_seq = max(0, head - self.capacity) if from_start else head
+        self.received = 0
+        self.lost = 0
+
+    def read(self, limit=None):
+        """Messages published since the last read (at most limit)"""
+        buf = self.shm.buf
+        head = _STAMP.unpack_from(buf, 0)[0]
+        if head - self.next_seq > self.capacity:
+            self.lost += head - self.capacity - self.next_seq
+            self.next_seq = head - self.capacity
+        if limit is not None:
+            head = min(head, self.next_seq + limit)
+
+        messages = []
+        slot_size = self.slot.size
+        while self.next_seq < head:
+            seq = self.next_seq
+            self.next_seq += 1
+            offset = self.data_offset + (seq % self.capacity) * slot_size
+            fields = self.slot.unpack_from(buf, offset)
+            if fields[0] != seq + 1 or _STAMP.unpack_from(buf, offset)[0] != seq + 1:
+                # Overwritten by the writer lapping this reader
+                self.lost += 1
+                continue
+            if self.wanted is not None and fields[1] not in self.wanted:
+                continue
+            messages.append(self._decode(fields))
+        self.received += len(messages)
+        return messages
+
+    def messages(self, poll_interval=0.001):
+        """Yield messages as they are published, polling the head every poll_interval seconds"""
+        while True:
+            batch = self.read()
+            if not batch:
+                time.sleep(poll_interval)
+                continue
+            yield from batch
+
+    def _decode(self, fields):
+        _, symbol, message_type, mask = fields[:4]
+        message = {'symbol': self.symbols[symbol], 'type': message_type.rstrip(b'\0').decode()}
+        columns = self.columns
+        is_int = self.is_int
+        position = 0
+        while mask:
+            if mask & 1:
+                value = fields[4 + position]
+                message[columns[position]] = int(value) if is_int[position] else value
+            mask >>= 1
+            position += 1
+        return message
+
+    def close(self):
+        self.shm.close()
+
+
+def _align(size, alignment=8):
+    return (size + alignment - 1) // alignment * alignment
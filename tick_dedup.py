@@ -0,0 +1,72 @@
+DEDUP_MODES = ('skip', 'delta')
+
+# Fields that change on every message without carrying market information
+VOLATILE_COLUMNS = ('exch_feed_time', 'type')
+
+
+class DeltaFilter:
+    """
+    Drop or thin tick rows that repeat the last row persisted for a symbol.
+
+    Rows are lists in columns order, as produced by TickRecord.take().
+    A field differs when it holds a value (None means not received in
+    this merge) that is not equal to the last persisted one; the
+    VOLATILE_COLUMNS are ignored in the comparison.
+
+        skip   a row with no differing field is not written; any other
+               row is written in full
+        delta  a row with no differing field is not written; any other
+               row keeps only the differing fields plus the volatile
+               ones, with NULL meaning "unchanged since the previous
+               row". Every keyframe_interval-th row per symbol (and the
+               first) is written in full, so a reader never has to look
+               back further than that to rebuild a full snapshot.
+    """
+
+    def __init__(self, columns, mode='skip', ignore=VOLATILE_COLUMNS, keyframe_interval=100):
+        if mode not in DEDUP_MODES:
+            raise Exception(f"Unknown dedup mode: {mode}")
+        self.columns = tuple(columns)
+        self.mode = mode
+        self.keyframe_interval = keyframe_interval
+        self.compared = [i for i, column in enumerate(self.columns) if column not in ignore]
+        self.kept = [i for i, column in enumerate(self.columns) if column in ignore]
+
+        self._last = {}
+        self._since_keyframe = {}
+        self.stats = {'rows': 0, 'written': 0, 'skipped': 0, 'fields_suppressed': 0}
+
+    def filter(self, symbol, row):
+        """Return the row to write for symbol, or None if it carries nothing new"""
+        self.stats['rows'] += 1
+        last = self._last.get(symbol)
+        if last is None:
+            self._last[symbol] = list(row)
+            self._since_keyframe[symbol] = 0
+            self.stats['written'] += 1
+            return row
+
+        changed = [i for i in self.compared if row[i] is not None and row[i] != last[i]]
+        if not changed:
+            self.stats['skipped'] += 1
+            return None
+
+        for i in changed:
+            last[i] = row[i]
+        self.stats['written'] += 1
+        if self.mode == 'skip':
+            return row
+
+        since_keyframe = self._since_keyframe[symbol] + 1
+        if since_keyframe >= self.keyframe_interval:
+            self._since_keyframe[symbol] = 0
+            return [value if value is not None else last[i] for i, value in enumerate(row)]
+        self._since_keyframe[symbol] = since_keyframe
+
+        delta = [None] * len(row)
+        for i in changed:
+            delta[i] = row[i]
+        for i in self.kept:
+            delta[i] = row[i]
+        self.stats['fields_suppressed'] += len(self.compared) - len(changed)
+        return delta
@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+
+BACKPRESSURE_POLICIES = ('block', 'drop_oldest', 'coalesce')
+
+
+class _WorkerQueue:
+    """Bounded FIFO for one writer worker, aware of the backpressure policy"""
+
+    def __init__(self, maxsize, policy):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.items = deque()
+        self.pending = OrderedDict()  # (symbol, type) -> [message, enqueued_at] in coalesce mode
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self.pending) if self.policy == 'coalesce' else len(self.items)
+
+    def put(self, key, message, enqueued_at):
+        with self.condition:
+            if self.policy == 'coalesce':
+                entry = self.pending.get(key)
+                if entry is not None:
+                    # Keep the oldest enqueue time so lag reflects how stale the symbol is
+                    entry[0].update(message)
+                    self.coalesced += 1
+                    return
+                if len(self.pending) >= self.maxsize:
+                    self.pending.popitem(last=False)
+                    self.dropped += 1
+                self.pending[key] = [dict(message), enqueued_at]
+            else:
+                if self.policy == 'block':
+                    while len(self.items) >= self.maxsize:
+                        self.condition.wait()
+                elif len(self.items) >= self.maxsize:
+                    self.items.popleft()
+                    self.dropped += 1
+                self.items.append((message, enqueued_at))
+            self.condition.notify_all()
+
+    def get(self, timeout):
+        """Return (message, enqueued_at) or None if nothing arrived within timeout"""
+        with self.condition:
+            if not len(self):
+                self.condition.wait(timeout)
+                if not len(self):
+                    return None
+            if self.policy == 'coalesce':
+                _, (message, enqueued_at) = self.pending.popitem(last=False)
+            else:
+                message, enqueued_at = self.items.popleft()
+            self.condition.notify_all()
+            return message, enqueued_at
+
+
+class TickPipeline:
+    """
+    Decouple the websocket receive callback from the database writes.
+
+    submit() is called from the FyersDataSocket callback and only places the
+    message on a bounded queue. Writer threads drain the queues and call
+    handler(message). Messages are sharded across workers by symbol, so ticks
+    for one symbol are always handled in order by the same worker.
+
+    Backpressure policies when a worker queue is full:
+        block        wait until the worker catches up
+        drop_oldest  discard the oldest queued message
+        coalesce     keep one pending message per (symbol, type), merging
+                     newer fields into it; the oldest symbol is dropped
+                     if the number of pending symbols exceeds maxsize
+    """
+
+    def __init__(self, handler, maxsize=10000, policy='block', workers=1,
+                 report_interval=None, logger=None):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy '{policy}', expected one of {BACKPRESSURE_POLICIES}")
+
+        self.handler = handler
+        self.policy = policy
+        self.logger = logger or logging.getLogger(__name__)
+        self.queues = [
+            _WorkerQueue(max(1, maxsize // workers), policy)
+            for _ in range(workers)
+        ]
+
+        self.enqueued = 0
+        self.processed = 0
+        self.errors = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._lag_total = 0.0
+        self._metrics_lock = threading.Lock()
+
+        self._stop_event = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._run_worker, args=(queue,), daemon=True, name=f"tick-writer-{i}")
+            for i, queue in enumerate(self.queues)
+        ]
+        if report_interval:
+            self._threads.append(
+                threading.Thread(target=self._report, args=(report_interval,), daemon=True, name="tick-pipeline-metrics")
+            )
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, message):
+        """Queue a websocket message; safe to call from the receive callback"""
+        symbol = message.get('symbol', '')
+        key = (symbol, message.get('type'))
+        queue = self.queues[zlib.crc32(symbol.encode()) % len(self.queues)] if len(self.queues) > 1 else self.queues[0]
+        queue.put(key, message, time.monotonic())
+        self.enqueued += 1
+
+    def metrics(self):
+        """Return queue depth, drop/coalesce counters and handler lag in milliseconds"""
+        with self._metrics_lock:
+            processed = self.processed
+            return {
+                'policy': self.policy,
+                'queue_depth': sum(len(queue) for queue in self.queues),
+                'queue_depths': [len(queue) for queue in self.queues],
+                'enqueued': self.enqueued,
+                'processed': processed,
+                'dropped': sum(queue.dropped for queue in self.queues),
+                'coalesced': sum(queue.coalesced for queue in self.queues),
+                'errors': self.errors,
+                'last_lag_ms': round(self.last_lag * 1000, 3),
+                'max_lag_ms': round(self.max_lag * 1000, 3),
+                'avg_lag_ms': round(self._lag_total / processed * 1000, 3) if processed else 0.0
+            }
+
+    def close(self, timeout=10):
+        """Let the workers drain the queues, then stop them"""
+        deadline = time.monotonic() + timeout
+        while any(len(queue) for queue in self.queues) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout=1)
+
+    def _run_worker(self, queue):
+        while not self._stop_event.is_set():
+            item = queue.get(timeout=0.5)
+            if item is None:
+                continue
+            message, enqueued_at = item
+            try:
+                self.handler(message)
+            except Exception as e:
+                self.errors += 1
+                self.logger.error(f"Error handling message for {message.get('symbol')}: {str(e)}")
+
+            lag = time.monotonic() - enqueued_at
+            with self._metrics_lock:
+                self.processed += 1
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+                self._lag_total += lag
+
+    def _report(self, interval):
+        while not self._stop_event.wait(interval):
+            self.logger.info(f"Tick pipeline metrics: {self.metrics()}")
@@ -0,0 +1,69 @@
+class TickLayout:
+    """Fixed column order for tick records, with a field -> position map"""
+
+    __slots__ = ('columns', 'index', 'width')
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        self.index = {column: position for position, column in enumerate(self.columns)}
+        self.width = len(self.columns)
+
+    def record(self, symbol):
+        return TickRecord(self, symbol)
+
+
+class TickRecord:
+    """
+    Latest merged quote and depth fields for one symbol, in layout order.
+
+    Replaces the per-symbol dict that every sf/dp message was update()d
+    into and that was later read back with one get() per column. Message
+    fields are assigned straight to their column position (fields outside
+    the layout are ignored), and take() hands the filled list to the writer
+    as the row itself, with no per-column lookups or copy, and starts an
+    empty one.
+
+    A field counts as present once it holds a value other than None, so
+    `field in record` and record.get() behave like they did on the dict.
+    """
+
+    __slots__ = ('layout', 'symbol', 'values')
+
+    def __init__(self, layout, symbol):
+        self.layout = layout
+        self.symbol = symbol
+        self.values = [None] * layout.width
+
+    def update(self, message):
+        index = self.layout.index
+        values = self.values
+        for field, value in message.items():
+            position = index.get(field)
+            if position is not None:
+                values[position] = value
+
+    def take(self):
+        """Return the row (a list in layout order) and reset the record"""
+        row = self.values
+        self.values = [None] * self.layout.width
+        return row
+
+    def get(self, field, default=None):
+        position = self.layout.index.get(field)
+        if position is None or self.values[position] is None:
+            return default
+        return self.values[position]
+
+    def __contains__(self, field):
+        position = self.layout.index.get(field)
+        return position is not None and self.values[position] is not None
+
+    def as_dict(self):
+        fields = {'symbol': self.symbol}
+        fields.update(
+            (column, value) for column, value in zip(self.layout.columns, self.values) if value is not None
+        )
+        return fields
+
+    def __repr__(self):
+        return f"TickRecord({self.as_dict()})"
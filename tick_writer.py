@@ -0,0 +1,229 @@
+import io
+import logging
+import threading
+import time
+
+# Column order shared by the per-symbol tick tables and the batched writer
+TICK_COLUMNS = (
+    'ltp', 'vol_traded_today', 'last_traded_time', 'exch_feed_time',
+    'bid_size', 'ask_size', 'bid_price', 'ask_price', 'last_traded_qty',
+    'tot_buy_qty', 'tot_sell_qty', 'avg_trade_price', 'low_price',
+    'high_price', 'lower_ckt', 'upper_ckt', 'open_price', 'prev_close_price',
+    'ch', 'chp',
+    'bid_price1', 'bid_price2', 'bid_price3', 'bid_price4', 'bid_price5',
+    'ask_price1', 'ask_price2', 'ask_price3', 'ask_price4', 'ask_price5',
+    'bid_size1', 'bid_size2', 'bid_size3', 'bid_size4', 'bid_size5',
+    'ask_size1', 'ask_size2', 'ask_size3', 'ask_size4', 'ask_size5',
+    'bid_order1', 'bid_order2', 'bid_order3', 'bid_order4', 'bid_order5',
+    'ask_order1', 'ask_order2', 'ask_order3', 'ask_order4', 'ask_order5',
+    'type'
+)
+
+
+def _copy_value(value):
+    """Format a single value for COPY ... (FORMAT text)"""
+    if value is None:
+        return '\\N'
+    text = str(value)
+    if '\\' in text or '\t' in text or '\n' in text or '\r' in text:
+        text = (
+            text
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r')
+        )
+    return text
+
+
+class FlushStats:
+    """Running statistics for the flushes done by a BatchedTickWriter"""
+
+    def __init__(self):
+        self.flushes = 0
+        self.rows = 0
+        self.total_seconds = 0.0
+        self.last_rows = 0
+        self.last_seconds = 0.0
+        self.max_seconds = 0.0
+        self.errors = 0
+        self.retried_rows = 0
+        self.dropped_rows = 0
+
+    def record(self, rows, seconds):
+        self.flushes += 1
+        self.rows += rows
+        self.total_seconds += seconds
+        self.last_rows = rows
+        self.last_seconds = seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.total_seconds if self.total_seconds else 0.0
+
+    def as_dict(self):
+        return {
+            'flushes': self.flushes,
+            'rows': self.rows,
+            'errors': self.errors,
+            'retried_rows': self.retried_rows,
+            'dropped_rows': self.dropped_rows,
+            'last_rows': self.last_rows,
+            'last_latency_ms': round(self.last_seconds * 1000, 3),
+            'max_latency_ms': round(self.max_seconds * 1000, 3),
+            'avg_latency_ms': round(self.total_seconds / self.flushes * 1000, 3) if self.flushes else 0.0,
+            'rows_per_sec': round(self.rows_per_second, 1)
+        }
+
+
+class BatchedTickWriter:
+    """
+    Buffer tick rows in memory and write them to PostgreSQL with COPY FROM STDIN.
+
+    Rows are grouped by target table. A flush is triggered when the buffer
+    holds max_rows rows or when flush_interval seconds have passed since the
+    last flush, whichever comes first. Each flush runs in a single transaction
+    on a dedicated connection and its latency and throughput are recorded.
+
+    Every table is copied under its own savepoint, so a table that fails
+    does not cost the others their rows. The failed table's rows go back to
+    the head of its buffer and are retried after retry_backoff seconds,
+    doubling per attempt; after max_retries failed attempts they are dropped.
+    """
+
+    def __init__(self, connection, columns=TICK_COLUMNS, max_rows=5000,
+                 flush_interval=1.0, max_retries=3, retry_backoff=1.0, logger=None):
+        self.connection = connection
+        self.connection.autocommit = False
+        self.columns = tuple(columns)
+        self.column_list = ', '.join(self.columns)
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.logger = logger or logging.getLogger(__name__)
+        self.stats = FlushStats()
+
+        self._buffer = {}
+        self._buffered_rows = 0
+        self._attempts = {}  # table_name -> failed flushes in a row
+        self._retry_at = {}  # table_name -> monotonic time before which it is not flushed again
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._timer = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._timer.start()
+
+    def add(self, table_name, row):
+        """Queue one row (a sequence matching self.columns) for table_name"""
+        with self._buffer_lock:
+            self._buffer.setdefault(table_name, []).append(row)
+            self._buffered_rows += 1
+            should_flush = self._buffered_rows >= self.max_rows
+
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered rows that are not waiting for a retry; returns the number of rows written"""
+        with self._flush_lock:
+            with self._buffer_lock:
+                now = time.monotonic()
+                batch = {
+                    table_name: table_rows for table_name, table_rows in self._buffer.items()
+                    if self._retry_at.get(table_name, 0) <= now
+                }
+                for table_name in batch:
+                    del self._buffer[table_name]
+                rows = sum(len(table_rows) for table_rows in batch.values())
+                self._buffered_rows -= rows
+
+            if not rows:
+                return 0
+
+            start = time.perf_counter()
+            failed = {}
+            try:
+                with self.connection.cursor() as cursor:
+                    for table_name, table_rows in batch.items():
+                        cursor.execute("SAVEPOINT tick_copy")
+                        try:
+                            cursor.copy_expert(
+                                f"COPY {table_name} ({self.column_list}) FROM STDIN",
+                                self._to_copy_buffer(table_rows)
+                            )
+                        except Exception as e:
+                            cursor.execute("ROLLBACK TO SAVEPOINT tick_copy")
+                            failed[table_name] = str(e).strip()
+                            continue
+                        cursor.execute("RELEASE SAVEPOINT tick_copy")
+                self.connection.commit()
+            except Exception as e:
+                try:
+                    self.connection.rollback()
+                except Exception:
+                    pass
+                failed = dict.fromkeys(batch, str(e).strip())
+
+            if failed:
+                self.stats.errors += 1
+                self._requeue({table_name: batch[table_name] for table_name in failed}, failed)
+            written = {table_name: table_rows for table_name, table_rows in batch.items() if table_name not in failed}
+            with self._buffer_lock:
+                for table_name in written:
+                    self._attempts.pop(table_name, None)
+                    self._retry_at.pop(table_name, None)
+            rows = sum(len(table_rows) for table_rows in written.values())
+            if not rows:
+                return 0
+
+            self.stats.record(rows, time.perf_counter() - start)
+            self.logger.info(
+                f"Flushed {rows} rows to {len(written)} tables in "
+                f"{self.stats.last_seconds * 1000:.1f} ms "
+                f"({rows / self.stats.last_seconds if self.stats.last_seconds else 0:.0f} rows/sec)"
+            )
+            return rows
+
+    def _requeue(self, batch, errors):
+        """Put failed tables' rows back ahead of newer ones, or drop them once out of retries"""
+        with self._buffer_lock:
+            now = time.monotonic()
+            for table_name, table_rows in batch.items():
+                attempts = self._attempts.get(table_name, 0) + 1
+                if attempts > self.max_retries:
+                    self._attempts.pop(table_name, None)
+                    self._retry_at.pop(table_name, None)
+                    self.stats.dropped_rows += len(table_rows)
+                    self.logger.error(f"Dropping {len(table_rows)} rows for {table_name} after "
+                                       f"{attempts} failed flushes: {errors[table_name]}")
+                    continue
+                self._attempts[table_name] = attempts
+                self._retry_at[table_name] = now + self.retry_backoff * 2 ** (attempts - 1)
+                self._buffer[table_name] = table_rows + self._buffer.get(table_name, [])
+                self._buffered_rows += len(table_rows)
+                self.stats.retried_rows += len(table_rows)
+                self.logger.warning(f"Flush of {len(table_rows)} rows for {table_name} failed, "
+                                     f"retrying ({attempts}/{self.max_retries}): {errors[table_name]}")
+
+    def close(self):
+        """Stop the flush timer and write whatever is still buffered, pending retries included"""
+        self._stop_event.set()
+        self._timer.join(timeout=self.flush_interval + 1)
+        with self._buffer_lock:
+            self._retry_at.clear()
+        self.flush()
+
+    def _flush_periodically(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def _to_copy_buffer(self, rows):
+        buffer = io.StringIO()
+        buffer.writelines(
+            '\t'.join(_copy_value(value) for value in row) + '\n'
+            for row in rows
+        )
+        buffer.seek(0)
+        return buffer